@@ -45,9 +45,19 @@ $PYSCRIPT/buildGEO.py -p $POINT $OUTFILE.geo
 # Points in Surface XY CSV >> Lines in Surface GEO #
 $PYSCRIPT/buildGEO.py -l $LINES $OUTFILE.geo
 
+# Optional: ElementSizes SHP >> Background mesh (POS) instead of -i mode #
+#$PYSCRIPT/SHP2GEO.py -p $SIZESMAP ./.Tsize.csv
+#$PYSCRIPT/buildGEO.py -s ./.Tsize.csv $OUTFILE.geo
+
+# Optional: DEM slope and curvature >> Background mesh (POS), instead of -s #
+#$PYSCRIPT/DEM2GEO.py ./DEM.tif $OUTFILE.geo --min 2 --max 50 --dz 0.05 --drop 1
+
 #Mesh generation with GMSH
 $GMSHBIN -2 $OUTFILE.geo
 
+#Alternative: mesh in memory with the gmsh python module (no GEO/MSH files)
+#$PYSCRIPT/buildMSH.py $BOUND $OUTFILE.t3s --points $POINT --lines $LINES
+
 #GMSH Mesh to T3S
 $PYSCRIPT/MSH2T3S.py $OUTFILE.msh $OUTFILE.t3s --both $DEMTERRA $FRICTION
 
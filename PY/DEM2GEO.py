@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+#
+#////////////////////////////////////////////////////////////////////////
+#                                                                       #
+#                                 DEM2GEO.py                            #
+#                                                                       #
+#////////////////////////////////////////////////////////////////////////
+#
+# Author:     Edwin
+#
+# Works on:   python3
+#
+# Purpose:    Script takes in a DEM (GeoTIFF) and derives element sizes from
+#             its slope and curvature, so the mesh is refined only where the
+#             terrain needs it. The sizes are written as a gmsh POS view
+#             and appended as background mesh to a GEO file built with
+#             buildGEO.py. Optionally, they are also mapped on the vertices
+#             of a boundary CSV from SHP2GEO.py as the "Rx_m" field, the same
+#             field the -i mode of SHP2GEO.py writes.
+#
+# Needs:      Python3, sys, os, numpy, scipy, osgeo.gdal
+#
+# Usage:      python3 DEM2GEO.py <dem.tif> <output.geo> --min <m> --max <m>
+#                 [--dz <m>] [--drop <m>] [--cells <n>]
+#                 [--boundary <boundary.csv>] [--trace <trace.json>]
+#
+# where:
+# --> dem.tif   : DEM raster. It is read in strips, so it may be larger than
+#                 the memory.
+#
+# --> output.geo: GEO file where the background mesh is appended. The view
+#                 is written as <output>_dem.pos. gmsh takes only one
+#                 background mesh, so do not use it with buildGEO.py -s.
+#
+# --> --min, --max: element sizes are clamped to [min, max]
+#
+# --> --dz      : largest vertical error (m) of the linear interpolation of
+#                 the DEM on a triangle, h = sqrt(8 dz / curvature).
+#
+# --> --drop    : largest elevation change (m) across an element,
+#                 h = drop / slope. At least one of --dz or --drop is needed.
+#
+# --> --cells   : largest number of cells of the size grid, the DEM pixels
+#                 are grouped in blocks taking their minimum size (1e6).
+#
+# --> --boundary: CSV (or NPZ) file of SHP2GEO.py -p or -i. Its "Rx_m" field
+#                 is set to the smallest of the DEM size at each vertex and
+#                 "Rx_m" (the size map of SHP2GEO.py -i) or, without it, "R_m".
+#
+#////////////////////////////////////////////////////////////////////////
+
+import sys, os
+import numpy as np
+
+#import own functions
+import prof, gets
+prof.enable(gets.popOption(sys.argv,"--trace",True))
+import fily, build, rast
+
+#Optional flags are taken out before reading the positional arguments
+rMin = gets.popOption(sys.argv,"--min",True)
+rMax = gets.popOption(sys.argv,"--max",True)
+dz = gets.popOption(sys.argv,"--dz",True)
+drop = gets.popOption(sys.argv,"--drop",True)
+maxCells = int(float(gets.popOption(sys.argv,"--cells",True,default=1000000)))
+pathToBoundary = gets.popOption(sys.argv,"--boundary",True)
+
+if rMin is None or rMax is None or (dz is None and drop is None):
+    print("Usage: DEM2GEO.py <dem.tif> <output.geo> --min <m> --max <m> [--dz <m>] [--drop <m>]")
+    sys.exit("Bye!")
+
+#Retrieve path of files from the arguments passed to the script
+pathToDEM = str(sys.argv[1])                #DEM  input file
+pathToGEOFile = str(sys.argv[2])            #GEO output file
+
+#Element sizes from slope and curvature
+sizes, geoT = rast.demSizes(pathToDEM,float(rMin),float(rMax), \
+    None if dz is None else float(dz),None if drop is None else float(drop),maxCells)
+
+#Write the sizes as a POS view. Rows of the POS grid go upwards
+nRows, nCols = sizes.shape
+rows, cols = np.indices(sizes.shape)
+origin = (geoT[0], geoT[3] + nRows*geoT[5])
+pathToPOSFile = os.path.splitext(pathToGEOFile)[0] + "_dem.pos"
+fily.resetFile(pathToPOSFile,"T3S")
+fily.appendFile(build.buildPOSView((abs(geoT[1]),abs(geoT[5])),origin, \
+    (nRows-1-rows).ravel(),cols.ravel(),sizes.ravel(),"DEMSizes"),pathToPOSFile)
+
+# Background mesh from the last merged view
+GEO_Background = ["Merge \"" + os.path.basename(pathToPOSFile) + "\";",\
+    "Background Mesh View[PostProcessing.NbViews-1];"]
+fily.appendFile(GEO_Background,pathToGEOFile)
+fily.appendFile(["\n","/**********************************/"],pathToGEOFile)
+fily.appendFile("//END OF BLOCK//\n\n\n",pathToGEOFile,True)
+print("DEM sizes ~OK~: " + str(pathToDEM) + " > " + str(pathToPOSFile) + \
+    " (" + str(nRows*nCols) + " cells, " + str(round(float(sizes.min()),3)) + \
+    " to " + str(round(float(sizes.max()),3)) + " m)")
+
+#Sizes on the boundary vertices, as SHP2GEO.py -i does with polygons
+if pathToBoundary is not None:
+    names = gets.getFieldNames(pathToBoundary)
+    columns = [gets.getField(pathToBoundary,name) for name in names]
+    table = dict(zip(names,columns))
+    demR = rast.gridValues(np.array(table["X_m"],dtype=np.float64), \
+        np.array(table["Y_m"],dtype=np.float64),sizes,geoT)
+    oldR = table["Rx_m"] if "Rx_m" in names else table["R_m"]
+    table["Rx_m"] = np.fmin(np.array(oldR,dtype=np.float64),demR).tolist()
+    if "Rx_m" not in names:
+        names.append("Rx_m")
+    fily.writeTable(pathToBoundary,names,[table[name] for name in names])
+    print("DEM sizes on boundary ~OK~: " + str(pathToBoundary))
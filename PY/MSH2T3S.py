@@ -16,18 +16,32 @@
 #
 # Purpose:    Script takes in a MSH (v.2) file generated on gmsh and 
 #             produces a t3s mesh file (MSH) recognized by BlueKenue(C). 
+#             Binary MSH files (v.2 and v.4.1) and ASCII v.4.1 files are
+#             also read, the format is taken from $MeshFormat. The work
+#             is done by prep.mshToT3S, which also takes the nodes and
+#             triangles as arrays and returns the attributes of the nodes.
 #
-# Needs:      Python3, csv, sys, os, shutil
+# Needs:      Python3, csv, sys, os, shutil, numpy, scipy, osgeo.gdal (or
+#             tiff.py with --native)
 #
 # Usage:      python3 MSH2T3S.py <input.msh> <output.t3s> <option> 
-#                 <raster_1.tif> [<raster_2.tif>]
+#                 <raster_1.tif> [<raster_2.tif>] [--zonal] [--idw <k>]
+#                 [--workers <n>] [--parts <n>] [--crs <crs>] [--native]
+#                 [--memory <MB>] [--reuse <previous.t3s>] [--quantum <d>]
+#                 [--trace <trace.json>]
 #
 # where:
 # --> input.msh : a string that defines the path to MSH file from where 
-#                 the gmsh mesh is to be read.
+#                 the gmsh mesh is to be read. It may be compressed (.gz or
+#                 .zst), it is then uncompressed in memory.
 #
 # --> output.t3s: a string that defines the path to the T3S file where 
-#                 the BlueKenue mesh will be written.                       
+#                 the BlueKenue mesh will be written. If it ends with .gz
+#                 or .zst, it is written compressed (gzip or zstd) in blocks
+#                 compressed in parallel. If nodes without data were filled
+#                 from their neighbours (or with --reuse), they are listed
+#                 by attribute in <output>.filled.npz, read by a later
+#                 --reuse of this T3S file.
 #
 # --> option    : a string that defines which spatial values have to be 
 #                 retrieved from a raster TIFF file 
@@ -42,167 +56,151 @@
 #
 #     --> --none: Sampling node data is not performed and a dummy value is 
 #                 given on the T3S
+#
+# --> --zonal   : (optional) BOTTOM is the average of all the DEM pixels 
+#                 inside the dual cell of each node instead of the value of
+#                 the pixel under the node. Useful when elements are much 
+#                 larger than the DEM pixels. GeoTIFF overviews are used 
+#                 for coarse elements.
+#
+# --> --idw <k> : (optional) nodes falling on nodata pixels or outside the
+#                 raster are filled by inverse distance weighting of the k
+#                 nearest valid nodes. By default (k = 1) the value of the
+#                 nearest valid node is copied.
+#
+# --> --workers : (optional) number of processes used to parse ASCII MSH
+#                 files. All the CPU cores are used by default.
+#
+# --> --parts <n>: (optional) the mesh is split into n subdomains of the
+#                 same number of elements, ordered along a Hilbert curve.
+#                 A PARTITION attribute is added to the nodes and the
+#                 elements and nodes of each subdomain are written to
+#                 <output>_part<p>.elems and <output>_part<p>.nodes
+#
+# --> --crs     : (optional) CRS of the mesh, as a .prj file or a definition
+#                 such as EPSG:3116. By default the .prj file next to the
+#                 MSH file is used. The nodes are transformed to the CRS of
+#                 each raster (in one batch, once per CRS) before sampling.
+#                 Without a mesh CRS the nodes are taken as they are. The
+#                 CRS is written next to the T3S file as a .prj file.
+#
+# --> --native  : (optional) GeoTIFF rasters are read with tiff.py instead
+#                 of QGIS and GDAL, so neither is needed nor started. Only
+#                 the strips or tiles under the nodes are decoded. The
+#                 friction must then be given as a GeoTIFF, not as a SHP.
+#
+# --> --memory  : (optional) out-of-core mode for meshes larger than the
+#                 memory. ASCII v2 files are parsed into arrays mapped from
+#                 ../.Temp/ooc (binary files are always mapped), rasters are
+#                 sampled natively into mapped columns, and every stage
+#                 (parse, sample, fill, write) takes at most about <MB>
+#                 megabytes of rows at a time. Needs --native. The nearest
+#                 valid nodes used to fill nodata, --zonal and --parts still
+#                 hold their arrays in memory.
+#
+# --> --reuse   : (optional) T3S file of a previous mesh of the same domain,
+#                 e.g. before a size map was tweaked or a breakline added.
+#                 Nodes on the same coordinates take its BOTTOM and BOTTOM
+#                 FRICTION, only new or moved nodes are sampled from the
+#                 rasters and polygons. The share of reused nodes is
+#                 printed. With --zonal, BOTTOM is always computed again.
+#                 Nodes filled from their neighbours in the previous mesh
+#                 are sampled again; they are read from <previous>.filled.npz
+#                 (see output.t3s). Without that file, no node of the
+#                 previous mesh is taken as filled.
+#
+# --> --quantum : (optional) coordinates are matched with --reuse after
+#                 rounding them to multiples of <d> (1e-6 by default, in
+#                 the units of the mesh).
+#
+# --> --trace   : (optional) time and memory of each stage are appended as 
+#                 JSON to <trace.json>. See prof.py
 #  
 # --> raster.tif: a string that defines the path to TIF file from where the
-#                 attributes are to be read. 
+#                 attributes are to be read. For BOTTOM, it may also be a
+#                 comma separated list of rasters (a.tif,b.tif,...) sorted
+#                 by priority, e.g. a channel survey, then LiDAR tiles,
+#                 then a regional DEM. Each node takes the value of the
+#                 first raster that has data under it, without building a
+#                 merged raster first. Not with --zonal.
 #                 
 # Bibliography & Useful links:
 # -- https://github.com/pprodano/pputils
 # -- http://gmsh.info/doc/texinfo/gmsh.html#MSH-file-format-version-2-_0028Legacy_0029
+# -- http://gmsh.info/doc/texinfo/gmsh.html#MSH-file-format
 #
 #////////////////////////////////////////////////////////////////////////
 
 import csv, sys, os, re, shutil
-import fily, gis, gets, build               #import own functions 
+import numpy as np
+import prof, gets
+
+#Instrumentation is switched on before QGIS starts to time its start up
+prof.enable(gets.popOption(sys.argv,"--trace",True))
+
+#QGIS is only started when rasters are not read natively (--native)
+nativeMode = gets.popOption(sys.argv,"--native",default=False)
+
+import fily, part, prep    #import own functions 
+
 #////////////////////////////////////////////////////////////////////////
 
 #Clean temporal files
 fily.touchFolder("../.Temp")
 
+#Optional flags are taken out before reading the positional arguments
+zonalMode = gets.popOption(sys.argv,"--zonal",default=False)
+kNearest  = int(gets.popOption(sys.argv,"--idw",True,default=1))
+nWorkers  = gets.popOption(sys.argv,"--workers",True)
+nParts    = gets.popOption(sys.argv,"--parts",True)
+memoryBudget = gets.popOption(sys.argv,"--memory",True)
+pathToReference = gets.popOption(sys.argv,"--reuse",True)
+quantum   = float(gets.popOption(sys.argv,"--quantum",True,default=1e-6))
+crsOption = gets.popOption(sys.argv,"--crs",True,\
+    default=os.path.splitext(fily.plainName(sys.argv[1]))[0] + ".prj")
+
 ####################################################################
 
 #Retrieve path of files from the arguments passed to the script
 pathToMSHFile = str(sys.argv[1])            #MSH  input file 
 pathToT3SFile = str(sys.argv[2])            #T3S output file
 
-#Create a new empty T3S File
-fily.resetFile(pathToT3SFile,"T3S")
-
-#Read MSH file and organize it as a list
-Raw_MSH = fily.parseFile(pathToMSHFile)
-
-#Extract Nodes from the MSH File
-startNodes = gets.getLineIndex(Raw_MSH,"$Nodes")      
-endNodes   = gets.getLineIndex(Raw_MSH,"$EndNodes")   
-Nodes_MSH  = Raw_MSH[startNodes+2:endNodes]
-
-#Extract Coordinates of the extracted list of nodes
-manyNodes  = int(Raw_MSH[startNodes+1])
-xCoord_MSH = gets.getColumnContents(Nodes_MSH,2)
-yCoord_MSH = gets.getColumnContents(Nodes_MSH,3)
-
-#Save a temporal CSV file with the X,Y coordinates
-csvFilePath = "../.Temp/CSV.csv"
-fily.resetFile(csvFilePath,"T3S")
-XYcsvFile   = build.buildCSV_2Col(xCoord_MSH,yCoord_MSH)
-fily.appendFile(XYcsvFile,csvFilePath,False)
-
 ### Retrieves SHP Conversor Mode
 #### -bott | BOTTOM                     : Elevation Model
 #### -fric | BOTTOM FRICTION            : Raster Friction
 #### -both | BOTTOM & BOTTOM FRICTION   : Both Rasters
 #### -none | NONE                       : No Attribute
 execMode = str(sys.argv[3]).lower()
+pathToDEMFile = None                        #TIF  input file
+pathToFRIFile = None                        #SHP  input file
 
 if execMode in ["--bott"]:
-    pathToTIFFile = str(sys.argv[4])            #TIF  input file
-
-    #Sample the raster onto the mesh nodes saved on the temporal CSV
-    sampledRasterFile = "../.Temp/SampledBottom.csv"
-    gis.sampleRaster(csvFilePath,pathToTIFFile,sampledRasterFile)
-
-    #Get BOTTOM data column from a DEM
-    zBottom = gets.getCommaFile(sampledRasterFile,col=2)
-    zBottom = zBottom[1:]
-    
-    nAttribute = ["1"]
-    whichAttri = ["BOTTOM"]
-
-if execMode in ["--fric"]:
-    pathToFRIFile = str(sys.argv[4])            #TIF  input file
-
-    #Rasterize the friction polygon SHP to avoid repeated values
-    rasterizedFrictionFile = "../.Temp/SampledFriction.tif"
-    gis.rasterPoly(pathToFRIFile,rasterizedFrictionFile,"FRICTION")
-    
-    #Sample the raster onto the mesh nodes saved on the temporal CSV
-    sampledFrictionFile = "../.Temp/SampledFriction.csv"
-    gis.sampleRaster(csvFilePath,rasterizedFrictionFile,sampledFrictionFile)
-    
-    #Get BOTTOM FRICTION data column from a SHP Polygon
-    fBottom = gets.getCommaFile(sampledFrictionFile,col=2)
-    zBottom = fBottom[1:]
-    
-    #Keywords for the T3S header
-    nAttribute = ["1"]
-    whichAttri = ["BOTTOM FRICTION"]
-
+    pathToDEMFile = str(sys.argv[4])
+elif execMode in ["--fric"]:
+    pathToFRIFile = str(sys.argv[4])
 elif execMode in ["--both"]:
-    pathToDEMFile = str(sys.argv[4])            #TIF  input file
-    pathToFRIFile = str(sys.argv[5])            #SHP  input file
-
-    #Sample the raster onto the mesh nodes saved on the temporal CSV
-    sampledRasterFile = "../.Temp/SampledBottom.csv"
-    gis.sampleRaster(csvFilePath,pathToDEMFile,sampledRasterFile)
-
-    #Get BOTTOM data column from a sampled file
-    zBottom = gets.getCommaFile(sampledRasterFile,col=2)
-    zBottom = zBottom[1:]
-
-    #Rasterize the friction polygon SHP to avoid repeated values
-    rasterizedFrictionFile = "../.Temp/SampledFriction.tif"
-    gis.rasterPoly(pathToFRIFile,rasterizedFrictionFile,"FRICTION")
-    
-    #Sample the raster onto the mesh nodes saved on the temporal CSV
-    sampledFrictionFile = "../.Temp/SampledFriction.csv"
-    gis.sampleRaster(csvFilePath,rasterizedFrictionFile,sampledFrictionFile)
-    
-    #Get BOTTOM FRICTION data column from a SHP Polygon
-    fBottom = gets.getCommaFile(sampledFrictionFile,col=2)
-    fBottom = fBottom[1:]
-
-    #Merge BOTTOM and BOTTOM FRICTION
-    zfValue = []
-    try:
-        for i in range(len(fBottom)):
-            zfValue.append(str(zBottom[i]) + " " + str(fBottom[i]))
-        zBottom = zfValue
-    except IndexError:
-        "Frction Map has overlying features. Mesh nodes with multiple BOTTOM FRICTION values :("
-
-    #Keywords for the T3S header
-    nAttribute = ["1","2"]
-    whichAttri = ["BOTTOM","BOTTOM FRICTION"]
-
-elif execMode in ["--none",""]:  
-    #Insert a dummy BOTTOM value
-    zBottom = ["0"]*len(xCoord_MSH)
-
-    #Build T3S Node List
-    Nodes_T3S  = build.buildT3S_3Col(xCoord_MSH,yCoord_MSH,zBottom)
-
-    #Keywords for the T3S header
-    nAttribute = "1"
-    whichAttri = "NONE"
-
-
-#Extract Elements from the MSH File
-startElements = gets.getLineIndex(Raw_MSH,"$Elements")
-endElements   = gets.getLineIndex(Raw_MSH,"$EndElements")
-Elements_MSH  = Raw_MSH[startElements+2:endElements]
-
-#Extract only 2d Triangles from the MSH elements
-Triangles_MSH = gets.filterMSHElement(Elements_MSH,2)
-
-#Extract only the structure of elements from the list
-manyElements   = int(len(Triangles_MSH))
-p1Elements_MSH = gets.getColumnContents(Triangles_MSH,6)
-p2Elements_MSH = gets.getColumnContents(Triangles_MSH,7)
-p3Elements_MSH = gets.getColumnContents(Triangles_MSH,8)
-
-#Build T3S Node List
-Nodes_T3S  = build.buildT3S_3Col(xCoord_MSH,yCoord_MSH,zBottom)
-
-#Build T3S Element List
-Elements_T3S  = build.buildT3S_3Col(p1Elements_MSH,p2Elements_MSH,p3Elements_MSH)
-
-#Build T3S Header
-Header_T3S  = build.buildT3S_Header(manyNodes,manyElements,nAttribute,whichAttri)
-
-#Write T3S Files
-fily.appendFile(Header_T3S,pathToT3SFile,True)       #Header1
-fily.appendFile(Nodes_T3S,pathToT3SFile)             #Nodes
-fily.appendFile(Elements_T3S,pathToT3SFile)          #Triangles
+    pathToDEMFile = str(sys.argv[4])
+    pathToFRIFile = str(sys.argv[5])
+elif execMode not in ["--none",""]:
+    print("Unrecognized parameter:  " + str(sys.argv[3]))
+    sys.exit("Bye!")
+
+#Read the mesh, sample BOTTOM and BOTTOM FRICTION on its nodes and fill
+#   the nodes without data. See prep.mshToT3S
+mesh = prep.mshToT3S(pathToMSHFile,bottom=pathToDEMFile,friction=pathToFRIFile,\
+    zonal=zonalMode,idw=kNearest,parts=nParts,crs=crsOption,native=nativeMode,\
+    memory=memoryBudget,workers=nWorkers,reference=pathToReference,quantum=quantum)
+
+#Elements and nodes of each subdomain
+if nParts is not None:
+    partFiles = part.writePartitions(os.path.splitext(pathToT3SFile)[0],\
+        mesh["triangles"],mesh["elementPart"],int(nParts))
+    print("Partitions ~OK~: " + str(nParts) + " subdomains, " + \
+        str(int(np.count_nonzero(mesh["interface"]))) + " interface nodes > " + \
+        os.path.basename(partFiles[0]) + " ...")
+
+#Write T3S File and the CRS of the mesh
+prep.writeT3S(pathToT3SFile,mesh)
 
 print("MSH2T3S ~OK~: " + str(sys.argv[1]) + " > " + str(sys.argv[2]))
 
@@ -17,11 +17,13 @@
 # Purpose:    Script takes in a group of ESRI vector files (SHP) of a 
 #             geometry and produces a geometry file (CSV) used by the 
 #             buildGEO.py  program to generate a geometry file (GEO) used 
-#             by gmsh.
+#             by gmsh. In a long running process, prep.extractBoundary
+#             returns the same vertices as arrays, with no file written.
 #
-# Needs:      Python3, sys, os, shutil, qgis.bin
+# Needs:      Python3, sys, os, shutil, numpy, qgis.bin
 #
 # Usage:      python3 buildGEO.py <mode> <input.shp> <optional.shp> <output.csv>
+#                 [--simplify <factor>] [--trace <trace.json>]
 #
 # where:
 # --> mode: a string that defines how the script will behave according 
@@ -58,7 +60,17 @@
 #                which the geometry will be taken.
 #
 # --> output.csv: a string that defines the path to the CSV file where the 
-#                 geometrical entities will be written                       
+#                 geometrical entities will be written. If it ends with .npz
+#                 a binary table with typed columns is written instead.
+#                 The .prj file (CRS) of input.shp is copied next to it.
+#
+# --> --simplify: (optional) in the p, i and l modes, the rings and lines are
+#                 simplified (Douglas-Peucker) with a tolerance of <factor>
+#                 times the element size of each vertex, and vertices closer
+#                 than that to the previous one are dropped. e.g. 0.25
+#
+# --> --trace   : (optional) time and memory of each stage are appended as 
+#                 JSON to <trace.json>. See prof.py
 #
 # Bibliography & Useful links:
 # -- https://gis.stackexchange.com/questions/279874/using-qgis3-processing-algorithms-from-standalone-pyqgis-scripts-outside-of-gui
@@ -68,38 +80,17 @@
 #////////////////////////////////////////////////////////////////////////
 
 import sys, os, shutil
-from pathlib import Path
-
-#Import Qgis 
-from qgis.core import *
-from qgis.processing import *
-from qgis.utils import *
-from qgis.analysis import *
-from PyQt5.QtCore import QVariant
 
-#import own functions 
-import fily, gis, gets, build
+#Instrumentation is switched on before QGIS starts to time its start up
+import prof, gets
+prof.enable(gets.popOption(sys.argv,"--trace",True))
+simplifyFactor = gets.popOption(sys.argv,"--simplify",True)
 
-##  Start QGIS  ##
-QgsApplication.setPrefixPath('/usr', True)
-QgsApplication.processingRegistry().addProvider(QgsNativeAlgorithms())
-qgs = QgsApplication([], True)
-qgs.initQgis()
-
-#Add plugins and processing algorithms
-sys.path.append('/usr/share/qgis/python/plugins/')  #Path to QGIS installation
-import processing
-from processing.core.Processing import Processing
-
-#Add native functions
-Processing.initialize()
-qgs.processingRegistry().addProvider(QgsNativeAlgorithms())
+#import own functions. QGIS is started by gis.py, imported by prep.py
+import fily, prep
 
 ####################################################################
 
-#Start QGIS Project
-project = QgsProject.instance()
-
 #Clean temporal files
 fily.touchFolder("../.Temp")
 
@@ -111,61 +102,28 @@ fily.touchFolder("../.Temp")
 execMode = str(sys.argv[1]).lower()
 
 if   execMode in ["-p","--polygon"]:
-    path2Polygon = str(sys.argv[2])                        #Outline Polygon SHP << INPUT
-    path2Line = "../.Temp/1.OutlineLine.shp"               #Outline Line SHP path
-    path2Vertex = "../.Temp/2.OutlineVertex.shp"           #Outline Vertices SHP path
-    path2VertexXY = str(sys.argv[3])                       #Output CSV + XY Coordinates >> OUTPUT
-
-    fily.touchFile(path2Line)
-    fily.touchFile(path2Vertex)
-    fily.touchFile(path2VertexXY)
-
-    gis.polyToLine(path2Polygon,path2Line)              #SHP Polygon   >> SHP Lines
-    gis.lineToVertex(path2Line,path2Vertex)             #SHP Lines     >> SHP Vertices
-    gis.vertexToXYCSV(path2Vertex,path2VertexXY)        #SHP Vertices  >> CVS XY Vertices
+    #SHP Polygon >> SHP Lines >> SHP Vertices >> CSV XY Vertices
+    prep.shpToTable(sys.argv[2],sys.argv[3],"polygon",None,simplifyFactor)
     print("SHP2GEO polygon ~OK~:  " + str(sys.argv[2]) + " > " + str(sys.argv[3]))
 
 elif execMode in ["-i","--heteropolygon"]:
-    path2Polygon = str(sys.argv[2])                        #Outline Polygon SHP << INPUT
-    path2SizeMap = str(sys.argv[3])                        #Outline Polygon SHP << INPUT
-    path2Line = "../.Temp/1.OutlineLine.shp"               #Outline Line SHP path
-    path2Vertex = "../.Temp/2.OutlineVertex.shp"           #Outline Vertices SHP path
-    path2UnionV = "../.Temp/3.VertexMapped.shp"            #Outline Vertices SHP path
-    path2VertexXY = str(sys.argv[4])                       #Output CSV + XY Coordinates >> OUTPUT
-
-    print("\n\n1.1. Polygon to Lines")
-    gis.polyToLine(path2Polygon,path2Line)                     #SHP Polygon   >> SHP Lines
-    print("\n\n1.2. Lines to Vertices")
-    gis.lineToVertex(path2Line,path2Vertex)                    #SHP Lines     >> SHP Vertices
-    print("\n\n1.3. Map element sizes on Vertices")
-    gis.mapElementSizes(path2Vertex,path2SizeMap,path2UnionV)  #SHP Vertices  >> SHP Mapped Vertices
-    print("\n\n1.4. Save XY-Vertices")
-    gis.vertexToXYCSV(path2UnionV,path2VertexXY)               #SHP Mapped V  >> CVS XY Vertices
-    print("\n\n1.5. SHP2GEO iPolygon ~OK~:  " + str(sys.argv[2]) + \
+    #SHP Polygon >> SHP Lines >> SHP Vertices >> SHP Mapped Vertices >> CSV XY Vertices
+    prep.shpToTable(sys.argv[2],sys.argv[4],"heteropolygon",sys.argv[3],simplifyFactor)
+    print("SHP2GEO iPolygon ~OK~:  " + str(sys.argv[2]) + \
         " + " + str(sys.argv[3]) + "> " + str(sys.argv[4]))
 
 elif execMode in ["-l","--line"]:
-    path2Line = str(sys.argv[2])                           #Outline Line SHP path
-    path2Vertex = "../.Temp/2.OutlineVertex.shp"           #Outline Vertices SHP path
-    path2VertexXY = str(sys.argv[3])                       #Output CSV + XY Coordinates >> OUTPUT
-
-    print("\n\n1.1. Lines to Vertices")
-    gis.lineToVertex(path2Line,path2Vertex)             #SHP Lines     >> SHP Vertices
-    print("\n\n1.2. Save XY-Vertices")
-    gis.vertexToXYCSV(path2Vertex,path2VertexXY)        #SHP Vertices  >> CVS XY Vertices
-    print("\n\n1.3. SHP2GEO Lines ~OK~:  " + str(sys.argv[2]) + " > " + str(sys.argv[3]))
+    #SHP Lines >> SHP Vertices >> CSV XY Vertices
+    prep.shpToTable(sys.argv[2],sys.argv[3],"line",None,simplifyFactor)
+    print("SHP2GEO Lines ~OK~:  " + str(sys.argv[2]) + " > " + str(sys.argv[3]))
 
 elif execMode in ["-v","--vertices"]:
-    path2Vertex = str(sys.argv[2])                         #Outline Vertices SHP path
-    path2VertexXY = str(sys.argv[3])                       #Output CSV + XY Coordinates >> OUTPUT
-
-    print("\n\n1.1. Save XY-Vertices")
-    gis.vertexToXYCSV(path2Vertex,path2VertexXY)        #SHP Vertices  >> CVS XY Vertices
-    print("\n\n1.2. SHP2GEO Vertices ~OK~:  " + str(sys.argv[2]) + " > " + str(sys.argv[3])) 
+    #SHP Vertices >> CSV XY Vertices
+    prep.shpToTable(sys.argv[2],sys.argv[3],"vertices")
+    print("SHP2GEO Vertices ~OK~:  " + str(sys.argv[2]) + " > " + str(sys.argv[3])) 
 
 else:
     print("Unrecognized parameter:  " + str(sys.argv[1]))
 
 #Delete temporal folder
 shutil.rmtree("../.Temp", ignore_errors=True)
-
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+#
+#////////////////////////////////////////////////////////////////////////
+#                                                                       #
+#                                benchmark.py                           #
+#                                                                       #
+#////////////////////////////////////////////////////////////////////////
+#
+# Author:     Edwin
+#
+# Works on:   python3
+#
+# Purpose:    Script generates synthetic inputs of several sizes (boundary
+#             polygons with holes and mapped element sizes, hard points,
+#             hard lines, gmsh MSH meshes and GeoTIFF DEMs) and runs them
+#             through the stages of the preprocessing. Throughput, wall
+#             time and peak memory of each stage are recorded and compared
+#             against a stored baseline.
+#
+# Needs:      Python3, numpy, sys, os, json, subprocess
+#
+# Usage:      python3 benchmark.py [--scales 1e4,1e5,1e6] [--work <dir>]
+#                 [--baseline <baseline.json>] [--save <results.json>]
+#                 [--tolerance 0.25] [--stages <stage1,stage2>] [--repeat 5]
+#
+# where:
+# --> --scales   : number of mesh nodes of each synthetic case, from 1e4
+#                  up to 1e7. The boundary gets scale/10 vertices, the hard
+#                  points scale/100 and the hard lines scale/20 vertices.
+#
+# --> --work     : folder where the synthetic inputs are written. A
+#                  temporal folder is used (and removed) by default.
+#
+# --> --baseline : results of a previous run. Stages whose throughput drops
+#                  more than the tolerance are reported and the script
+#                  exits with an error. Stages that take less than 0.2 s
+#                  in both runs are too noisy for that: their drops are
+#                  only printed as warnings.
+#
+# --> --save     : path to the JSON file where the results are written.
+#                  Stages that could not run here (skipped) are left out,
+#                  so they are not stored as a baseline.
+#
+# --> --stages   : only run these stages. Stages are buildGEO.boundary,
+#                  buildGEO.points, buildGEO.lines, MSH2T3S.parse,
+#                  rast.zonal (MSH2T3S.py --zonal), rast.points (the point
+#                  sampling of MSH2T3S.py --native, with tiff.py) and
+#                  T3S.write (prep.writeT3S with BOTTOM and BOTTOM
+#                  FRICTION). The sampling through QGIS (MSH2T3S.py without
+#                  --native) is not covered.
+#
+# --> --repeat   : times each stage is run. The median wall time of the
+#                  runs is kept and compared (5).
+#
+# Each stage runs on a fresh python process so its peak RSS is not mixed
+# with the one of the other stages. The RSS of the python interpreter and 
+# numpy (about 30 MB) is included on the peak.
+#
+#////////////////////////////////////////////////////////////////////////
+
+import sys, os, json, time, shutil, struct, subprocess, tempfile, runpy
+import numpy as np
+import prof, gets
+
+scriptFolder = os.path.dirname(os.path.abspath(__file__))
+
+###   Shortest wall time (s) of a stage, in the baseline or in this run,
+###     for a drop of its throughput to be taken as a regression. Drops of
+###     shorter stages are only warnings
+minCompareWall = 0.2
+
+allStages = ["buildGEO.boundary","buildGEO.points","buildGEO.lines",\
+    "MSH2T3S.parse","rast.zonal","rast.points","T3S.write"]
+
+###   Writes the vertices of a polygon with holes as the CSV written by
+###     SHP2GEO.py -i (both R_m and the mapped Rx_m fields)
+def makeBoundaryCSV(pathToFile, nVertex, nHoles = 4):
+    nHole = max(nVertex // (4*max(nHoles,1)), 3)
+    nOuter = max(nVertex - nHoles*nHole, 3)
+    rings = [(0.0, 0.0, 1000.0, nOuter)]
+    for h in range(nHoles):
+        angle = 2.0*np.pi*h/nHoles
+        rings.append((500.0*np.cos(angle), 500.0*np.sin(angle), 100.0, nHole))
+
+    with open(pathToFile,"w") as outFile:
+        outFile.write("R_m,vertex_ind,vertex_par,Rx_m,X_m,Y_m\n")
+        index = 0
+        for part, (x0, y0, radius, n) in enumerate(rings):
+            angle = 2.0*np.pi*np.arange(n)/n
+            X = x0 + radius*np.cos(angle)
+            Y = y0 + radius*np.sin(angle)
+            R = np.full(n, 50.0)
+            Rx = np.where(X > 0.0, 10.0, 50.0)    #A size map on half the domain
+            I = np.arange(index, index+n)
+            rows = np.column_stack((R, I, np.full(n, part), Rx, X, Y))
+            np.savetxt(outFile, rows, delimiter=",", fmt=["%.1f","%d","%d","%.1f","%.3f","%.3f"])
+            index += n
+
+###   Writes random hard points inside the domain as SHP2GEO.py -v does
+def makePointsCSV(pathToFile, nPoints, seed = 1):
+    rng = np.random.default_rng(seed)
+    radius = 300.0*np.sqrt(rng.random(nPoints))
+    angle = 2.0*np.pi*rng.random(nPoints)
+    rows = np.column_stack((np.full(nPoints,5.0), radius*np.cos(angle), radius*np.sin(angle)))
+    with open(pathToFile,"w") as outFile:
+        outFile.write("R_m,X_m,Y_m\n")
+        np.savetxt(outFile, rows, delimiter=",", fmt=["%.1f","%.3f","%.3f"])
+
+###   Writes hard lines of ten vertices as SHP2GEO.py -l does
+def makeLinesCSV(pathToFile, nVertex, perLine = 10, seed = 2):
+    rng = np.random.default_rng(seed)
+    nLines = max(nVertex // perLine, 1)
+    x0 = rng.uniform(-300.0, 300.0, nLines)
+    y0 = rng.uniform(-300.0, 300.0, nLines)
+    step = np.arange(perLine) * 1.0
+    X = (x0[:,None] + step[None,:]).ravel()
+    Y = (y0[:,None] + 0.5*step[None,:]).ravel()
+    DN = np.repeat(np.arange(1, nLines+1), perLine)
+    I = np.tile(np.arange(perLine), nLines)
+    rows = np.column_stack((DN, np.full(len(X),5.0), I, np.zeros(len(X)), X, Y))
+    with open(pathToFile,"w") as outFile:
+        outFile.write("DN,R_m,vertex_ind,vertex_par,X_m,Y_m\n")
+        np.savetxt(outFile, rows, delimiter=",", fmt=["%d","%.1f","%d","%d","%.3f","%.3f"])
+
+###   Writes a structured triangular mesh of about nNodes nodes as an
+###     ASCII MSH v2 file with the same layout gmsh uses: a few boundary
+###     line elements followed by the triangles
+def makeMSH(pathToFile, nNodes, size = 2000.0):
+    nx = max(int(np.sqrt(nNodes)), 2)
+    ny = max(nNodes // nx, 2)
+    x = np.linspace(-size/2.0, size/2.0, nx)
+    y = np.linspace(-size/2.0, size/2.0, ny)
+    X, Y = np.meshgrid(x, y)
+    ids = np.arange(1, nx*ny+1).reshape(ny, nx)
+    a = ids[:-1,:-1].ravel(); b = ids[:-1,1:].ravel()
+    c = ids[1:,1:].ravel();   d = ids[1:,:-1].ravel()
+    tri = np.vstack((np.column_stack((a,b,c)), np.column_stack((a,c,d))))
+    edge = np.column_stack((ids[0,:-1], ids[0,1:]))
+    nEdge = len(edge)
+
+    chunk = 500000
+    with open(pathToFile,"w") as outFile:
+        outFile.write("$MeshFormat\n2.2 0 8\n$EndMeshFormat\n$Nodes\n")
+        outFile.write(str(nx*ny) + "\n")
+        nodes = np.column_stack((ids.ravel(), X.ravel(), Y.ravel(), np.zeros(nx*ny)))
+        for i in range(0, len(nodes), chunk):
+            np.savetxt(outFile, nodes[i:i+chunk], fmt=["%d","%.3f","%.3f","%d"])
+        outFile.write("$EndNodes\n$Elements\n")
+        outFile.write(str(nEdge + len(tri)) + "\n")
+        lines = np.column_stack((np.arange(1,nEdge+1), np.ones(nEdge,int), \
+            np.full(nEdge,2), np.ones(nEdge,int), np.ones(nEdge,int), edge))
+        np.savetxt(outFile, lines, fmt="%d")
+        for i in range(0, len(tri), chunk):
+            part = tri[i:i+chunk]
+            n = len(part)
+            rows = np.column_stack((np.arange(nEdge+i+1, nEdge+i+n+1), np.full(n,2), \
+                np.full(n,2), np.full(n,1), np.full(n,1), part))
+            np.savetxt(outFile, rows, fmt="%d")
+        outFile.write("$EndElements\n")
+    return nx*ny, len(tri)
+
+###   Writes a single band Float32 GeoTIFF, uncompressed and in strips,
+###     with the pixel scale and tie point tags
+def makeGeoTIFF(pathToFile, values, x0, y0, pixel, noData = -9999.0):
+    values = np.ascontiguousarray(values, dtype="<f4")
+    nRows, nCols = values.shape
+    rowsPerStrip = max(1, 65536 // (4*nCols))
+    nStrips = (nRows + rowsPerStrip - 1) // rowsPerStrip
+    noDataText = (repr(float(noData)) + "\0").encode("ascii")
+
+    #Tags: (tag, type, count, value or bytes)
+    entries = 14
+    ifdSize = 2 + 12*entries + 4
+    dataStart = 8 + ifdSize
+    stripOffsetsAt = dataStart
+    stripCountsAt = stripOffsetsAt + 4*nStrips
+    scaleAt = stripCountsAt + 4*nStrips
+    tieAt = scaleAt + 24
+    geoKeysAt = tieAt + 48
+    geoKeys = [1,1,0,2, 1024,0,1,1, 1025,0,1,1]
+    noDataAt = geoKeysAt + 2*len(geoKeys)
+    pixelsAt = noDataAt + len(noDataText)
+    pixelsAt += pixelsAt % 2
+
+    stripBytes = [4*nCols*min(rowsPerStrip, nRows - s*rowsPerStrip) for s in range(nStrips)]
+    stripOffsets = [pixelsAt + 4*nCols*rowsPerStrip*s for s in range(nStrips)]
+
+    def entry(tag, kind, count, value):
+        if kind == 3 and count == 1:
+            return struct.pack("<HHIHH", tag, kind, count, value, 0)
+        return struct.pack("<HHII", tag, kind, count, value)
+
+    with open(pathToFile,"wb") as outFile:
+        outFile.write(b"II*\0" + struct.pack("<I", 8))
+        outFile.write(struct.pack("<H", entries))
+        outFile.write(entry(256, 4, 1, nCols))
+        outFile.write(entry(257, 4, 1, nRows))
+        outFile.write(entry(258, 3, 1, 32))
+        outFile.write(entry(259, 3, 1, 1))
+        outFile.write(entry(262, 3, 1, 1))
+        outFile.write(entry(273, 4, nStrips, stripOffsetsAt if nStrips > 1 else stripOffsets[0]))
+        outFile.write(entry(277, 3, 1, 1))
+        outFile.write(entry(278, 4, 1, rowsPerStrip))
+        outFile.write(entry(279, 4, nStrips, stripCountsAt if nStrips > 1 else stripBytes[0]))
+        outFile.write(entry(339, 3, 1, 3))
+        outFile.write(entry(33550, 12, 3, scaleAt))
+        outFile.write(entry(33922, 12, 6, tieAt))
+        outFile.write(entry(34735, 3, len(geoKeys), geoKeysAt))
+        outFile.write(entry(42113, 2, len(noDataText), noDataAt))
+        outFile.write(struct.pack("<I", 0))
+        outFile.write(struct.pack("<%dI" % nStrips, *stripOffsets))
+        outFile.write(struct.pack("<%dI" % nStrips, *stripBytes))
+        outFile.write(struct.pack("<3d", pixel, pixel, 0.0))
+        outFile.write(struct.pack("<6d", 0.0, 0.0, 0.0, x0, y0, 0.0))
+        outFile.write(struct.pack("<%dH" % len(geoKeys), *geoKeys))
+        outFile.write(noDataText)
+        outFile.write(b"\0" * (pixelsAt - outFile.tell()))
+        outFile.write(values.tobytes())
+
+###   A smooth synthetic DEM covering the synthetic mesh with a nodata hole
+def makeDEM(pathToFile, nNodes, size = 2000.0):
+    nPixels = int(min(max(4*nNodes, 250000), 64000000))
+    n = int(np.sqrt(nPixels))
+    pixel = (size + 100.0) / n
+    x0 = y0 = -(size + 100.0) / 2.0
+    x = x0 + pixel*(np.arange(n) + 0.5)
+    y = -y0 - pixel*(np.arange(n) + 0.5)
+    values = (np.sin(x/150.0)[None,:] * np.cos(y/90.0)[:,None] * 5.0).astype(np.float32)
+    values[n//3:n//3+n//50, n//3:n//3+n//50] = -9999.0
+    makeGeoTIFF(pathToFile, values, x0, -y0, pixel)
+
+###   Generates every synthetic input of a case
+def makeCase(folder, nNodes):
+    os.makedirs(folder, exist_ok=True)
+    makeBoundaryCSV(os.path.join(folder,"boundary.csv"), max(nNodes//10, 20))
+    makePointsCSV(os.path.join(folder,"points.csv"), max(nNodes//100, 2))
+    makeLinesCSV(os.path.join(folder,"lines.csv"), max(nNodes//20, 20))
+    makeMSH(os.path.join(folder,"mesh.msh"), nNodes)
+    makeDEM(os.path.join(folder,"dem.tif"), nNodes)
+
+###   Runs a script as if called from the shell but in this process
+def runScript(name, argList):
+    sys.argv = [name] + list(argList)
+    runpy.run_path(os.path.join(scriptFolder, name), run_name="__main__")
+
+###   Runs one stage on the inputs of a case and returns the number of
+###     items processed (points, vertices or nodes)
+def runStage(stageName, folder):
+    import fily, build
+    geoFile = os.path.join(folder,"bench.geo")
+    mshFile = os.path.join(folder,"mesh.msh")
+
+    if stageName == "buildGEO.boundary":
+        runScript("buildGEO.py", ["-b", os.path.join(folder,"boundary.csv"), geoFile])
+        return sum(1 for line in open(os.path.join(folder,"boundary.csv"))) - 1
+
+    elif stageName == "buildGEO.points":
+        if not os.path.exists(geoFile):
+            fily.resetFile(geoFile,"GEO")
+        runScript("buildGEO.py", ["-p", os.path.join(folder,"points.csv"), geoFile])
+        return sum(1 for line in open(os.path.join(folder,"points.csv"))) - 1
+
+    elif stageName == "buildGEO.lines":
+        if not os.path.exists(geoFile):
+            fily.resetFile(geoFile,"GEO")
+        runScript("buildGEO.py", ["-l", os.path.join(folder,"lines.csv"), geoFile])
+        return sum(1 for line in open(os.path.join(folder,"lines.csv"))) - 1
+
+    elif stageName == "MSH2T3S.parse":
+        #Same call as MSH2T3S.py
+        import msh
+        X, Y, triangles = msh.readMSH(mshFile)
+        return len(X)
+
+    elif stageName == "rast.zonal":
+        import rast
+        X, Y, P = readSyntheticMesh(mshFile)
+        zonal = rast.zonalMean(X,Y,P[:,0],P[:,1],P[:,2],os.path.join(folder,"dem.tif"))
+        filled = rast.fillNodata(X,Y,zonal)
+        return len(X)
+
+    elif stageName == "rast.points":
+        #Same calls as MSH2T3S.py --native (prep.sampleNodes, fillColumn)
+        import rast
+        X, Y, P = readSyntheticMesh(mshFile)
+        with rast.nativeRasters():
+            values = rast.samplePoints(X,Y,os.path.join(folder,"dem.tif"))
+        filled = rast.fillNodata(X,Y,values)
+        return len(X)
+
+    elif stageName == "T3S.write":
+        #Same writer as MSH2T3S.py
+        import prep
+        X, Y, P = readSyntheticMesh(mshFile)
+        result = {"X": X, "Y": Y, "triangles": P, "crs": None, "filled": {}, \
+            "columns": [np.sin(X/150.0)*np.cos(Y/90.0)*5.0, np.full(len(X), 0.025)], \
+            "names": ["BOTTOM", "BOTTOM FRICTION"]}
+        prep.writeT3S(os.path.join(folder,"bench.t3s"), result)
+        return len(X)
+
+    print("Unrecognized stage:  " + str(stageName))
+    sys.exit("Bye!")
+
+###   Reads back the synthetic mesh without timing the MSH parsing
+def readSyntheticMesh(mshFile):
+    with open(mshFile,"r") as inFile:
+        lines = inFile.read().split("\n")
+    start = lines.index("$Nodes")
+    nNodes = int(lines[start+1])
+    nodes = np.loadtxt(lines[start+2:start+2+nNodes])
+    start = lines.index("$Elements")
+    nElements = int(lines[start+1])
+    rows = [line.split() for line in lines[start+2:start+2+nElements]]
+    triangles = np.array([row[5:8] for row in rows if row[1] == "2"], dtype=np.int64)
+    return nodes[:,1], nodes[:,2], triangles
+
+###   Runs a stage on a new python process and collects its measures
+def measureStage(stageName, folder):
+    command = [sys.executable, os.path.abspath(__file__), "--run-stage", stageName, folder]
+    result = subprocess.run(command, capture_output=True, text=True, cwd=folder)
+    lines = [line for line in result.stdout.split("\n") if line.startswith("{")]
+    if result.returncode != 0 or not lines:
+        error = result.stderr.strip().split("\n")[-1] if result.stderr.strip() else "no output"
+        return {"stage": stageName, "skipped": error}
+    return json.loads(lines[-1])
+
+###   Runs a stage several times and keeps the median of the wall times
+###     (and the throughput from it), with the largest peak RSS of them all
+def measureMedian(stageName, folder, repeat):
+    records = [measureStage(stageName, folder) for i in range(max(int(repeat), 1))]
+    timed = [r for r in records if "skipped" not in r]
+    if not timed:
+        return records[0]
+    record = dict(timed[0])
+    record["runs"] = [r["wall_s"] for r in timed]
+    record["wall_s"] = round(float(np.median(record["runs"])), 6)
+    record["throughput"] = record["items"] / max(record["wall_s"], 1e-9)
+    record["peak_rss_bytes"] = max(r["peak_rss_bytes"] for r in timed)
+    return record
+
+###   Compares the throughput of the results against the baseline. Drops
+###     beyond the tolerance are regressions, or only warnings for stages
+###     shorter than minCompareWall
+def compareBaseline(results, baseline, tolerance):
+    previous = {(r["stage"], r["scale"]): r for r in baseline.get("results",[])}
+    regressions, warnings = [], []
+    for r in results:
+        old = previous.get((r["stage"], r["scale"]))
+        if old is None or "throughput" not in r or "throughput" not in old:
+            continue
+        r["baseline_ratio"] = round(r["throughput"] / old["throughput"], 3)
+        if r["baseline_ratio"] >= 1.0 - tolerance:
+            continue
+        if max(r["wall_s"], old["wall_s"]) >= minCompareWall:
+            regressions.append(r)
+        else:
+            warnings.append(r)
+    return regressions, warnings
+
+###   Prints the results as a table
+def printTable(results):
+    print("\n%-20s %10s %12s %12s %12s %8s" % \
+        ("stage","scale","wall_s","items/s","peak_MB","vs_base"))
+    for r in results:
+        if "skipped" in r:
+            print("%-20s %10d   skipped: %s" % (r["stage"], r["scale"], r["skipped"]))
+            continue
+        print("%-20s %10d %12.3f %12.0f %12.1f %8s" % (r["stage"], r["scale"], \
+            r["wall_s"], r["throughput"], r["peak_rss_bytes"]/2**20, \
+            str(r.get("baseline_ratio","-"))))
+
+#////////////////////////////////////////////////////////////////////////
+
+if __name__ == "__main__":
+
+    #A single stage measured on this process
+    stageToRun = gets.popOption(sys.argv,"--run-stage",True)
+    if stageToRun is not None:
+        folder = sys.argv[1]
+        rssStart = prof.currentRSS()
+        sys.stdout = open(os.devnull,"w")
+        wall0 = time.perf_counter()
+        items = runStage(stageToRun, folder)
+        wall = time.perf_counter() - wall0
+        sys.stdout = sys.__stdout__
+        print(json.dumps({"stage": stageToRun, "items": int(items), \
+            "wall_s": round(wall,6), "throughput": items / max(wall,1e-9), \
+            "rss_start_bytes": rssStart, "peak_rss_bytes": prof.peakRSS()}))
+        sys.exit(0)
+
+    #Synthetic inputs of a case generated on this process
+    caseToMake = gets.popOption(sys.argv,"--make-case",True)
+    if caseToMake is not None:
+        makeCase(caseToMake, int(sys.argv[1]))
+        sys.exit(0)
+
+    scales = [int(float(s)) for s in \
+        gets.popOption(sys.argv,"--scales",True,default="1e4,1e5,1e6").split(",")]
+    stages = gets.popOption(sys.argv,"--stages",True,default=",".join(allStages)).split(",")
+    workFolder = gets.popOption(sys.argv,"--work",True)
+    baselineFile = gets.popOption(sys.argv,"--baseline",True)
+    saveFile = gets.popOption(sys.argv,"--save",True)
+    tolerance = float(gets.popOption(sys.argv,"--tolerance",True,default=0.25))
+    repeat = int(gets.popOption(sys.argv,"--repeat",True,default=5))
+
+    keepFolder = workFolder is not None
+    if workFolder is None:
+        workFolder = tempfile.mkdtemp(prefix="bench2D_")
+
+    results = []
+    for scale in scales:
+        folder = os.path.abspath(os.path.join(workFolder, "case_" + str(scale)))
+        print("Generating synthetic case with " + str(scale) + " nodes")
+        if not os.path.exists(os.path.join(folder,"dem.tif")):
+            #Generated on another process to keep the peak RSS of this one low
+            subprocess.run([sys.executable, os.path.abspath(__file__), \
+                "--make-case", folder, str(scale)], check=True)
+        for stageName in stages:
+            print("  Running " + stageName)
+            record = measureMedian(stageName, folder, repeat)
+            record["scale"] = scale
+            results.append(record)
+
+    regressions, warnings = [], []
+    if baselineFile is not None:
+        with open(baselineFile,"r") as inFile:
+            regressions, warnings = compareBaseline(results, json.load(inFile), tolerance)
+    printTable(results)
+
+    if saveFile is not None:
+        with open(saveFile,"w") as outFile:
+            json.dump({"python": sys.version.split()[0], \
+                "results": [r for r in results if "skipped" not in r]}, outFile, indent=1)
+
+    if not keepFolder:
+        shutil.rmtree(workFolder, ignore_errors=True)
+
+    if warnings:
+        print("\nThroughput drops beyond " + str(tolerance) + " on stages under " + \
+            str(minCompareWall) + " s (warning only):")
+        for r in warnings:
+            print("  " + r["stage"] + " @ " + str(r["scale"]) + ": x" + str(r["baseline_ratio"]))
+
+    if regressions:
+        print("\nThroughput regressions beyond " + str(tolerance) + ":")
+        for r in regressions:
+            print("  " + r["stage"] + " @ " + str(r["scale"]) + ": x" + str(r["baseline_ratio"]))
+        sys.exit("Bye!")
@@ -1,5 +1,6 @@
 import sys, os, shutil, re
 from pathlib import Path
+import prof
 
 ###   Builds a line for the GEO file setting the new start value of
 ###     GEO indices of certain feature
@@ -13,6 +14,7 @@ def addLastIndex(parameter, quantity = 0, recursive = False):
 
 ###   Builds the "Point()" GEO features from a list of X-coordinates, 
 ###     Y-coordinates, Z-coordinates, indices and element sizes  
+@prof.timed
 def buildGEOPoints(X,Y,Z=[],I=[],R=[]):
     ligne=['']
     for item in range(len(X)):
@@ -30,16 +32,22 @@ def buildGEOPoints(X,Y,Z=[],I=[],R=[]):
     return ligne
 
 ###   Builds the "Line()" GEO features from a list of Start-Points,
-###     End-Points and indices
-def buildGEOLines(I,L1,L2):
+###     End-Points and indices. With pointRefs the Start and End-Points
+###     are written as given (e.g., "P+3" or the id of an older point)
+@prof.timed
+def buildGEOLines(I,L1,L2,pointRefs=False):
     ligne=['']
     for item in range(len(I)):
         i1 = int(I[item])
-        l1 = int(L1[item])
-        l2 = int(L2[item])
-        ligne.append("Line(L+" + str(i1) + ") = {P+" \
-                    + str(l1) +\
-             ", P+" + str(l2) + "};"
+        if pointRefs:
+            l1 = str(L1[item])
+            l2 = str(L2[item])
+        else:
+            l1 = "P+" + str(int(L1[item]))
+            l2 = "P+" + str(int(L2[item]))
+        ligne.append("Line(L+" + str(i1) + ") = {" \
+                    + l1 +\
+             ", " + l2 + "};"
                  )
     return ligne
 
@@ -55,7 +63,34 @@ def setColumn(column):
             k+=1
     return result
 
+###   Builds the "View" of a gmsh POS file with two scalar triangles (ST)
+###     per cell of a grid of element sizes. Used as background mesh.
+###     cellSize is the side of the cells or a pair (width, height)
+def buildPOSView(cellSize,origin,rows,cols,values,name="ElementSizes"):
+    if isinstance(cellSize,(tuple,list)):
+        cellWidth, cellHeight = float(cellSize[0]), float(cellSize[1])
+    else:
+        cellWidth = cellHeight = cellSize
+    ligne = ['View "' + str(name) + '" {']
+    for item in range(len(rows)):
+        xa = origin[0] + cols[item]*cellWidth
+        ya = origin[1] + rows[item]*cellHeight
+        xb = xa + cellWidth
+        yb = ya + cellHeight
+        r1 = float(values[item])
+        ligne.append("ST(" + str(xa) + "," + str(ya) + ",0," + \
+            str(xb) + "," + str(ya) + ",0," + \
+            str(xb) + "," + str(yb) + ",0){" + \
+            str(r1) + "," + str(r1) + "," + str(r1) + "};")
+        ligne.append("ST(" + str(xa) + "," + str(ya) + ",0," + \
+            str(xb) + "," + str(yb) + ",0," + \
+            str(xa) + "," + str(yb) + ",0){" + \
+            str(r1) + "," + str(r1) + "," + str(r1) + "};")
+    ligne.append("};")
+    return ligne
+
 ###   Builds a list of three columns separated by a space in T3S format
+@prof.timed
 def buildT3S_3Col(Col1,Col2,Col3):
     T3S = []
     for i in range(len(Col1)):
@@ -63,7 +98,15 @@ def buildT3S_3Col(Col1,Col2,Col3):
         T3S.append(line)
     return(T3S)
 
+###   Builds the T3S lines of the rows [start, end) of any number of
+###     columns (arrays or lists), for T3S files written chunk by chunk
+def buildT3S_Rows(columns,start,end):
+    rows = [column[start:end].tolist() if hasattr(column,"tolist") else column[start:end] \
+        for column in columns]
+    return [" ".join(map(str,row)) for row in zip(*rows)]
+
 ###   Builds a list of two columns separated by a comma in CSV format
+@prof.timed
 def buildCSV_2Col(Col1,Col2):
     T3S = ["Xm,Ym"]
     for i in range(len(Col1)):
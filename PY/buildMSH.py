@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+#
+#////////////////////////////////////////////////////////////////////////
+#                                                                       #
+#                                 buildMSH.py                           #
+#                                                                       #
+#////////////////////////////////////////////////////////////////////////
+#
+# Author:     Edwin
+#
+# Works on:   python3
+#
+# Purpose:    Script takes in the CSV files generated from SHP2GEO.py (the
+#             boundary and, optionally, hard points and hard lines) and
+#             meshes the computational domain in memory with the gmsh
+#             python module. The mesh is written as a T3S file without
+#             attributes. The GEO and MSH files of the buildGEO.py and
+#             gmsh route are only written when asked for.
+#
+# Needs:      Python3, numpy, gmsh (python module)
+#
+# Usage:      python3 buildMSH.py <boundary.csv> <output.t3s>
+#                 [--points <points.csv>] [--lines <lines.csv>]
+#                 [--geo <output.geo>] [--msh <output.msh>] [--check]
+#
+# where:
+# --> boundary.csv: CSV file generated by the -p or -i modes of SHP2GEO.py
+#
+# --> output.t3s  : T3S file where the mesh will be written. BOTTOM is set
+#                   to 0, MSH2T3S.py samples the attributes from the MSH.
+#
+# --> --points    : CSV file generated by the -v mode of SHP2GEO.py
+#
+# --> --lines     : CSV file generated by the -l mode of SHP2GEO.py
+#
+# --> --geo       : writes the geometry as a .geo_unrolled file
+#
+# --> --msh       : writes the mesh as a MSH (v.2) file for MSH2T3S.py
+#
+# --> --check     : the boundary, hard points and hard lines are checked
+#                   before meshing (crossing or touching segments, points
+#                   outside the domain). Problems are printed with the
+#                   offending vertices and the script stops before gmsh.
+#
+#////////////////////////////////////////////////////////////////////////
+
+import sys, os
+
+#import own functions
+import fily, gets, build, meshing, prof
+
+#Optional flags are taken out before reading the positional arguments
+prof.enable(gets.popOption(sys.argv,"--trace",True))
+pathToPoints = gets.popOption(sys.argv,"--points",True)
+pathToLines  = gets.popOption(sys.argv,"--lines",True)
+pathToGEO    = gets.popOption(sys.argv,"--geo",True)
+pathToMSH    = gets.popOption(sys.argv,"--msh",True)
+checkMode    = gets.popOption(sys.argv,"--check",default=False)
+
+#Retrieve path of files from the arguments passed to the script
+pathToBoundary = str(sys.argv[1])           #CSV  input file
+pathToT3SFile  = str(sys.argv[2])           #T3S output file
+
+#Boundary rings
+boundaryTable = meshing.readGEOCSV(pathToBoundary,["X_m","Y_m","R_m","Rx_m","vertex_par"])
+rings = meshing.boundaryRings(boundaryTable)
+
+#Hard points
+points = None
+if pathToPoints is not None:
+    pointsTable = meshing.readGEOCSV(pathToPoints,["X_m","Y_m","R_m"])
+    points = (pointsTable["X_m"],pointsTable["Y_m"],pointsTable["R_m"])
+
+#Hard lines
+lines = None
+if pathToLines is not None:
+    linesTable = meshing.readGEOCSV(pathToLines,["X_m","Y_m","R_m","DN"])
+    lines = meshing.hardLines(linesTable)
+
+#Topology of the input, checked before gmsh spends minutes on it
+if checkMode:
+    problems = meshing.checkInput(rings,points,lines)
+    if problems:
+        for message in problems[:50]:
+            print(" " + message)
+        print("in buildMSH\n " + str(len(problems)) + " topology problems\n")
+        sys.exit("Bye!")
+    print("Topology ~OK~: " + str(pathToBoundary))
+
+#Mesh generation with the gmsh python module
+nodes, triangles = meshing.meshInMemory(rings,points,lines,pathToGEO,pathToMSH)
+
+#Write T3S File
+fily.resetFile(pathToT3SFile,"T3S")
+Header_T3S = build.buildT3S_Header(len(nodes),len(triangles),["1"],["BOTTOM"])
+fily.appendFile(Header_T3S,pathToT3SFile,True)
+fily.appendFile(build.buildT3S_3Col(nodes[:,0],nodes[:,1],["0"]*len(nodes)),pathToT3SFile)
+fily.appendFile(build.buildT3S_3Col(triangles[:,0],triangles[:,1],triangles[:,2]),pathToT3SFile)
+
+fily.copyCRS(pathToBoundary,pathToT3SFile)
+if pathToMSH is not None:
+    fily.copyCRS(pathToBoundary,pathToMSH)
+
+print("buildMSH ~OK~: " + str(pathToBoundary) + " > " + str(pathToT3SFile) + \
+    " (" + str(len(nodes)) + " nodes, " + str(len(triangles)) + " triangles)")
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+#
+#////////////////////////////////////////////////////////////////////////
+#                                                                       #
+#                                 cluster.py                            #
+#                                                                       #
+#////////////////////////////////////////////////////////////////////////
+#
+# Author:     Edwin
+#
+# Works on:   python3
+#
+# Purpose:    Runs the scripts of this folder (SHP2GEO.py, buildGEO.py,
+#             MSH2T3S.py, ...) and other programs (gmsh) as jobs of a queue
+#             kept in a folder of a shared filesystem, so workers on several
+#             nodes take them in parallel. Jobs are JSON files moved between
+#             the subfolders of the queue with atomic renames:
+#
+#                 pending/ -> running/ -> done/ | failed/
+#
+#             A worker claims a job by renaming it into running/, under a
+#             name of its own (<id>.<worker>.json), and keeps touching that
+#             file (heartbeat) while the job runs in a folder of that name. A job whose file
+#             was not touched for longer than the lease (its worker died or
+#             lost the node) is moved back to pending/ by any other worker.
+#             Results (status, return code, outputs, times) are written to
+#             done/ or failed/ and the output of the job to logs/. Several
+#             workers on one machine test the whole set up locally.
+#
+# Needs:      Python3, sys, os, json, time, socket, shutil, subprocess, uuid
+#
+# Usage:      python3 cluster.py submit <queue> [--after <id,id,...>]
+#                 [--] <script.py|program> [args...]
+#             python3 cluster.py work <queue> [--workers <n>] [--lease <s>]
+#                 [--attempts <n>] [--idle <s>]
+#             python3 cluster.py status <queue>
+#
+# where:
+# --> queue     : folder of the queue on the shared filesystem. It is
+#                 created by the first submit.
+#
+# --> submit    : adds a job and prints its id. Scripts (.py) are taken from
+#                 the folder of cluster.py, other programs from the PATH.
+#                 Arguments that are paths are made absolute, since jobs run
+#                 in a folder of their own (queue/work/<id>.<worker>/run),
+#                 where "../.Temp" is private to the job. Options of cluster.py
+#                 go before the script; everything from the script on (or
+#                 after "--") is passed to the job as it is, so the job
+#                 may have its own --workers, --after...
+#
+#     --> --after: the job waits until the given jobs are done, e.g. gmsh
+#                  after buildGEO.py. It fails if one of them fails.
+#
+# --> work      : takes and runs jobs until the queue is empty.
+#
+#     --> --workers: number of worker processes started on this machine (1)
+#
+#     --> --lease  : seconds without a heartbeat after which a running job
+#                    is taken back to pending/ (120). Workers touch their
+#                    job every lease/4 seconds. The clocks of the nodes
+#                    should agree to much less than the lease.
+#
+#     --> --attempts: times a job is started before it is given up as
+#                    failed because its lease expired (3). Jobs that end
+#                    with an error are not retried.
+#
+#     --> --idle   : seconds a worker waits for new jobs once the queue is
+#                    empty before stopping (0).
+#
+# --> status    : prints the number of jobs in each state and the running
+#                 jobs with their worker.
+#
+#////////////////////////////////////////////////////////////////////////
+
+import sys, os, json, time, socket, shutil, subprocess, uuid
+
+import gets
+
+scriptFolder = os.path.dirname(os.path.abspath(__file__))
+queueFolders = ["pending", "running", "done", "failed", "logs", "work"]
+
+###   Seconds between two looks at an empty queue
+pollInterval = 2.0
+
+###   Options of cluster.py that take a value
+clusterOptions = ["--workers", "--lease", "--attempts", "--idle", "--after"]
+
+###   Writes a JSON file atomically: a hidden temporal file in the same
+###     folder is renamed over it, so readers never see half a file
+def writeJSON(data, pathToFile):
+    folder, name = os.path.split(pathToFile)
+    temporal = os.path.join(folder, "." + name + "." + uuid.uuid4().hex[:8])
+    with open(temporal, "w") as outFile:
+        json.dump(data, outFile, indent=1)
+    os.replace(temporal, pathToFile)
+
+def readJSON(pathToFile):
+    with open(pathToFile) as inFile:
+        return json.load(inFile)
+
+###   Job files of a folder of the queue, oldest first (ids start with the
+###     submit time)
+def jobFiles(queue, state):
+    folder = os.path.join(queue, state)
+    return sorted(name for name in os.listdir(folder) \
+        if name.endswith(".json") and not name.startswith("."))
+
+###   Splits the command line into the arguments of cluster.py and those
+###     of the job. The job starts at its script or program (the third
+###     argument that is neither an option of cluster.py nor its value)
+###     or right after "--"
+def splitJobArgs(argv):
+    positional = 0
+    i = 1
+    while i < len(argv):
+        if argv[i] == "--":
+            return argv[:i], argv[i+1:]
+        if argv[i] in clusterOptions:
+            i += 2
+            continue
+        positional += 1
+        if positional == 3:
+            return argv[:i], argv[i:]
+        i += 1
+    return argv, []
+
+###   Arguments that are paths (existing, or a file name in an existing
+###     folder) made absolute. Comma separated lists of paths are accepted
+def absolutePaths(args):
+    result = []
+    for arg in args:
+        if arg.startswith("-"):
+            result.append(arg)
+            continue
+        try:
+            float(arg)
+            result.append(arg)
+            continue
+        except ValueError:
+            pass
+        paths = []
+        for part in arg.split(","):
+            folder = os.path.dirname(part) or "."
+            if os.path.exists(part) or (os.path.splitext(part)[1] and os.path.isdir(folder)):
+                paths.append(os.path.abspath(part))
+            else:
+                paths.append(part)
+        result.append(",".join(paths))
+    return result
+
+###   Adds a job to the pending folder of the queue
+def submitJob(queue, program, args, after = None):
+    for state in queueFolders:
+        os.makedirs(os.path.join(queue, state), exist_ok=True)
+    now = time.time()
+    jobID = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + "-" + \
+        str(int(now % 1 * 1e6)).zfill(6) + "-" + uuid.uuid4().hex[:6]
+    job = {"id": jobID, "args": absolutePaths(args), "after": after or [], \
+        "attempts": 0, "submitted": time.time()}
+    if program.endswith(".py"):
+        job["script"] = os.path.basename(program)
+    else:
+        job["command"] = program
+    writeJSON(job, os.path.join(queue, "pending", jobID + ".json"))
+    return jobID
+
+###   Moves running jobs whose lease expired back to pending (or to failed
+###     after too many attempts). The job is first renamed to a name of
+###     this worker, so only one worker takes it back
+def reapExpired(queue, workerName, lease, maxAttempts):
+    for name in jobFiles(queue, "running"):
+        path = os.path.join(queue, "running", name)
+        try:
+            state = os.stat(path)
+        except FileNotFoundError:
+            continue
+        if time.time() - max(state.st_mtime, state.st_ctime) < lease:
+            continue
+        reaped = path + ".reaped-" + workerName
+        try:
+            os.rename(path, reaped)
+        except FileNotFoundError:
+            continue
+        job = readJSON(reaped)
+        print("Lease expired:  " + job["id"] + " (" + str(job.get("worker")) + ")", file=sys.stderr)
+        if job["attempts"] >= maxAttempts:
+            job["status"] = "error"
+            job["error"] = "lease expired " + str(job["attempts"]) + " times"
+            writeJSON(job, os.path.join(queue, "failed", job["id"] + ".json"))
+        else:
+            writeJSON(job, os.path.join(queue, "pending", job["id"] + ".json"))
+        os.remove(reaped)
+
+###   Claims the oldest pending job whose dependencies are done. Jobs that
+###     depend on a failed job fail too. The job is renamed into running/
+###     under a name of this worker, so a worker that lost the job (its
+###     lease expired and another worker took it) never touches the file
+###     of the new claim. Returns the job and the path of its file in
+###     running/, or None if there is nothing to run
+def claimJob(queue, workerName):
+    done = set(name[:-5] for name in jobFiles(queue, "done"))
+    failed = set(name[:-5] for name in jobFiles(queue, "failed"))
+    for name in jobFiles(queue, "pending"):
+        path = os.path.join(queue, "pending", name)
+        try:
+            job = readJSON(path)
+        except (FileNotFoundError, ValueError):
+            continue
+        if not all(jobID in done or jobID in failed for jobID in job["after"]):
+            continue
+
+        running = os.path.join(queue, "running", name[:-5] + "." + workerName + ".json")
+        try:
+            os.rename(path, running)
+        except FileNotFoundError:
+            continue                        #another worker took it first
+        if any(jobID in failed for jobID in job["after"]):
+            job["status"] = "error"
+            job["error"] = "a job it runs after failed"
+            writeJSON(job, os.path.join(queue, "failed", name))
+            os.remove(running)
+            continue
+        job["attempts"] += 1
+        job["worker"] = workerName
+        job["started"] = time.time()
+        writeJSON(job, running)
+        return job, running
+    return None
+
+###   Runs a claimed job in a folder of the claim, touching its file every
+###     heartbeat. If the file disappears, the lease was lost (another
+###     worker took the job back) and the job is stopped without results
+def runJob(queue, job, running, lease):
+    workFolder = os.path.join(queue, "work", os.path.basename(running)[:-5])
+    runFolder = os.path.join(workFolder, "run")
+    os.makedirs(runFolder, exist_ok=True)
+    logFile = os.path.join(queue, "logs", job["id"] + ".log")
+    if "script" in job:
+        command = [sys.executable, os.path.join(scriptFolder, job["script"])] + job["args"]
+    else:
+        command = [job["command"]] + job["args"]
+
+    lost = False
+    wall0 = time.time()
+    with open(logFile, "a") as log:
+        log.write("#" + json.dumps({"worker": job["worker"], "command": command}) + "\n")
+        log.flush()
+        try:
+            process = subprocess.Popen(command, cwd=runFolder, stdout=log, stderr=subprocess.STDOUT)
+        except OSError as error:
+            process = None
+            job["error"] = repr(error)
+        while process is not None:
+            try:
+                process.wait(timeout=lease/4.0)
+                break
+            except subprocess.TimeoutExpired:
+                try:
+                    os.utime(running)
+                except FileNotFoundError:
+                    lost = True
+                    process.kill()
+                    process.wait()
+                    break
+
+    #The finished job is renamed before its results are written, so a
+    #   worker that took it back meanwhile is noticed
+    finishing = running + ".finishing"
+    try:
+        os.rename(running, finishing)
+    except FileNotFoundError:
+        lost = True
+    shutil.rmtree(workFolder, ignore_errors=True)
+    if lost:
+        print("Lease lost:  " + job["id"], file=sys.stderr)
+        return None
+
+    job["returncode"] = None if process is None else process.returncode
+    job["status"] = "ok" if job["returncode"] == 0 else "error"
+    job["finished"] = time.time()
+    job["wall_s"] = round(job["finished"] - wall0, 3)
+    job["log"] = logFile
+    job["outputs"] = [arg for part in job["args"] for arg in part.split(",") \
+        if os.path.isabs(arg) and os.path.isfile(arg) and os.path.getmtime(arg) >= wall0 - 1]
+    writeJSON(job, os.path.join(queue, "done" if job["status"] == "ok" else "failed", \
+        job["id"] + ".json"))
+    os.remove(finishing)
+    return job
+
+###   Takes and runs jobs until the queue is empty (and stays empty for
+###     "idle" seconds)
+def workLoop(queue, lease, maxAttempts, idle):
+    workerName = socket.gethostname() + "-" + str(os.getpid())
+    emptySince = None
+    while True:
+        reapExpired(queue, workerName, lease, maxAttempts)
+        claimed = claimJob(queue, workerName)
+        if claimed is None:
+            if not jobFiles(queue, "running") and not jobFiles(queue, "pending"):
+                emptySince = emptySince or time.time()
+                if time.time() - emptySince >= idle:
+                    break
+            else:
+                emptySince = None
+            time.sleep(pollInterval)
+            continue
+        emptySince = None
+        job = runJob(queue, claimed[0], claimed[1], lease)
+        if job is not None:
+            print(json.dumps({"id": job["id"], "status": job["status"], "worker": workerName, \
+                "wall_s": job["wall_s"]}))
+            sys.stdout.flush()
+
+###   Number of jobs in each state and the running jobs
+def printStatus(queue):
+    counts = [state + ": " + str(len(jobFiles(queue, state))) for state in \
+        ["pending", "running", "done", "failed"]]
+    print(", ".join(counts))
+    for name in jobFiles(queue, "running"):
+        try:
+            job = readJSON(os.path.join(queue, "running", name))
+            beat = time.time() - os.stat(os.path.join(queue, "running", name)).st_mtime
+        except (FileNotFoundError, ValueError):
+            continue
+        print(" " + job["id"] + "  " + str(job.get("script", job.get("command"))) + "  " + \
+            str(job.get("worker")) + "  attempt " + str(job["attempts"]) + \
+            "  last heartbeat " + str(round(beat, 1)) + " s ago")
+
+#////////////////////////////////////////////////////////////////////////
+
+#Optional flags are taken out before reading the positional arguments,
+#   only from the arguments before the job
+sys.argv, jobArgs = splitJobArgs(sys.argv)
+nWorkers    = int(gets.popOption(sys.argv,"--workers",True,default=1))
+lease       = float(gets.popOption(sys.argv,"--lease",True,default=120))
+maxAttempts = int(gets.popOption(sys.argv,"--attempts",True,default=3))
+idle        = float(gets.popOption(sys.argv,"--idle",True,default=0))
+after       = gets.popOption(sys.argv,"--after",True)
+
+if len(sys.argv) < 3 or sys.argv[1] not in ["submit","work","status"]:
+    print("Usage: cluster.py submit|work|status <queue> ...")
+    sys.exit("Bye!")
+mode = sys.argv[1]
+pathToQueue = os.path.abspath(sys.argv[2])
+
+if mode == "submit":
+    if len(jobArgs) < 1 or len(sys.argv) > 3:
+        print("in cluster\n submit needs a script or a program, after the options\n")
+        sys.exit("Bye!")
+    print(submitJob(pathToQueue,jobArgs[0],jobArgs[1:],None if after is None else after.split(",")))
+
+elif mode == "work":
+    for state in queueFolders:
+        os.makedirs(os.path.join(pathToQueue, state), exist_ok=True)
+    #Extra local workers are copies of this script
+    options = ["--lease", str(lease), "--attempts", str(maxAttempts), "--idle", str(idle)]
+    others = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "work", pathToQueue] + \
+        options) for i in range(nWorkers - 1)]
+    workLoop(pathToQueue, lease, maxAttempts, idle)
+    for process in others:
+        process.wait()
+
+elif mode == "status":
+    printStatus(pathToQueue)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+#
+#////////////////////////////////////////////////////////////////////////
+#                                                                       #
+#                                 daemon.py                             #
+#                                                                       #
+#////////////////////////////////////////////////////////////////////////
+#
+# Author:     Edwin
+#
+# Works on:   python3
+#
+# Purpose:    Long running worker that starts QGIS (and its Processing
+#             framework) only once and then runs the jobs of SHP2GEO.py
+#             and MSH2T3S.py it receives as JSON lines, either from the
+#             standard input or from a Unix socket. Jobs are run one after
+#             the other from a queue and a JSON line is returned for each
+#             one with the output paths and timings.
+#
+# Needs:      Python3, qgis.bin, sys, os, json, socket, threading, queue
+#
+# Usage:      python3 daemon.py [--socket <path.sock>] [--trace <trace.json>]
+#
+# where:
+# --> --socket: path of the Unix socket to listen to. Without it, the jobs
+#               are read from the standard input and the answers written
+#               to the standard output. Everything the scripts print is
+#               sent to the standard error.
+#
+# Jobs:       {"id": <any>, "job": <job name>, "args": [<arguments>]}
+#
+#     --> polygon      : args = [input.shp, output.csv]         SHP2GEO -p
+#     --> heteropolygon: args = [input.shp, sizes.shp, output.csv] SHP2GEO -i
+#     --> line         : args = [input.shp, output.csv]         SHP2GEO -l
+#     --> vertices     : args = [input.shp, output.csv]         SHP2GEO -v
+#     --> sample       : args = [nodes.csv, raster.tif, output.csv]
+#     --> msh2t3s      : args = the same arguments of MSH2T3S.py
+#     --> ping         : answers {"status": "ok"}
+#     --> shutdown     : stops the daemon after the jobs already queued. 
+#                        The end of the standard input also stops it.
+#
+# Answer:     {"id": <id>, "job": <job>, "status": "ok"|"error",
+#              "outputs": [<paths>], "queue_s": <s>, "wall_s": <s>,
+#              "cpu_s": <s>, "error": <message>}
+#
+#////////////////////////////////////////////////////////////////////////
+
+import sys, os, json, time, shutil, socket, threading, queue, runpy, traceback
+from contextlib import redirect_stdout
+
+import prof, gets
+prof.enable(gets.popOption(sys.argv,"--trace",True))
+socketPath = gets.popOption(sys.argv,"--socket",True)
+
+#QGIS is started once here, when gis is imported
+import fily, gis, prep
+
+scriptFolder = os.path.dirname(os.path.abspath(__file__))
+jobQueue = queue.Queue()
+
+###   Same steps of SHP2GEO.py -p, -i, -l and -v (see prep.shpToTable)
+def jobPolygon(path2Polygon, path2VertexXY):
+    return [prep.shpToTable(path2Polygon,path2VertexXY,"polygon")]
+
+def jobHeteropolygon(path2Polygon, path2SizeMap, path2VertexXY):
+    return [prep.shpToTable(path2Polygon,path2VertexXY,"heteropolygon",path2SizeMap)]
+
+def jobLine(path2Line, path2VertexXY):
+    return [prep.shpToTable(path2Line,path2VertexXY,"line")]
+
+def jobVertices(path2Vertex, path2VertexXY):
+    return [prep.shpToTable(path2Vertex,path2VertexXY,"vertices")]
+
+###   Samples a raster on the nodes of a CSV file with Xm,Ym columns
+def jobSample(inputNodes, rasterFile, outputNodes):
+    gis.sampleRaster(inputNodes,rasterFile,outputNodes)
+    return [outputNodes]
+
+###   Runs MSH2T3S.py on this process. gis is already imported so QGIS
+###     is not started again
+def jobMSH2T3S(*args):
+    sys.argv = ["MSH2T3S.py"] + [str(a) for a in args]
+    runpy.run_path(os.path.join(scriptFolder,"MSH2T3S.py"), run_name="__main__")
+    return [str(args[1])]
+
+jobFunctions = {
+    "polygon": jobPolygon,
+    "heteropolygon": jobHeteropolygon,
+    "line": jobLine,
+    "vertices": jobVertices,
+    "sample": jobSample,
+    "msh2t3s": jobMSH2T3S
+    }
+
+###   Runs a job and builds its answer
+def runJob(request, queuedAt):
+    answer = {"id": request.get("id"), "job": request.get("job")}
+    answer["queue_s"] = round(time.perf_counter() - queuedAt, 6)
+    name = str(request.get("job")).lower()
+
+    if name == "ping":
+        answer["status"] = "ok"
+        return answer
+    if name not in jobFunctions:
+        answer["status"] = "error"
+        answer["error"] = "Unrecognized job:  " + str(request.get("job"))
+        return answer
+
+    argv = list(sys.argv)
+    wall0 = time.perf_counter()
+    cpu0 = time.process_time()
+    try:
+        with redirect_stdout(sys.stderr), prof.stage("daemon." + name):
+            fily.touchFolder("../.Temp")
+            answer["outputs"] = jobFunctions[name](*request.get("args",[]))
+        answer["status"] = "ok"
+    except SystemExit as error:
+        answer["status"] = "error"
+        answer["error"] = str(error)
+    except Exception as error:
+        answer["status"] = "error"
+        answer["error"] = repr(error)
+        traceback.print_exc(file=sys.stderr)
+    finally:
+        sys.argv = argv
+        shutil.rmtree("../.Temp", ignore_errors=True)
+    answer["wall_s"] = round(time.perf_counter() - wall0, 6)
+    answer["cpu_s"] = round(time.process_time() - cpu0, 6)
+    return answer
+
+###   Reads JSON lines from a stream and queues them. The answers are sent
+###     through the reply function. Lines that are not a JSON object are
+###     answered with an error and not queued
+def readJobs(stream, reply):
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError:
+            reply({"status": "error", "error": "Not a JSON line:  " + line})
+            continue
+        if not isinstance(request, dict):
+            reply({"status": "error", "error": "Not a JSON object:  " + line})
+            continue
+        jobQueue.put((request, reply, time.perf_counter()))
+
+###   Serves one client of the Unix socket
+def serveClient(connection):
+    lock = threading.Lock()
+    stream = connection.makefile("rw")
+    def reply(answer):
+        with lock:
+            try:
+                stream.write(json.dumps(answer) + "\n")
+                stream.flush()
+            except (OSError, ValueError):
+                pass
+    readJobs(stream, reply)
+
+###   Accepts the clients of the Unix socket, each one on its own thread
+def listenSocket(path):
+    if os.path.exists(path):
+        os.remove(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    print("Daemon listening on  " + str(path), file=sys.stderr)
+    while True:
+        connection, address = server.accept()
+        threading.Thread(target=serveClient, args=(connection,), daemon=True).start()
+
+###   Answers on the standard output
+def replyStdout(answer):
+    sys.__stdout__.write(json.dumps(answer) + "\n")
+    sys.__stdout__.flush()
+
+#////////////////////////////////////////////////////////////////////////
+
+if socketPath is None:
+    def readStdin():
+        readJobs(sys.stdin, replyStdout)
+        jobQueue.put(({"job": "shutdown"}, None, time.perf_counter()))
+    threading.Thread(target=readStdin, daemon=True).start()
+else:
+    threading.Thread(target=listenSocket, args=(socketPath,), daemon=True).start()
+
+#Jobs run on the main thread, where QGIS was started
+while True:
+    request, reply, queuedAt = jobQueue.get()
+    if str(request.get("job")).lower() == "shutdown":
+        if reply is not None:
+            reply({"id": request.get("id"), "job": "shutdown", "status": "ok"})
+        break
+    reply(runJob(request, queuedAt))
+
+if socketPath is not None and os.path.exists(socketPath):
+    os.remove(socketPath)
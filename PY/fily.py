@@ -1,5 +1,26 @@
-import sys, os, shutil, re
+import sys, os, shutil, re, csv, io, gzip
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import prof
+
+###   zstd is optional, gzip comes with python
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+###   Files are compressed (and read back uncompressed) by their extension
+compressedExtensions = {".gz": "gzip", ".zst": "zstd"}
+compressLevels = {"gzip": 3, "zstd": 3}
+
+###   Text written to a compressed file is cut in blocks compressed on
+###     worker threads (zlib and zstd release the GIL). Each block is a
+###     gzip member or a zstd frame, the file is their concatenation
+compressBlockSize = 4 * 2**20
+compressWorkers = min(8, os.cpu_count() or 1)
+
+###   First lines of a GEO file, the initial indices of the GEO features
+geoHeader = 'P=1;\nL=1;\nLL=1;\nPS=0;\n\n'
 
 ###   Creates an empty folder. If the folder exists, it will be erased
 def touchFolder(folderName):                
@@ -19,13 +40,79 @@ def touchFile(fileName):
         os.remove(fileName)
         Path(fileName).touch()
 
+###   Compression of a file ("gzip", "zstd") taken from its extension, None
+###     for plain files
+def compression(fileName):
+    return compressedExtensions.get(os.path.splitext(str(fileName))[1].lower())
+
+###   Name of a file without the extension of its compression, e.g.
+###     mesh.t3s.gz -> mesh.t3s
+def plainName(fileName):
+    if compression(fileName) is None:
+        return str(fileName)
+    return os.path.splitext(str(fileName))[0]
+
+def checkZstd(fileName):
+    if zstandard is None:
+        print("in f.checkZstd\n the zstandard module is needed for " + str(fileName) + "\n")
+        sys.exit("Bye!")
+
+###   Compresses one block of bytes as a complete gzip member or zstd frame
+def compressBlock(kind, block):
+    if kind == "gzip":
+        return gzip.compress(block, compressLevels["gzip"], mtime=0)
+    return zstandard.ZstdCompressor(level=compressLevels["zstd"]).compress(block)
+
+###   Writes (mode "wb") or appends (mode "ab") text to a compressed file,
+###     compressing its blocks in parallel
+def writeCompressed(text, fileName, mode = "ab"):
+    kind = compression(fileName)
+    if kind == "zstd":
+        checkZstd(fileName)
+    data = str(text).encode("utf-8")
+    blocks = [data[i:i+compressBlockSize] for i in range(0, len(data), compressBlockSize)]
+    if len(blocks) > 1:
+        with ThreadPoolExecutor(max_workers=compressWorkers) as pool:
+            parts = list(pool.map(lambda block: compressBlock(kind, block), blocks))
+    else:
+        parts = [compressBlock(kind, block) for block in blocks]
+    with open(fileName, mode) as outFile:
+        for part in parts:
+            outFile.write(part)
+
+###   Opens a file for reading as bytes, uncompressing it on the fly if
+###     it is a .gz or .zst file
+def openBinary(fileName):
+    kind = compression(fileName)
+    if kind == "gzip":
+        return gzip.open(fileName, "rb")
+    if kind == "zstd":
+        checkZstd(fileName)
+        return zstandard.ZstdDecompressor().stream_reader(open(fileName, "rb"), \
+            read_across_frames=True, closefd=True)
+    return open(fileName, "rb")
+
+###   Opens a file for reading as text, compressed or not
+def openText(fileName, newline = None):
+    if compression(fileName) is None:
+        return open(fileName, "r", newline=newline)
+    return io.TextIOWrapper(openBinary(fileName), encoding="utf-8", newline=newline)
+
+###   Whole contents of a file as bytes, uncompressed
+def readBytes(fileName):
+    with openBinary(fileName) as inFile:
+        return inFile.read()
+
 ###   Starts a new GEO file with initialization of indeces of the GEO 
 ###     features 
 def resetFile(nameFile,extension):
+    if compression(nameFile) is not None and extension in ["GEO","T3S"]:
+        writeCompressed(geoHeader if extension in ["GEO"] else '', nameFile, "wb")
+        return
     try: 
         with open(nameFile,"w") as outFile:
             if extension in ["GEO"]:
-                outFile.write('P=1;\nL=1;\nLL=1;\nPS=0;\n\n')                
+                outFile.write(geoHeader)
             elif extension in ["T3S"]:
                 outFile.write('')
             else:
@@ -48,8 +135,12 @@ def resetFile(nameFile,extension):
     #     print("in f.readFile\n " + str(pathToFile) + " could not be found\n")
 
 ###   Appends a list to a file
+@prof.timed
 def appendFile(what, whereToFile, isString = False):
-    if not isString :
+    if compression(whereToFile) is not None:
+        writeCompressed(str(what) if isString else \
+            "".join(str(line) + "\n" for line in what), whereToFile)
+    elif not isString :
         with open(whereToFile,"a") as outFile:
             for i in range(len(what)):
                 outFile.write(str(what[i]) + "\n")
@@ -61,10 +152,38 @@ def appendFile(what, whereToFile, isString = False):
 
 ###   Takes a text file and splits it as a list of strings. Each line
 ###     on the file is an element of the list
+@prof.timed
 def parseFile(pathToFile):
     try: 
-        with open(pathToFile,"r") as varFile:
+        with openText(pathToFile) as varFile:
             X = str(varFile.read())
         return(X.split("\n"))
     except FileNotFoundError:
         print("in f.parseFile\n " + str(pathToFile) + " could not be found\n")
+
+###   Writes the fields (columns) of a table as a CSV file, or as a binary
+###     NPZ file if its name ends with .npz
+def writeTable(fileName, names, columns):
+    if str(fileName).lower().endswith(".npz"):
+        import numpy as np
+        np.savez(fileName, **{name: np.asarray(column) for name, column in zip(names, columns)})
+        return
+    if compression(fileName) is not None:
+        outFile = io.StringIO(newline="")
+        writer = csv.writer(outFile)
+        writer.writerow(names)
+        writer.writerows(zip(*columns))
+        writeCompressed(outFile.getvalue(), fileName, "wb")
+        return
+    with open(fileName,"w",newline="") as outFile:
+        writer = csv.writer(outFile)
+        writer.writerow(names)
+        writer.writerows(zip(*columns))
+
+###   Copies the .prj file (CRS) next to a file to the .prj file next to
+###     another one, so the CRS follows the data from SHP to T3S
+def copyCRS(fromFile, toFile):
+    fromPRJ = os.path.splitext(plainName(fromFile))[0] + ".prj"
+    toPRJ = os.path.splitext(plainName(toFile))[0] + ".prj"
+    if os.path.isfile(fromPRJ) and os.path.abspath(fromPRJ) != os.path.abspath(toPRJ):
+        shutil.copyfile(fromPRJ, toPRJ)
@@ -0,0 +1,486 @@
+import sys, os, re, math
+import numpy as np
+import fily, prof
+
+###   Largest number of point-edge pairs tested at once, to bound memory
+blockSize = 4000000
+
+###   Splits the vertices of a CSV written by SHP2GEO.py -p into polygons.
+###     A new feature starts where "vertex_ind" goes back to 0 and its
+###     rings are told apart by "vertex_par". Returns a list of features,
+###     each one a list of (X, Y) rings, and the index of the first vertex
+###     of each feature
+def splitPolygons(X, Y, vertexInd, vertexPar):
+    vertexInd = np.asarray(vertexInd).astype(np.int64)
+    vertexPar = np.asarray(vertexPar).astype(np.int64)
+    starts = np.flatnonzero(vertexInd == 0)
+    if len(starts) == 0 or starts[0] != 0:
+        starts = np.concatenate(([0], starts))
+    ends = np.append(starts[1:], len(X))
+
+    features = []
+    for start, end in zip(starts, ends):
+        rings = []
+        part = vertexPar[start:end]
+        for ring in np.unique(part):
+            which = start + np.flatnonzero(part == ring)
+            rings.append((np.asarray(X)[which], np.asarray(Y)[which]))
+        features.append(rings)
+    return features, starts
+
+###   Edges of a ring as arrays of start and end coordinates. The ring is
+###     closed if its last vertex does not repeat the first one
+def ringEdges(X, Y):
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64)
+    if X[0] != X[-1] or Y[0] != Y[-1]:
+        X = np.append(X, X[0])
+        Y = np.append(Y, Y[0])
+    return X[:-1], Y[:-1], X[1:], Y[1:]
+
+###   Even-odd (crossing number) test of many points against a set of
+###     edges: a point is inside if a ray from it towards +X crosses an
+###     odd number of edges. The edges are bucketed in horizontal bands
+###     (about as many bands as edges, fewer if the edges are tall), so
+###     each point is only tested against the edges of its band
+def crossingParity(px, py, x1, y1, x2, y2):
+    inside = np.zeros(len(px), dtype=bool)
+    if len(px) == 0 or len(x1) == 0:
+        return inside
+    yLow, yHigh = np.minimum(y1, y2), np.maximum(y1, y2)
+    y0 = yLow.min()
+    height = max(yHigh.max() - y0, 1e-12)
+    nBands = max(1, min(len(x1), int(len(x1) * height / max(np.sum(yHigh - yLow), 1e-12))))
+    b0 = np.clip(((yLow - y0) / height * nBands).astype(np.int64), 0, nBands-1)
+    b1 = np.clip(((yHigh - y0) / height * nBands).astype(np.int64), 0, nBands-1)
+
+    #Edges sorted by band, one entry for each band an edge crosses
+    counts = b1 - b0 + 1
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    bands = np.repeat(b0, counts) + k
+    order = np.argsort(bands, kind="stable")
+    bandEdges = np.repeat(np.arange(len(x1)), counts)[order]
+    bandStarts = np.searchsorted(bands[order], np.arange(nBands + 1))
+
+    which = np.flatnonzero((py >= y0) & (py <= y0 + height))
+    band = np.clip(((py[which] - y0) / height * nBands).astype(np.int64), 0, nBands-1)
+    n = bandStarts[band+1] - bandStarts[band]
+    step = max(1, int(blockSize // max(n.mean() if len(n) else 1, 1)))
+    for first in range(0, len(which), step):
+        block = slice(first, first+step)
+        m = n[block]
+        local = np.repeat(np.arange(len(m)), m)
+        point = which[block][local]
+        k = np.arange(m.sum()) - np.repeat(np.cumsum(m) - m, m)
+        edge = bandEdges[np.repeat(bandStarts[band[block]], m) + k]
+        ax, ay, bx, by, qy = x1[edge], y1[edge], x2[edge], y2[edge], py[point]
+        crosses = (ay > qy) != (by > qy)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            crosses &= px[point] < ax + (qy - ay) * (bx - ax) / (by - ay)
+        inside[which[block]] = (np.bincount(local[crosses], minlength=len(m)) % 2).astype(bool)
+    return inside
+
+###   Even-odd test of many points against a polygon given as a list of
+###     (X, Y) rings, so holes are taken into account
+def pointsInPolygon(px, py, rings):
+    px = np.asarray(px, dtype=np.float64)
+    py = np.asarray(py, dtype=np.float64)
+    edges = [ringEdges(X, Y) for X, Y in rings]
+    return crossingParity(px, py, np.concatenate([e[0] for e in edges]), \
+        np.concatenate([e[1] for e in edges]), np.concatenate([e[2] for e in edges]), \
+        np.concatenate([e[3] for e in edges]))
+
+###   Twice the signed area of the triangles (a, b, c): > 0 if c is on the
+###     left of a->b, 0 if the three are aligned
+def orientation(ax, ay, bx, by, cx, cy):
+    return (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+
+###   Finds the pairs of segments that cross or touch, other than pairs
+###     sharing a vertex (given by the vertex numbers a and b of each
+###     segment). The segments are bucketed on a grid of cells of about
+###     their length and only the pairs found in a same cell are tested.
+###     Returns the two segments of each pair and the point where they meet
+def findCrossings(x1, y1, x2, y2, a, b):
+    x1, y1, x2, y2 = [np.asarray(v, dtype=np.float64) for v in (x1, y1, x2, y2)]
+    a, b = np.asarray(a), np.asarray(b)
+    nothing = np.zeros(0, dtype=np.int64)
+    if len(x1) < 2:
+        return nothing, nothing, np.zeros(0), np.zeros(0)
+    xMin, xMax = np.minimum(x1, x2), np.maximum(x1, x2)
+    yMin, yMax = np.minimum(y1, y2), np.maximum(y1, y2)
+    x0, y0 = xMin.min(), yMin.min()
+    width, height = max(xMax.max() - x0, 1e-12), max(yMax.max() - y0, 1e-12)
+    cell = max(np.sqrt(width*height/len(x1)), float(np.median(np.maximum(xMax-xMin, yMax-yMin))))
+    nCols = int(width // cell) + 1
+
+    #One (cell, segment) entry for each cell the box of a segment touches
+    c0 = ((xMin - x0) // cell).astype(np.int64); c1 = ((xMax - x0) // cell).astype(np.int64)
+    r0 = ((yMin - y0) // cell).astype(np.int64); r1 = ((yMax - y0) // cell).astype(np.int64)
+    nc = c1 - c0 + 1
+    counts = nc * (r1 - r0 + 1)
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    nc = np.repeat(nc, counts)
+    cells = (np.repeat(r0, counts) + k // nc) * nCols + np.repeat(c0, counts) + k % nc
+    order = np.argsort(cells, kind="stable")
+    cells = cells[order]
+    segments = np.repeat(np.arange(len(x1)), counts)[order]
+
+    #Each entry is paired with the entries after it in the same cell
+    after = np.searchsorted(cells, cells, side="right") - np.arange(len(cells)) - 1
+    firstI, firstJ = [nothing], [nothing]
+    cumulative = np.cumsum(after)
+    bounds = np.unique(np.append(0, np.searchsorted(cumulative, \
+        np.arange(blockSize, cumulative[-1], blockSize))))
+    for start, end in zip(bounds, np.append(bounds[1:], len(cells))):
+        m = after[start:end]
+        entry = np.repeat(np.arange(start, end), m)
+        k = np.arange(m.sum()) - np.repeat(np.cumsum(m) - m, m)
+        i, j = segments[entry], segments[entry + 1 + k]
+        shared = (a[i] == a[j]) | (a[i] == b[j]) | (b[i] == a[j]) | (b[i] == b[j])
+        i, j = i[~shared], j[~shared]
+
+        d1 = orientation(x1[j], y1[j], x2[j], y2[j], x1[i], y1[i])
+        d2 = orientation(x1[j], y1[j], x2[j], y2[j], x2[i], y2[i])
+        d3 = orientation(x1[i], y1[i], x2[i], y2[i], x1[j], y1[j])
+        d4 = orientation(x1[i], y1[i], x2[i], y2[i], x2[j], y2[j])
+        meet = (np.sign(d1) * np.sign(d2) <= 0) & (np.sign(d3) * np.sign(d4) <= 0)
+        #Aligned segments only meet if their boxes overlap
+        aligned = (d1 == 0) & (d2 == 0)
+        meet &= ~aligned | ((xMin[i] <= xMax[j]) & (xMin[j] <= xMax[i]) & \
+            (yMin[i] <= yMax[j]) & (yMin[j] <= yMax[i]))
+        firstI.append(np.minimum(i, j)[meet])
+        firstJ.append(np.maximum(i, j)[meet])
+
+    pairs = np.unique(np.concatenate(firstI) * len(x1) + np.concatenate(firstJ))
+    i, j = pairs // len(x1), pairs % len(x1)
+    d1 = orientation(x1[j], y1[j], x2[j], y2[j], x1[i], y1[i])
+    d2 = orientation(x1[j], y1[j], x2[j], y2[j], x2[i], y2[i])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(d1 != d2, d1 / (d1 - d2), 0.0)
+    return i, j, x1[i] + t*(x2[i] - x1[i]), y1[i] + t*(y2[i] - y1[i])
+
+###   Checks the geometry before it is meshed by gmsh: segments (boundary
+###     edges and hard lines) that cross or touch away from a shared
+###     vertex, and embedded vertices (hard points and vertices of hard
+###     lines) outside the domain bounded by the boundary edges. Vertices
+###     are given by their ids and coordinates, segments by the positions
+###     of their two vertices. Returns a message for each problem found
+def checkTopology(ids, X, Y, segA, segB, boundary, embedded):
+    ids = np.asarray(ids); X = np.asarray(X, dtype=np.float64); Y = np.asarray(Y, dtype=np.float64)
+    segA = np.asarray(segA, dtype=np.int64); segB = np.asarray(segB, dtype=np.int64)
+    boundary = np.asarray(boundary, dtype=bool)
+    embedded = np.asarray(embedded, dtype=np.int64)
+    def vertex(v):
+        return str(ids[v]) + " (" + str(X[v]) + ", " + str(Y[v]) + ")"
+    def segment(s):
+        return ("boundary" if boundary[s] else "line") + " " + vertex(segA[s]) + " - " + vertex(segB[s])
+
+    messages = []
+    i, j, cx, cy = findCrossings(X[segA], Y[segA], X[segB], Y[segB], segA, segB)
+    for s, t, x, y in zip(i, j, cx, cy):
+        messages.append("Crossing at (" + str(round(float(x), 6)) + ", " + str(round(float(y), 6)) + \
+            "): " + segment(s) + " and " + segment(t))
+
+    onBoundary = np.zeros(len(X), dtype=bool)
+    onBoundary[segA[boundary]] = True
+    onBoundary[segB[boundary]] = True
+    embedded = embedded[~onBoundary[embedded]]
+    if boundary.any() and len(embedded) > 0:
+        inside = crossingParity(X[embedded], Y[embedded], X[segA[boundary]], Y[segA[boundary]], \
+            X[segB[boundary]], Y[segB[boundary]])
+        for v in embedded[~inside]:
+            messages.append("Outside of the domain: point " + vertex(v))
+    return messages
+
+###   Checks the whole geometry of a GEO file written by buildGEO.py (see
+###     checkTopology). The lines of the "Line Loop" features are the
+###     boundary, the points and lines "In Surface" are embedded
+@prof.timed
+def checkGEO(pathToGEOFile):
+    return checkFeatures(readGEO(pathToGEOFile))
+
+###   Checks the features of a GEO file as returned by readGEO or parseGEO
+def checkFeatures(geo):
+    ids = geo["pointIDs"]
+    order = np.argsort(ids, kind="stable")
+    def position(pointIDs):
+        where = np.clip(np.searchsorted(ids[order], pointIDs), 0, max(len(ids)-1, 0))
+        return order[where] if len(ids) else where
+
+    known = np.isin(geo["lineA"], ids) & np.isin(geo["lineB"], ids)
+    segA, segB = position(geo["lineA"][known]), position(geo["lineB"][known])
+    lineIDs = geo["lineIDs"][known]
+    boundary = np.isin(lineIDs, geo["loopLines"])
+    embeddedLines = np.isin(lineIDs, geo["surfaceLines"])
+    keep = boundary | embeddedLines
+    pointIDs = geo["surfacePoints"][np.isin(geo["surfacePoints"], ids)]
+    embedded = np.concatenate((position(pointIDs), segA[embeddedLines], segB[embeddedLines]))
+    return checkTopology(ids, geo["X"], geo["Y"], segA[keep], segB[keep], boundary[keep], \
+        np.unique(embedded))
+
+###   Rasterizes polygons with an element size each onto a regular grid.
+###     Returns the cell size, the lower-left corner and, for every cell
+###     whose centre falls inside any polygon, its row, column and the
+###     smallest element size of the polygons that contain it
+def rasterizeSizes(features, sizes, cellSize = None, maxCells = 1000000):
+    allX = np.concatenate([X for rings in features for X, Y in rings])
+    allY = np.concatenate([Y for rings in features for X, Y in rings])
+    x0, x1 = allX.min(), allX.max()
+    y0, y1 = allY.min(), allY.max()
+
+    #Cells as small as the smallest size but never more than maxCells
+    if cellSize is None:
+        cellSize = float(np.min(sizes))
+    cellSize = max(float(cellSize), np.sqrt((x1-x0)*(y1-y0)/float(maxCells)))
+    nCols = max(int(np.ceil((x1-x0)/cellSize)), 1)
+    nRows = max(int(np.ceil((y1-y0)/cellSize)), 1)
+
+    cellR = np.full((nRows, nCols), np.inf)
+    for rings, size in zip(features, sizes):
+        fx = np.concatenate([X for X, Y in rings])
+        fy = np.concatenate([Y for X, Y in rings])
+        c0 = int(np.floor((fx.min()-x0)/cellSize)); c1 = int(np.ceil((fx.max()-x0)/cellSize))
+        r0 = int(np.floor((fy.min()-y0)/cellSize)); r1 = int(np.ceil((fy.max()-y0)/cellSize))
+        cols, rows = np.meshgrid(np.arange(c0, min(c1,nCols)), np.arange(r0, min(r1,nRows)))
+        cx = x0 + (cols.ravel() + 0.5)*cellSize
+        cy = y0 + (rows.ravel() + 0.5)*cellSize
+        inside = pointsInPolygon(cx, cy, rings)
+        r = rows.ravel()[inside]; c = cols.ravel()[inside]
+        cellR[r, c] = np.minimum(cellR[r, c], float(size))
+
+    rows, cols = np.nonzero(np.isfinite(cellR))
+    return cellSize, (x0, y0), rows, cols, cellR[rows, cols]
+
+###   Absolute ids of a list of GEO references such as "P+3, 12" or
+###     "L+0 ... L+48", given the current value of the index variables
+def geoReferences(text, index):
+    ids = []
+    for item in text.split(","):
+        bounds = []
+        for ref in item.split("..."):
+            ref = ref.strip()
+            if not ref:
+                continue
+            if "+" in ref:
+                name, offset = ref.split("+")
+                bounds.append(index.get(name.strip(), 0) + int(offset))
+            else:
+                bounds.append(int(float(ref)))
+        if len(bounds) == 2:
+            ids += list(range(bounds[0], bounds[1]+1))
+        else:
+            ids += bounds
+    return ids
+
+###   Reads the features of a GEO file written by buildGEO.py (see
+###     parseGEO). A missing file has no features
+def readGEO(pathToGEOFile):
+    if not os.path.isfile(pathToGEOFile):
+        return parseGEO([])
+    with fily.openText(pathToGEOFile) as geoFile:
+        return parseGEO(geoFile)
+
+###   Parses the lines of a GEO file written by buildGEO.py. The index
+###     variables (P=1; P = P + 60;) are followed line by line, so the
+###     absolute ids are known. Returns a dictionary with the points (ids,
+###     X and Y), the lines (ids and the ids of their two points), the
+###     lines of the "Line Loop" features and the points and lines
+###     embedded "In Surface"
+def parseGEO(lines):
+    geo = {"pointIDs": [], "X": [], "Y": [], "lineIDs": [], "lineA": [], "lineB": [], \
+        "loopLines": [], "surfacePoints": [], "surfaceLines": []}
+    setIndex = re.compile(r"^\s*(\w+)\s*=\s*(-?\d+)\s*;")
+    addIndex = re.compile(r"^\s*(\w+)\s*=\s*(\w+)\s*\+\s*(-?\d+)\s*;")
+    point = re.compile(r"^\s*Point\s*\(\s*(\w+)\s*\+\s*(\d+)\s*\)\s*=\s*\{([^}]*)\}")
+    segment = re.compile(r"^\s*Line\s*\(\s*(\w+)\s*\+\s*(\d+)\s*\)\s*=\s*\{([^}]*)\}")
+    loop = re.compile(r"^\s*Line\s+Loop\s*\([^)]*\)\s*=\s*\{([^}]*)\}")
+    embedded = re.compile(r"^\s*(Point|Line)\s*\{([^}]*)\}\s*In\s+Surface")
+    index = {}
+    for line in lines:
+        match = point.match(line)
+        if match:
+            values = match.group(3).split(",")
+            geo["pointIDs"].append(index.get(match.group(1), 0) + int(match.group(2)))
+            geo["X"].append(float(values[0]))
+            geo["Y"].append(float(values[1]))
+            continue
+        match = segment.match(line)
+        if match:
+            ends = geoReferences(match.group(3), index)
+            geo["lineIDs"].append(index.get(match.group(1), 0) + int(match.group(2)))
+            geo["lineA"].append(ends[0])
+            geo["lineB"].append(ends[-1])
+            continue
+        match = loop.match(line)
+        if match:
+            geo["loopLines"] += [abs(i) for i in geoReferences(match.group(1), index)]
+            continue
+        match = embedded.match(line)
+        if match:
+            which = "surfacePoints" if match.group(1) == "Point" else "surfaceLines"
+            geo[which] += geoReferences(match.group(2), index)
+            continue
+        match = addIndex.match(line)
+        if match and match.group(1) == match.group(2):
+            index[match.group(1)] = index.get(match.group(1), 0) + int(match.group(3))
+            continue
+        match = setIndex.match(line)
+        if match:
+            index[match.group(1)] = int(match.group(2))
+
+    for key in geo:
+        geo[key] = np.array(geo[key], dtype=np.float64 if key in ["X","Y"] else np.int64)
+    return geo
+
+###   Ids, X and Y of the "Point()" features of a GEO file
+def readGEOPoints(pathToGEOFile):
+    geo = readGEO(pathToGEOFile)
+    return geo["pointIDs"], geo["X"], geo["Y"]
+
+###   Snaps vertices closer than a tolerance to each other and to a set of
+###     old vertices. Returns, for each vertex, the index of the old vertex
+###     it falls on (-1 if none) and the first vertex of its group of
+###     coincident vertices. Groups are chained, so vertices further apart
+###     than the tolerance may be merged through a vertex between them
+def snapVertices(X, Y, tolerance, oldX = None, oldY = None):
+    from scipy.spatial import cKDTree
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    points = np.column_stack((np.asarray(X, dtype=np.float64), np.asarray(Y, dtype=np.float64)))
+    n = len(points)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    #Groups of coincident vertices, each one taken to its first vertex
+    pairs = cKDTree(points).query_pairs(float(tolerance), output_type="ndarray")
+    graph = coo_matrix((np.ones(len(pairs)), (pairs[:,0], pairs[:,1])), shape=(n, n))
+    nGroups, group = connected_components(graph, directed=False)
+    first = np.full(nGroups, n, dtype=np.int64)
+    np.minimum.at(first, group, np.arange(n))
+
+    #Nearest old vertex within the tolerance, shared by the whole group
+    oldIndex = np.full(n, -1, dtype=np.int64)
+    if oldX is not None and len(oldX) > 0:
+        oldPoints = np.column_stack((np.asarray(oldX, dtype=np.float64), np.asarray(oldY, dtype=np.float64)))
+        distance, nearest = cKDTree(oldPoints).query(points, distance_upper_bound=float(tolerance))
+        snapped = np.isfinite(distance)
+        groupOld = np.full(nGroups, -1, dtype=np.int64)
+        groupOld[group[snapped]] = nearest[snapped]
+        oldIndex = groupOld[group]
+    return oldIndex, first[group]
+
+###   Douglas-Peucker simplification of a path with a tolerance for each
+###     vertex. A vertex is kept if it is further than its tolerance from
+###     the segment that would replace it. The first and last vertices are
+###     always kept, so closed rings stay closed. Returns a mask of the
+###     vertices kept
+def simplifyPath(X, Y, tolerance):
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64)
+    tolerance = np.broadcast_to(np.asarray(tolerance, dtype=np.float64), X.shape)
+    keep = np.zeros(len(X), dtype=bool)
+    if len(X) == 0:
+        return keep
+    keep[0] = keep[-1] = True
+
+    stack = [(0, len(X)-1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        dx = X[last] - X[first]
+        dy = Y[last] - Y[first]
+        px = X[first+1:last] - X[first]
+        py = Y[first+1:last] - Y[first]
+        length = np.hypot(dx, dy)
+        if length > 0:
+            distance = np.abs(px*dy - py*dx) / length
+        else:
+            distance = np.hypot(px, py)        #closed ring: distance to its start
+        excess = distance - tolerance[first+1:last]
+        far = int(np.argmax(excess))
+        if excess[far] > 0:
+            keep[first+1+far] = True
+            stack.append((first, first+1+far))
+            stack.append((first+1+far, last))
+    return keep
+
+###   Drops the vertices closer than their tolerance to the previous vertex
+###     kept, so no segment is shorter than it. The last vertex is kept
+def dropShortSegments(X, Y, tolerance, keep):
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64)
+    tolerance = np.broadcast_to(np.asarray(tolerance, dtype=np.float64), X.shape)
+    keep = keep.copy()
+    which = np.flatnonzero(keep)
+    previous = which[0]
+    for i in which[1:-1]:
+        if math.hypot(X[i]-X[previous], Y[i]-Y[previous]) < tolerance[i]:
+            keep[i] = False
+        else:
+            previous = i
+
+    #The last vertex can not be moved, the one before it is dropped instead
+    last = which[-1]
+    if previous != which[0] and math.hypot(X[last]-X[previous], Y[last]-Y[previous]) < tolerance[last]:
+        keep[previous] = False
+    return keep
+
+###   Simplifies the rings or lines of a table written by SHP2GEO.py (-p,
+###     -i or -l modes) in place. The tolerance of each vertex is a factor
+###     of its element size ("Rx_m" or "R_m"), so the boundary is never
+###     described with more detail than the mesh can resolve. Rings that
+###     would be left with less than 3 vertices are not simplified and
+###     "vertex_ind" is numbered again for each feature
+def simplifyTable(pathToTable, factor):
+    import gets
+    names = gets.getFieldNames(pathToTable)
+    if "vertex_ind" not in names:
+        print("in g.simplifyTable\n " + str(pathToTable) + " has no vertex_ind, nothing is simplified\n")
+        return
+    table = simplifyColumns({name: gets.getField(pathToTable, name) for name in names}, factor)
+    fily.writeTable(pathToTable, names, [table[name] for name in names])
+
+###   Simplifies the rings or lines of a table of vertices given as a
+###     dictionary of columns (see simplifyTable). Returns a new table
+def simplifyColumns(table, factor):
+    names = list(table)
+    columns = [table[name] for name in names]
+    rColumnID = "Rx_m" if "Rx_m" in names else "R_m"
+
+    X = np.array(table["X_m"], dtype=np.float64)
+    Y = np.array(table["Y_m"], dtype=np.float64)
+    tolerance = float(factor) * np.array(table[rColumnID], dtype=np.float64)
+    vertexInd = np.array(table["vertex_ind"], dtype=np.float64).astype(np.int64)
+    vertexPar = np.array(table.get("vertex_par", [0]*len(X)), dtype=np.float64).astype(np.int64)
+
+    #A path (ring or line) starts with a new feature or a new part
+    starts = np.flatnonzero((vertexInd == 0) | np.append(True, vertexPar[1:] != vertexPar[:-1]))
+    starts = np.union1d(starts, [0])
+    ends = np.append(starts[1:], len(X))
+
+    keep = np.zeros(len(X), dtype=bool)
+    for start, end in zip(starts, ends):
+        part = slice(start, end)
+        kept = simplifyPath(X[part], Y[part], tolerance[part])
+        kept = dropShortSegments(X[part], Y[part], tolerance[part], kept)
+        closed = X[start] == X[end-1] and Y[start] == Y[end-1]
+        if np.count_nonzero(kept) < (4 if closed else 2):
+            kept[:] = True
+        keep[part] = kept
+
+    #vertex_ind goes from 0 on each feature without gaps
+    feature = np.cumsum(vertexInd == 0)[keep]
+    newInd = np.arange(len(feature)) - np.searchsorted(feature, feature)
+    which = np.flatnonzero(keep)
+    newTable = {}
+    for name, column in zip(names, columns):
+        if name == "vertex_ind":
+            newTable[name] = newInd.tolist()
+        elif isinstance(column, np.ndarray):
+            newTable[name] = column[which]
+        else:
+            newTable[name] = [column[i] for i in which]
+    print("Simplified vertices:  " + str(len(X)) + " > " + str(len(which)))
+    return newTable
@@ -1,12 +1,15 @@
 import sys, os, shutil, csv, re
 from pathlib import Path
+import numpy as np
+import prof, fily
 
 ###   Reads a CSV file and returns a whole row, a whole column or a
 ###     single item
+@prof.timed
 def getCommaFile(fileName, row = -1, col= -1):
     #Reads the CSV file from the given path
     try: 
-        PointFile = open(fileName)
+        PointFile = fily.openText(fileName)
         rawPointFile = list(csv.reader(PointFile))                       
         PointFile.close()
     except FileNotFoundError:
@@ -52,6 +55,39 @@ def getColumn(xID,fileName):
     except ValueError:
         print(str(xID) + " column could not be found")
 
+###   Tells if a table written by SHP2GEO.py is binary (NPZ) instead of CSV
+def isBinaryTable(fileName):
+    return str(fileName).lower().endswith(".npz")
+
+###   Names of the fields (columns) of a CSV or NPZ table
+def getFieldNames(fileName):
+    if isBinaryTable(fileName):
+        try:
+            with np.load(fileName) as table:
+                return list(table.files)
+        except FileNotFoundError:
+            print("NPZ file could not be found")
+            sys.exit("Bye!")
+    return getCommaFile(fileName, row = 0)
+
+###   Returns a whole field (column) of a CSV or NPZ table as a list without
+###     its header. CSV values are strings, NPZ values keep their type
+def getField(fileName, fieldID):
+    if isBinaryTable(fileName):
+        fields = getFieldNames(fileName)
+        if fieldID not in fields:
+            print(str(fieldID) + " column could not be found")
+            return None
+        with np.load(fileName) as table:
+            return table[fieldID].tolist()
+    return getCommaFile(fileName, col = getColumn(fieldID, fileName))[1:]
+
+###   Fields of a CSV or NPZ table as a dictionary of columns (see
+###     getField). Only the fields found among the given ones are read
+def getTable(fileName, fieldIDs):
+    names = getFieldNames(fileName)
+    return {name: getField(fileName, name) for name in fieldIDs if name in names}
+
 ###   Finds the line number where a string is found (needle), similarly 
 ###     to the .sh program "grep"
 def getLineIndex(haystack,needle):
@@ -81,4 +117,22 @@ def filterMSHElement(listElements,dimension = 2):
     for i in range(len(X)):
         if int(X[i]) == dimension :
             filteredElements.append(listElements[i])
-    return filteredElements
\ No newline at end of file
+    return filteredElements
+
+###   Looks for an optional flag among the arguments passed to a script
+###     and removes it (and its value) from the list. Returns the value
+###     of the flag, True for flags without value, or the default value
+def popOption(argList, flag, hasValue = False, default = None):
+    if flag not in argList:
+        return default
+    where = argList.index(flag)
+    if not hasValue:
+        argList.pop(where)
+        return True
+    try:
+        value = argList[where+1]
+    except IndexError:
+        print(str(flag) + " needs a value")
+        sys.exit("Bye!")
+    del argList[where:where+2]
+    return value
@@ -1,6 +1,8 @@
 import sys, os, shutil, re, subprocess
 from pathlib import Path
+import numpy as np
 from fily import touchFile
+import prof
 
 #Import Qgis 
 from qgis.core import *
@@ -10,24 +12,29 @@ from qgis.analysis import *
 from PyQt5.QtCore import QVariant
 
 ##  Start QGIS  ##
-QgsApplication.setPrefixPath('/usr', True)
-QgsApplication.processingRegistry().addProvider(QgsNativeAlgorithms())
-qgs = QgsApplication([], True)
-qgs.initQgis()
+with prof.stage("gis.initQgis"):
+    QgsApplication.setPrefixPath('/usr', True)
+    QgsApplication.processingRegistry().addProvider(QgsNativeAlgorithms())
+    qgs = QgsApplication([], True)
+    qgs.initQgis()
 
 
-#Add plugins and processing algorithms
-sys.path.append('/usr/share/qgis/python/plugins/')
-import processing
-from processing.core.Processing import Processing
+    #Add plugins and processing algorithms
+    sys.path.append('/usr/share/qgis/python/plugins/')
+    import processing
+    from processing.core.Processing import Processing
 
-#Add native functions
-Processing.initialize()
-qgs.processingRegistry().addProvider(QgsNativeAlgorithms())
+    #Add native functions
+    Processing.initialize()
+    qgs.processingRegistry().addProvider(QgsNativeAlgorithms())
 
 #Start QGIS Project
 project = QgsProject.instance()
 
+###   Output of the processing algorithms kept in memory, as a layer
+###     returned to the caller instead of a file (see prep.py)
+memoryOutput = "memory:"
+
 
 ############***#
 
@@ -40,45 +47,56 @@ def checkLayer(layerName):
     else:
         print("Layer loaded sucessfully")
 
+###   Loads and checks a vector layer from a file. A layer already loaded
+###     (e.g., the memory layer returned by a previous step) is taken as it is
+def loadLayer(source, name):
+    if isinstance(source, QgsVectorLayer):
+        return source
+    layer = QgsVectorLayer(str(source), name)
+    checkLayer(layer)
+    return layer
+
 
-###   Takes a polygon SHP and returns a line SHP
+###   Takes a polygon SHP and returns a line SHP (or a memory layer when
+###     outputFile is memoryOutput)
+@prof.timed
 def polyToLine(inputFile,outputFile):
     
     #Load and check polygon layer to environment
-    Outline_PolyLayer = QgsVectorLayer(inputFile, "OutlinePolygon")
-    checkLayer(Outline_PolyLayer)
+    Outline_PolyLayer = loadLayer(inputFile, "OutlinePolygon")
 
     #Convert Polygon to Lines
     params = {
         'INPUT':Outline_PolyLayer, 
         'OUTPUT':outputFile
         }
-    processing.run("native:polygonstolines", params )
+    return processing.run("native:polygonstolines", params )["OUTPUT"]
 
-###   Takes a line SHP and returns its vertices as a points SHP    
+###   Takes a line SHP and returns its vertices as a points SHP (or a
+###     memory layer when outputFile is memoryOutput)
+@prof.timed
 def lineToVertex(inputFile,outputFile):
     
     #Load and check line layer to environment
-    Outline_LineLayer = QgsVectorLayer(inputFile, "OutlineLine")
-    checkLayer(Outline_LineLayer)
+    Outline_LineLayer = loadLayer(inputFile, "OutlineLine")
     
     ##Convert Lines to Vertices
     params = {
         'INPUT':Outline_LineLayer, 
         'OUTPUT':outputFile
         }
-    processing.run("native:extractvertices", params )
+    return processing.run("native:extractvertices", params )["OUTPUT"]
 
 ###   Takes a points SHP and returns a points layer with its coordinates
 ###     as attributes of each feature. [Output should be CSV]
+@prof.timed
 def vertexToXYCSV(inputFile,outputFile):
     
     #Creates an empty SHP file for scratching the X coordinate
     path2VertexX = "../.Temp/3.OutlineVertexX.shp"
 
     #Load input points SHP layer to environment
-    Outline_VertexLayer = QgsVectorLayer(inputFile, "OutlineVertex")
-    checkLayer(Outline_VertexLayer)
+    Outline_VertexLayer = loadLayer(inputFile, "OutlineVertex")
 
     #Calculates the X-coordinates as a new field on a SHP
     params = {'INPUT':Outline_VertexLayer,
@@ -109,22 +127,68 @@ def vertexToXYCSV(inputFile,outputFile):
             }
     processing.run("qgis:fieldcalculator", params )
 
+###   Takes a points SHP (or layer) and returns its coordinates and its
+###     numeric attributes as a dictionary of typed columns (X_m, Y_m and
+###     the fields of the layer). Coordinates keep their full precision
+@prof.timed
+def vertexToArrays(inputFile):
+
+    #Load input points SHP layer to environment
+    Outline_VertexLayer = loadLayer(inputFile, "OutlineVertex")
+
+    names = [field.name() for field in Outline_VertexLayer.fields()]
+    X, Y = [], []
+    columns = [[] for name in names]
+    for feature in Outline_VertexLayer.getFeatures():
+        point = feature.geometry().vertexAt(0)
+        X.append(point.x())
+        Y.append(point.y())
+        for i, value in enumerate(feature.attributes()):
+            columns[i].append(value)
+
+    table = {"X_m": np.array(X, dtype=np.float64), "Y_m": np.array(Y, dtype=np.float64)}
+    for name, values in zip(names, columns):
+        values = [np.nan if value is None or value == NULL else value for value in values]
+        try:
+            column = np.array(values)
+            if column.dtype.kind in "iuf":
+                table[name] = column
+        except (TypeError, ValueError):
+            print("Field " + str(name) + " is not numeric and is not saved")
+    return table
+
+###   Takes a points SHP and writes its coordinates and attributes as typed
+###     columns of a binary NPZ file, read by buildGEO.py with no text 
+###     conversion. Coordinates keep their full precision
+def vertexToNPZ(inputFile,outputFile):
+    np.savez(outputFile, **vertexToArrays(inputFile))
+
+###   Writes the vertices as a CSV (vertexToXYCSV) or as a binary NPZ 
+###     (vertexToNPZ) file, according to the extension of outputFile
+def vertexToTable(inputFile,outputFile):
+    if str(outputFile).lower().endswith(".npz"):
+        vertexToNPZ(inputFile,outputFile)
+    else:
+        vertexToXYCSV(inputFile,outputFile)
+
 ###   Takes a points layer and writes a new points layer with a field Rx_m
 ###     obtained when comparing the R_m specified in the inputFile and the 
 ###     R_m given in mapFile. This is used when different element sizes are
 ###     specified over the computational domain boundary, e.g., inlets.
+###     With outputFile as memoryOutput no scratch files are written
+@prof.timed
 def mapElementSizes(inputFile,mapFile,outputFile):
     
     #Load and checks points layer to environment
-    Outline_VertexLayer = QgsVectorLayer(inputFile, "OutlineVertex")
-    checkLayer(Outline_VertexLayer)
+    Outline_VertexLayer = loadLayer(inputFile, "OutlineVertex")
     
     #Load and checks the element sizes map layer to environment
-    Map_Sizes = QgsVectorLayer(mapFile, "MapElementSize")
-    checkLayer(Map_Sizes)
+    Map_Sizes = loadLayer(mapFile, "MapElementSize")
 
     #Create scratch layer for the Union result
     path2Unioned = "../.Temp/4.Unioned.shp"
+    if outputFile == memoryOutput:
+        path2Unioned = memoryOutput
     
     print("__Something wrong but it works__:")##
     #The R_m attribute for element sizes taken from Map is passed to the 
@@ -135,15 +199,16 @@ def mapElementSizes(inputFile,mapFile,outputFile):
         'OVERLAY_FIELDS_PREFIX':"O_",
         'OUTPUT':path2Unioned
         }
-    processing.run("native:union", params )
+    Unioned = processing.run("native:union", params )["OUTPUT"]
 
     #Load and checks the scratch points layer to environment
-    Unioned_V = QgsVectorLayer(path2Unioned, "UnionedV")
-    checkLayer(Unioned_V)
+    Unioned_V = loadLayer(Unioned, "UnionedV")
 
     #Create another scratch layer for the result of the decision between 
     #   the original element size R_m or the one mapped from mapFile
     path2Calc = "../.Temp/5.RMIN.shp"
+    if outputFile == memoryOutput:
+        path2Calc = memoryOutput
    
     #The decision is the minimal value of R_m 
     params = {'INPUT':Unioned_V,
@@ -155,12 +220,11 @@ def mapElementSizes(inputFile,mapFile,outputFile):
         'FORMULA':"min(R_m,O_R_m)",
         'OUTPUT':path2Calc
             }
-    processing.run("qgis:fieldcalculator", params )
+    RCalc = processing.run("qgis:fieldcalculator", params )["OUTPUT"]
 
     #Load and checks to environment the points layer with the new field 
     #   "Rx_m" that contains the definitive element size attribute
-    RCalc_V = QgsVectorLayer(path2Calc, "RCalculated")
-    checkLayer(RCalc_V)
+    RCalc_V = loadLayer(RCalc, "RCalculated")
 
     #Sorts the values by the "vertex_index" expression to keep the 
     #   topology of the original polygon
@@ -170,9 +234,10 @@ def mapElementSizes(inputFile,mapFile,outputFile):
         'NULLS_FIRST': False,
         'OUTPUT':outputFile
             }
-    processing.run("native:orderbyexpression", params )
+    return processing.run("native:orderbyexpression", params )["OUTPUT"]
 
 ###   Sample data from raster on points
+@prof.timed
 def sampleRaster(inputNodes,rasterFile,outputNodes):
     
     #Gets absolute path. It is necessary to load CSV into QGIS
@@ -181,11 +246,17 @@ def sampleRaster(inputNodes,rasterFile,outputNodes):
     #Load and check input points SHP layer to environment
     csvInputNodes = "file://" + \
         fullInputpath + \
-        "?crs=epsg:3116&delimiter=%s&xField=%s&yField=%s"\
+        "?delimiter=%s&xField=%s&yField=%s"\
         % (",", "Xm", "Ym")
     meshNodes = QgsVectorLayer(csvInputNodes, "points", "delimitedtext")
     checkLayer(meshNodes)
 
+    #Nodes are given in the CRS of the raster (see r.toRasterCRS), so 
+    #   QGIS does not reproject them on the fly
+    rasterCRS = QgsRasterLayer(str(rasterFile), "raster").crs()
+    if rasterCRS.isValid():
+        meshNodes.setCrs(rasterCRS)
+
     #Calculates the Bottom Elevation
     params = {'INPUT':meshNodes,
         'RASTERCOPY': rasterFile,
@@ -195,6 +266,7 @@ def sampleRaster(inputNodes,rasterFile,outputNodes):
     processing.run("qgis:rastersampling", params )
 
 ###   Sample data from a polygon SHP on points 
+@prof.timed
 def rasterPoly(mapFile,outputFile,burnField="FRICTION"):
     touchFile(outputFile)
     
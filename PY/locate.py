@@ -0,0 +1,165 @@
+import sys, os
+import numpy as np
+import prof
+
+###   Average number of triangles per cell of the grid index
+trianglesPerCell = 2.0
+
+###   Largest number of (point, candidate triangle) pairs tested at once
+blockPairs = 8000000
+
+###   Cells of a grid index where points (or box corners) fall
+def gridColumn(grid, X):
+    return np.clip(((X - grid["x0"]) // grid["cell"]).astype(np.int64), 0, grid["nCols"]-1)
+
+def gridRow(grid, Y):
+    return np.clip(((Y - grid["y0"]) // grid["cell"]).astype(np.int64), 0, grid["nRows"]-1)
+
+###   Builds a uniform grid index over the bounding boxes of the triangles
+###     of a mesh (numbered from 1). Each cell lists the triangles whose box
+###     touches it, stored as one array of triangles sorted by cell and the
+###     start of each cell in it
+@prof.timed
+def buildGrid(X, Y, triangles):
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64)
+    t = np.asarray(triangles, dtype=np.int64) - 1
+    xMin, xMax = X[t].min(axis=1), X[t].max(axis=1)
+    yMin, yMax = Y[t].min(axis=1), Y[t].max(axis=1)
+
+    #Cells of about the size of the triangles
+    grid = {"X": X, "Y": Y, "t": t, "x0": xMin.min(), "y0": yMin.min()}
+    width = max(xMax.max() - grid["x0"], 1e-12)
+    height = max(yMax.max() - grid["y0"], 1e-12)
+    grid["cell"] = max(np.sqrt(width*height*trianglesPerCell/len(t)), \
+        float(np.median(np.maximum(xMax-xMin, yMax-yMin))))
+    grid["nCols"] = int(width // grid["cell"]) + 1
+    grid["nRows"] = int(height // grid["cell"]) + 1
+
+    #One (cell, triangle) pair for each cell a box touches
+    c0, c1 = gridColumn(grid, xMin), gridColumn(grid, xMax)
+    r0, r1 = gridRow(grid, yMin), gridRow(grid, yMax)
+    nc = c1 - c0 + 1
+    counts = nc * (r1 - r0 + 1)
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    nc = np.repeat(nc, counts)
+    cells = (np.repeat(r0, counts) + k // nc) * grid["nCols"] + np.repeat(c0, counts) + k % nc
+
+    order = np.argsort(cells, kind="stable")
+    grid["triangles"] = np.repeat(np.arange(len(t)), counts)[order]
+    grid["starts"] = np.searchsorted(cells[order], np.arange(grid["nRows"]*grid["nCols"] + 1))
+    return grid
+
+###   Barycentric weights of points in triangles (indices from 0)
+def barycentric(grid, px, py, triangle):
+    t = grid["t"][triangle]
+    tx = grid["X"][t]
+    ty = grid["Y"][t]
+    x13 = tx[:,0] - tx[:,2]; x32 = tx[:,2] - tx[:,1]
+    y23 = ty[:,1] - ty[:,2]; y31 = ty[:,2] - ty[:,0]
+    dx = px - tx[:,2]; dy = py - ty[:,2]
+    w = np.empty((len(t), 3))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        det = y23*x13 - x32*y31
+        np.divide(y23*dx + x32*dy, det, out=w[:,0])
+        np.divide(y31*dx + x13*dy, det, out=w[:,1])
+    np.subtract(1.0 - w[:,0], w[:,1], out=w[:,2])
+    return w
+
+###   Finds the triangle (index from 0) of each point and its barycentric
+###     weights. Every point is tested against all the triangles of its
+###     cell at once. Points out of the mesh get -1 and NaN weights
+@prof.timed
+def locatePoints(grid, px, py, tolerance = 1e-9):
+    px = np.asarray(px, dtype=np.float64)
+    py = np.asarray(py, dtype=np.float64)
+    found = np.full(len(px), -1, dtype=np.int64)
+    weights = np.full((len(px), 3), np.nan)
+
+    which = np.flatnonzero((px >= grid["x0"]) & (py >= grid["y0"]) & \
+        (px <= grid["x0"] + grid["nCols"]*grid["cell"]) & \
+        (py <= grid["y0"] + grid["nRows"]*grid["cell"]))
+    cells = gridRow(grid, py[which]) * grid["nCols"] + gridColumn(grid, px[which])
+
+    #Points sorted by cell, so the triangles are read in order
+    order = np.argsort(cells)
+    which, cells = which[order], cells[order]
+    counts = grid["starts"][cells+1] - grid["starts"][cells]
+
+    #Points are taken in blocks so the pairs fit in memory
+    step = max(1, int(blockPairs // max(counts.mean() if len(counts) else 1, 1)))
+    for first in range(0, len(which), step):
+        block = slice(first, first+step)
+        n = counts[block]
+        point = np.repeat(which[block], n)
+        k = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        triangle = grid["triangles"][np.repeat(grid["starts"][cells[block]], n) + k]
+        w = barycentric(grid, np.repeat(px[which[block]], n), np.repeat(py[which[block]], n), triangle)
+        inside = np.all(w >= -tolerance, axis=1)
+
+        #First triangle that contains each point. Pairs of a point are
+        #   next to each other
+        hit = np.flatnonzero(inside)
+        hit = hit[np.append(True, point[hit[1:]] != point[hit[:-1]])]
+        found[point[hit]] = triangle[hit]
+        weights[point[hit]] = w[hit]
+    return found, weights
+
+###   Interpolates the values of the nodes of a mesh (N or N x k array) at
+###     located points. Points out of the mesh get NaN
+def interpolate(grid, values, found, weights):
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:,None]
+    result = np.full((len(found), values.shape[1]), np.nan)
+    inside = found >= 0
+    t = grid["t"][found[inside]]
+    w = weights[inside]
+    result[inside] = w[:,0,None]*values[t[:,0]] + w[:,1,None]*values[t[:,1]] + \
+        w[:,2,None]*values[t[:,2]]
+    return result
+
+###   Values of the nearest node of the mesh, for points out of it
+def nearestValues(grid, values, px, py):
+    from scipy.spatial import cKDTree
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:,None]
+    distance, nearest = cKDTree(np.column_stack((grid["X"], grid["Y"]))).query( \
+        np.column_stack((px, py)))
+    return values[nearest]
+
+###   Keys of points quantized to cells of side quantum, so points that did
+###     not move get the same key. Returns the cells and a 64-bit hash of them
+def quantizedKeys(X, Y, quantum):
+    qx = np.round(np.asarray(X, dtype=np.float64) / quantum).astype(np.int64)
+    qy = np.round(np.asarray(Y, dtype=np.float64) / quantum).astype(np.int64)
+    with np.errstate(over="ignore"):
+        return qx, qy, mixBits(mixBits(qx.view(np.uint64)) ^ qy.view(np.uint64))
+
+###   Scrambles the bits of 64-bit integers (the finalizer of splitmix64), so
+###     cells of a regular grid do not share keys
+def mixBits(h):
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+###   Finds the nodes of a mesh in the nodes of a reference mesh (e.g., the
+###     mesh before re-meshing) by the hash of their quantized coordinates.
+###     The hashes of the reference are sorted and searched at once, and
+###     the cells are compared to rule out collisions. Returns the index
+###     of the reference node of each node, -1 if it is new or moved
+@prof.timed
+def matchNodes(X, Y, refX, refY, quantum = 1e-6):
+    qx, qy, keys = quantizedKeys(X, Y, quantum)
+    rx, ry, refKeys = quantizedKeys(refX, refY, quantum)
+    found = np.full(len(keys), -1, dtype=np.int64)
+    if len(refKeys) == 0:
+        return found
+    order = np.argsort(refKeys, kind="stable")
+    sortedKeys = refKeys[order]
+    at = np.minimum(np.searchsorted(sortedKeys, keys), len(order)-1)
+    candidate = order[at]
+    same = (sortedKeys[at] == keys) & (rx[candidate] == qx) & (ry[candidate] == qy)
+    found[same] = candidate[same]
+    return found
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+#
+#////////////////////////////////////////////////////////////////////////
+#                                                                       #
+#                                 mapT3S.py                             #
+#                                                                       #
+#////////////////////////////////////////////////////////////////////////
+#
+# Author:     Edwin
+#
+# Works on:   python3
+#
+# Purpose:    Script takes in a T3S mesh with attributes and interpolates
+#             them linearly (barycentric weights of the triangle where each
+#             point falls) on gauge points or on the nodes of another mesh.
+#             Triangles are found through a grid index over their bounding
+#             boxes, so no raster is needed in between.
+#
+# Needs:      Python3, sys, os, numpy, scipy
+#
+# Usage:      python3 mapT3S.py <source.t3s> <target> <output>
+#                 [--trace <trace.json>]
+#
+# where:
+# --> source.t3s: T3S mesh whose attributes are interpolated
+#
+# --> target    : a CSV file of points (fields "X_m","Y_m", "Xm","Ym" or the
+#                 first two columns), or a MSH or T3S mesh.
+#
+# --> output    : for points, a CSV file with the coordinates and the
+#                 attributes, empty out of the source mesh. For meshes, a
+#                 T3S file; nodes out of the source mesh take the values of
+#                 its nearest node.
+#
+#////////////////////////////////////////////////////////////////////////
+
+import sys, os
+import numpy as np
+
+#import own functions
+import prof, gets
+prof.enable(gets.popOption(sys.argv,"--trace",True))
+import fily, build, msh, locate
+
+#Retrieve path of files from the arguments passed to the script
+pathToSource = str(sys.argv[1])             #T3S  input file
+pathToTarget = str(sys.argv[2])             #CSV, MSH or T3S input file
+pathToOutput = str(sys.argv[3])             #CSV or T3S output file
+
+#Source mesh and its grid index
+X, Y, triangles, values, names = msh.readT3S(pathToSource)
+grid = locate.buildGrid(X, Y, triangles)
+
+if fily.plainName(pathToTarget).lower().endswith((".msh",".t3s")):
+    #Nodes of the new mesh
+    px, py, newTriangles, oldValues, oldNames = msh.readMesh(pathToTarget)
+    found, weights = locate.locatePoints(grid, px, py)
+    newValues = locate.interpolate(grid, values, found, weights)
+    outside = found < 0
+    if outside.any():
+        newValues[outside] = locate.nearestValues(grid, values, px[outside], py[outside])
+
+    #Write T3S File
+    attributes = [" ".join(map(str, row)) for row in newValues.tolist()]
+    fily.resetFile(pathToOutput,"T3S")
+    Header_T3S = build.buildT3S_Header(len(px),len(newTriangles),\
+        [str(i+1) for i in range(len(names))],names)
+    fily.appendFile(Header_T3S,pathToOutput,True)
+    fily.appendFile(build.buildT3S_3Col(px,py,attributes),pathToOutput)
+    fily.appendFile(build.buildT3S_3Col(newTriangles[:,0],newTriangles[:,1],newTriangles[:,2]),pathToOutput)
+else:
+    #Gauge points
+    header = gets.getFieldNames(pathToTarget)
+    for xID, yID in (("X_m","Y_m"), ("Xm","Ym"), (header[0], header[1])):
+        if xID in header and yID in header:
+            break
+    px = np.array(gets.getField(pathToTarget,xID), dtype=np.float64)
+    py = np.array(gets.getField(pathToTarget,yID), dtype=np.float64)
+    found, weights = locate.locatePoints(grid, px, py)
+    newValues = locate.interpolate(grid, values, found, weights)
+
+    #Write CSV File
+    rows = [",".join([str(px[i]), str(py[i])] + \
+        (["" for name in names] if found[i] < 0 else [str(v) for v in newValues[i]])) \
+        for i in range(len(px))]
+    fily.resetFile(pathToOutput,"T3S")
+    fily.appendFile([",".join([xID, yID] + names)] + rows,pathToOutput)
+
+print("mapT3S ~OK~: " + str(pathToSource) + " > " + str(pathToOutput) + \
+    " (" + str(int(np.count_nonzero(found >= 0))) + " of " + str(len(found)) + " inside)")
@@ -0,0 +1,146 @@
+import sys, os
+import numpy as np
+import gets, prof
+
+###   gmsh is optional. Without it the GEO files of buildGEO.py are meshed
+###     with the gmsh binary as before
+try:
+    import gmsh
+except (ImportError, OSError):
+    gmsh = None
+
+###   Tells if the gmsh python module can be used
+def hasGmsh():
+    return gmsh is not None
+
+###   Reads the columns of a CSV (or NPZ) file written by SHP2GEO.py as
+###     arrays. Missing columns are not returned
+def readGEOCSV(pathToCSVFile, columns):
+    header = gets.getFieldNames(pathToCSVFile)
+    table = {}
+    for columnID in columns:
+        if columnID in header:
+            table[columnID] = np.array(gets.getField(pathToCSVFile,columnID), dtype=np.float64)
+    return table
+
+###   Boundary rings as (X, Y, R) arrays, one per "vertex_par". As in
+###     buildGEO.py the last vertex of each ring is dropped, since it
+###     repeats the first one
+def boundaryRings(table):
+    rColumnID = "Rx_m" if "Rx_m" in table else "R_m"
+    part = table["vertex_par"]
+    rings = []
+    for hole in np.unique(part):
+        which = np.flatnonzero(part == hole)[:-1]
+        rings.append((table["X_m"][which], table["Y_m"][which], table[rColumnID][which]))
+    return rings
+
+###   Hard lines as (X, Y, R) arrays, one per "DN" in order of appearance
+def hardLines(table):
+    lineCol = table["DN"]
+    unique, first = np.unique(lineCol, return_index=True)
+    lines = []
+    for line in unique[np.argsort(first)]:
+        which = np.flatnonzero(lineCol == line)
+        lines.append((table["X_m"][which], table["Y_m"][which], table["R_m"][which]))
+    return lines
+
+###   Checks the boundary rings, hard points and hard lines (see
+###     geom.checkTopology) before they are meshed. Vertices are named by
+###     their input and position, e.g. ring0:12, point:3 or line2:7, and
+###     vertices at the same coordinates are taken as the same vertex
+def checkInput(rings, points = None, lines = None):
+    import geom
+    names, X, Y, segA, segB, boundary, embedded = [], [], [], [], [], [], []
+    for r, (RX, RY, R) in enumerate(rings):
+        first, n = len(X), len(RX)
+        names += ["ring" + str(r) + ":" + str(k) for k in range(n)]
+        X += list(RX); Y += list(RY)
+        segA += [first + k for k in range(n)]
+        segB += [first + (k+1) % n for k in range(n)]
+        boundary += [True]*n
+    if points is not None:
+        names += ["point:" + str(k) for k in range(len(points[0]))]
+        embedded += list(range(len(X), len(X) + len(points[0])))
+        X += list(points[0]); Y += list(points[1])
+    for l, (LX, LY, R) in enumerate(lines or []):
+        first, n = len(X), len(LX)
+        names += ["line" + str(l) + ":" + str(k) for k in range(n)]
+        embedded += list(range(first, first + n))
+        X += list(LX); Y += list(LY)
+        segA += [first + k for k in range(n-1)]
+        segB += [first + k + 1 for k in range(n-1)]
+        boundary += [False]*(n-1)
+
+    #Vertices at the same coordinates are replaced by the first of them
+    unique, firstAt, inverse = np.unique(np.column_stack((X, Y)), axis=0, \
+        return_index=True, return_inverse=True)
+    same = firstAt[inverse.ravel()]
+    return geom.checkTopology(np.array(names), X, Y, same[np.array(segA, dtype=np.int64)], \
+        same[np.array(segB, dtype=np.int64)], boundary, same[np.array(embedded, dtype=np.int64)])
+
+###   Meshes the computational domain with the gmsh python module. Takes
+###     the boundary rings, hard points (X, Y, R) and hard lines and
+###     returns the nodes (N x 2) and triangles (M x 3, numbered from 1 as
+###     in the MSH and T3S files). The GEO (as .geo_unrolled) and MSH (v2)
+###     files are only written if their paths are given
+@prof.timed
+def meshInMemory(rings, points = None, lines = None, geoFile = None, mshFile = None):
+    if gmsh is None:
+        print("in m.meshInMemory\n the gmsh python module could not be imported\n")
+        sys.exit("Bye!")
+
+    gmsh.initialize()
+    try:
+        gmsh.option.setNumber("General.Terminal", 0)
+        gmsh.model.add("Preprocess2D")
+        geo = gmsh.model.geo
+
+        #Boundary: one curve loop per ring, the first one is the outline
+        loops = []
+        for X, Y, R in rings:
+            pointTags = [geo.addPoint(X[i], Y[i], 0.0, R[i]) for i in range(len(X))]
+            lineTags = [geo.addLine(pointTags[i], pointTags[(i+1) % len(pointTags)]) \
+                for i in range(len(pointTags))]
+            loops.append(geo.addCurveLoop(lineTags))
+        surface = geo.addPlaneSurface(loops)
+
+        #Hard points and hard lines are embedded in the surface
+        embeddedPoints = []
+        if points is not None:
+            X, Y, R = points
+            embeddedPoints = [geo.addPoint(X[i], Y[i], 0.0, R[i]) for i in range(len(X))]
+        embeddedLines = []
+        for X, Y, R in (lines or []):
+            pointTags = [geo.addPoint(X[i], Y[i], 0.0, R[i]) for i in range(len(X))]
+            embeddedLines += [geo.addLine(pointTags[i], pointTags[i+1]) \
+                for i in range(len(pointTags)-1)]
+
+        geo.synchronize()
+        if embeddedPoints:
+            gmsh.model.mesh.embed(0, embeddedPoints, 2, surface)
+        if embeddedLines:
+            gmsh.model.mesh.embed(1, embeddedLines, 2, surface)
+
+        if geoFile is not None:
+            gmsh.write(str(geoFile) if str(geoFile).endswith(".geo_unrolled") \
+                else str(geoFile) + "_unrolled")
+
+        gmsh.model.mesh.generate(2)
+
+        if mshFile is not None:
+            gmsh.option.setNumber("Mesh.MshFileVersion", 2.2)
+            gmsh.write(str(mshFile))
+
+        #Nodes and triangles as arrays, renumbered from 1 without gaps
+        nodeTags, coords, _ = gmsh.model.mesh.getNodes()
+        elementTags, elementNodes = gmsh.model.mesh.getElementsByType(2)
+    finally:
+        gmsh.finalize()
+
+    nodeTags = np.asarray(nodeTags, dtype=np.int64)
+    order = np.argsort(nodeTags)
+    nodes = np.asarray(coords, dtype=np.float64).reshape(-1,3)[order,:2]
+    triangles = np.searchsorted(nodeTags[order], \
+        np.asarray(elementNodes, dtype=np.int64)).reshape(-1,3) + 1
+    return nodes, triangles
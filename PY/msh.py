@@ -0,0 +1,404 @@
+import sys, os, mmap
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import prof, fily
+
+###   ASCII sections smaller than this are parsed on a single process,
+###     starting the process pool would take longer than the parsing
+minBytesPerWorker = 4 * 2**20
+
+###   Number of nodes of each gmsh element type (only the ones a 2D mesh
+###     may contain)
+nodesPerType = {1: 2, 2: 3, 3: 4, 4: 4, 5: 8, 6: 6, 7: 5, 8: 3, 9: 6, \
+    10: 9, 11: 10, 15: 1, 16: 8, 20: 9, 21: 10}
+
+###   Reads the $MeshFormat section of a MSH file. Returns the version as
+###     a float, the file type (0 ASCII, 1 binary) and the data size
+def readMeshFormat(pathToFile):
+    try:
+        with fily.openBinary(pathToFile) as mshFile:
+            if mshFile.readline().strip() != b"$MeshFormat":
+                print("in m.readMeshFormat\n " + str(pathToFile) + " has no $MeshFormat\n")
+                sys.exit("Bye!")
+            words = mshFile.readline().split()
+    except FileNotFoundError:
+        print("in m.readMeshFormat\n " + str(pathToFile) + " could not be found\n")
+        sys.exit("Bye!")
+    return float(words[0]), int(words[1]), int(words[2])
+
+###   Maps the whole file in memory (read only). Compressed files are
+###     read uncompressed into memory instead
+def mapFile(pathToFile):
+    if fily.compression(pathToFile) is not None:
+        return fily.readBytes(pathToFile)
+    with open(pathToFile,"rb") as mshFile:
+        return mmap.mmap(mshFile.fileno(), 0, access=mmap.ACCESS_READ)
+
+###   Byte offset right after the line of a section header, e.g. "$Nodes",
+###     looking from a given offset on
+def sectionStart(mapped, name, start = 0):
+    header = name.encode("ascii") + b"\n"
+    if start == 0 and mapped[:len(header)] == header:
+        return len(header)
+    where = mapped.find(b"\n" + header, max(start-1, 0))
+    if where < 0:
+        print("in m.sectionStart\n " + str(name) + " could not be found\n")
+        sys.exit("Bye!")
+    return where + len(name) + 2
+
+###   Reads an ASCII line from the mapped file. Returns its words and the
+###     offset of the next line
+def readLine(mapped, offset):
+    end = mapped.find(b"\n", offset)
+    return mapped[offset:end].split(), end + 1
+
+###   Byte order of a binary MSH file, from the integer 1 written after
+###     the $MeshFormat line
+def binaryOrder(mapped):
+    offset = sectionStart(mapped, "$MeshFormat")
+    words, offset = readLine(mapped, offset)
+    one = np.frombuffer(mapped, dtype="<i4", count=1, offset=offset)[0]
+    return "<" if one == 1 else ">"
+
+###   Binary MSH v2. Nodes are records of an int tag and three doubles and
+###     elements come in blocks of records with the same type and number
+###     of tags. Nodes and triangles are views on the mapped file
+def readBinaryV2(mapped):
+    order = binaryOrder(mapped)
+
+    offset = sectionStart(mapped, "$Nodes")
+    words, offset = readLine(mapped, offset)
+    nNodes = int(words[0])
+    nodeType = np.dtype([("tag", order+"i4"), ("xyz", order+"f8", (3,))])
+    nodes = np.frombuffer(mapped, dtype=nodeType, count=nNodes, offset=offset)
+
+    offset = sectionStart(mapped, "$Elements", offset + nodeType.itemsize*nNodes)
+    words, offset = readLine(mapped, offset)
+    nElements = int(words[0])
+    triangles = []
+    read = 0
+    while read < nElements:
+        elmType, nFollow, nTags = np.frombuffer(mapped, dtype=order+"i4", count=3, offset=offset)
+        offset += 12
+        nVertex = nodesPerType[int(elmType)]
+        recordType = np.dtype([("tag", order+"i4"), ("tags", order+"i4", (int(nTags),)), \
+            ("nodes", order+"i4", (nVertex,))])
+        block = np.frombuffer(mapped, dtype=recordType, count=int(nFollow), offset=offset)
+        if elmType == 2:
+            triangles.append(block["nodes"])
+        offset += recordType.itemsize * int(nFollow)
+        read += int(nFollow)
+
+    return nodes["tag"], nodes["xyz"][:,0], nodes["xyz"][:,1], joinBlocks(triangles, 3)
+
+###   Binary MSH v4.1. Nodes and elements come in entity blocks, tags are
+###     size_t (8 bytes) and the coordinates of a block follow its tags
+def readBinaryV4(mapped, dataSize = 8):
+    order = binaryOrder(mapped)
+    sizeT = order + ("u8" if dataSize == 8 else "u4")
+    intT = order + "i4"
+
+    offset = sectionStart(mapped, "$Nodes")
+    nBlocks, nNodes, minTag, maxTag = np.frombuffer(mapped, dtype=sizeT, count=4, offset=offset)
+    offset += 4*dataSize
+    tags, X, Y = [], [], []
+    for block in range(int(nBlocks)):
+        entityDim, entityTag, parametric = np.frombuffer(mapped, dtype=intT, count=3, offset=offset)
+        offset += 12
+        nInBlock = int(np.frombuffer(mapped, dtype=sizeT, count=1, offset=offset)[0])
+        offset += dataSize
+        tags.append(np.frombuffer(mapped, dtype=sizeT, count=nInBlock, offset=offset))
+        offset += dataSize*nInBlock
+        nCoords = 3 + (int(entityDim) if parametric else 0)
+        xyz = np.frombuffer(mapped, dtype=order+"f8", count=nCoords*nInBlock, \
+            offset=offset).reshape(-1, nCoords)
+        X.append(xyz[:,0]); Y.append(xyz[:,1])
+        offset += 8*nCoords*nInBlock
+
+    offset = sectionStart(mapped, "$Elements", offset)
+    nBlocks, nElements, minTag, maxTag = np.frombuffer(mapped, dtype=sizeT, count=4, offset=offset)
+    offset += 4*dataSize
+    triangles = []
+    for block in range(int(nBlocks)):
+        entityDim, entityTag, elmType = np.frombuffer(mapped, dtype=intT, count=3, offset=offset)
+        offset += 12
+        nInBlock = int(np.frombuffer(mapped, dtype=sizeT, count=1, offset=offset)[0])
+        offset += dataSize
+        nVertex = nodesPerType[int(elmType)]
+        records = np.frombuffer(mapped, dtype=sizeT, count=(1+nVertex)*nInBlock, \
+            offset=offset).reshape(-1, 1+nVertex)
+        if elmType == 2:
+            triangles.append(records[:,1:])
+        offset += dataSize*(1+nVertex)*nInBlock
+
+    return joinBlocks(tags, 0), joinBlocks(X, 0), joinBlocks(Y, 0), joinBlocks(triangles, 3)
+
+###   ASCII MSH v4.1. Sections are turned into one array of numbers and
+###     walked block by block as in the binary version
+def readASCIIv4(mapped):
+    start = sectionStart(mapped, "$Nodes")
+    numbers = np.array(mapped[start:mapped.find(b"$EndNodes", start)].split(), dtype=np.float64)
+    nBlocks = int(numbers[0])
+    at = 4
+    tags, X, Y = [], [], []
+    for block in range(nBlocks):
+        entityDim, parametric, nInBlock = int(numbers[at]), int(numbers[at+2]), int(numbers[at+3])
+        at += 4
+        tags.append(numbers[at:at+nInBlock].astype(np.int64))
+        at += nInBlock
+        nCoords = 3 + (entityDim if parametric else 0)
+        xyz = numbers[at:at+nCoords*nInBlock].reshape(-1, nCoords)
+        X.append(xyz[:,0]); Y.append(xyz[:,1])
+        at += nCoords*nInBlock
+
+    start = sectionStart(mapped, "$Elements")
+    numbers = np.array(mapped[start:mapped.find(b"$EndElements", start)].split(), dtype=np.int64)
+    nBlocks = int(numbers[0])
+    at = 4
+    triangles = []
+    for block in range(nBlocks):
+        elmType, nInBlock = int(numbers[at+2]), int(numbers[at+3])
+        at += 4
+        nVertex = nodesPerType[elmType]
+        records = numbers[at:at+(1+nVertex)*nInBlock].reshape(-1, 1+nVertex)
+        if elmType == 2:
+            triangles.append(records[:,1:])
+        at += (1+nVertex)*nInBlock
+
+    return joinBlocks(tags, 0), joinBlocks(X, 0), joinBlocks(Y, 0), joinBlocks(triangles, 3)
+
+###   Splits the byte range [start, end) of a file into chunks that start
+###     and end on line breaks
+def lineChunks(mapped, start, end, nChunks):
+    bounds = [start]
+    for i in range(1, nChunks):
+        cut = mapped.find(b"\n", start + (end-start)*i//nChunks, end)
+        if cut < 0:
+            break
+        if cut + 1 > bounds[-1]:
+            bounds.append(cut + 1)
+    if bounds[-1] < end:
+        bounds.append(end)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+###   Reads a byte range of a file (or of a file already in memory)
+def readBytes(pathToFile, start, end):
+    if not isinstance(pathToFile, str):
+        return pathToFile[start:end]
+    with open(pathToFile,"rb") as mshFile:
+        mshFile.seek(start)
+        return mshFile.read(end - start)
+
+###   Parses the node lines "tag x y z" of a chunk of an ASCII v2 file
+def parseNodeChunk(pathToFile, start, end):
+    numbers = np.fromstring(readBytes(pathToFile, start, end), dtype=np.float64, sep=" ")
+    numbers = numbers.reshape(-1, 4)
+    return numbers[:,0].astype(np.int64), numbers[:,1].copy(), numbers[:,2].copy()
+
+###   Parses the element lines "tag type ntags <tags> <nodes>" of a chunk of
+###     an ASCII v2 file and returns its triangles. Lines have different
+###     lengths, so the first number of each line is found from the bytes
+def parseElementChunk(pathToFile, start, end):
+    data = readBytes(pathToFile, start, end)
+    if not data.strip():
+        return np.zeros((0,3), dtype=np.int64)
+    numbers = np.fromstring(data, dtype=np.int64, sep=" ")
+
+    #Tokens start where a non blank byte follows a blank one
+    raw = np.frombuffer(data, dtype=np.uint8)
+    blank = (raw == 32) | (raw == 9) | (raw == 10) | (raw == 13)
+    tokenStart = ~blank & np.concatenate(([True], blank[:-1]))
+    lineStart = np.concatenate(([0], np.flatnonzero(raw[:-1] == 10) + 1))
+    tokensPerLine = np.add.reduceat(tokenStart, lineStart, dtype=np.int64)
+    tokensPerLine = tokensPerLine[tokensPerLine > 0]
+    firstToken = np.concatenate(([0], np.cumsum(tokensPerLine)[:-1]))
+
+    isTriangle = numbers[firstToken+1] == 2
+    first = firstToken[isTriangle]
+    nodes = first + 3 + numbers[first+2]
+    return np.column_stack((numbers[nodes], numbers[nodes+1], numbers[nodes+2]))
+
+###   Runs a chunk parser over line-aligned chunks of a section, on a pool
+###     of processes when the section is large enough. Compressed files
+###     are parsed from memory on this process. With chunkBytes, the
+###     section is cut in chunks of at most that size and the parsed
+###     chunks are yielded one at a time (in order), so they are not all
+###     held in memory at once
+def parseSection(pathToFile, mapped, start, end, parser, workers, chunkBytes = None):
+    if fily.compression(pathToFile) is not None:
+        pathToFile, workers = mapped, 1
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(int(workers), (end - start) // minBytesPerWorker))
+    nChunks = workers
+    if chunkBytes is not None:
+        nChunks = max(workers, -(-(end - start) // int(chunkBytes)))
+    chunks = lineChunks(mapped, start, end, nChunks)
+    if workers == 1 or len(chunks) == 1:
+        parsed = (parser(pathToFile, a, b) for a, b in chunks)
+        return parsed if chunkBytes is not None else list(parsed)
+    if chunkBytes is not None:
+        return parseInOrder(pathToFile, chunks, parser, workers)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(parser, [pathToFile]*len(chunks), \
+            [a for a, b in chunks], [b for a, b in chunks]))
+
+###   Parses chunks on a pool of processes, with at most two chunks per
+###     process waiting, and yields them in order
+def parseInOrder(pathToFile, chunks, parser, workers):
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        waiting = []
+        for a, b in chunks:
+            waiting.append(pool.submit(parser, pathToFile, a, b))
+            if len(waiting) >= 2*workers:
+                yield waiting.pop(0).result()
+        for future in waiting:
+            yield future.result()
+
+###   Array stored in a .npy file of a scratch folder and mapped in memory,
+###     for the out-of-core mode of MSH2T3S.py
+def diskArray(scratch, name, shape, dtype):
+    os.makedirs(scratch, exist_ok=True)
+    return np.lib.format.open_memmap(os.path.join(scratch, name + ".npy"), \
+        mode="w+", shape=shape, dtype=dtype)
+
+###   ASCII MSH v2 parsed in chunks of chunkBytes straight into arrays
+###     mapped from a scratch folder. The number of nodes and elements is
+###     read from the section headers, so the arrays are made beforehand
+def readASCIIv2OnDisk(mapped, pathToFile, workers, scratch, chunkBytes):
+    start = sectionStart(mapped, "$Nodes")
+    words, start = readLine(mapped, start)
+    end = mapped.find(b"$EndNodes", start)
+    nNodes = int(words[0])
+    nodeTags = diskArray(scratch, "nodeTags", (nNodes,), np.int64)
+    X = diskArray(scratch, "X", (nNodes,), np.float64)
+    Y = diskArray(scratch, "Y", (nNodes,), np.float64)
+    nRead = 0
+    for tags, x, y in parseSection(pathToFile, mapped, start, end, parseNodeChunk, workers, chunkBytes):
+        nodeTags[nRead:nRead+len(tags)], X[nRead:nRead+len(tags)], Y[nRead:nRead+len(tags)] = tags, x, y
+        nRead += len(tags)
+    if nRead != nNodes:
+        print("in m.readASCIIv2OnDisk\n " + str(nRead) + " nodes read out of " + str(nNodes) + "\n")
+
+    start = sectionStart(mapped, "$Elements", end)
+    words, start = readLine(mapped, start)
+    end = mapped.find(b"$EndElements", start)
+    triangles = diskArray(scratch, "triangles", (int(words[0]), 3), np.int64)
+    at = 0
+    for block in parseSection(pathToFile, mapped, start, end, parseElementChunk, workers, chunkBytes):
+        triangles[at:at+len(block)] = block
+        at += len(block)
+    return nodeTags[:nRead], X[:nRead], Y[:nRead], triangles[:at]
+
+###   ASCII MSH v2. The node and element sections are located by byte
+###     offset, split into line-aligned chunks and parsed in parallel
+def readASCIIv2(mapped, pathToFile, workers = None):
+    start = sectionStart(mapped, "$Nodes")
+    words, start = readLine(mapped, start)
+    end = mapped.find(b"$EndNodes", start)
+    parts = parseSection(pathToFile, mapped, start, end, parseNodeChunk, workers)
+    nodeTags = joinBlocks([p[0] for p in parts], 0)
+    X = joinBlocks([p[1] for p in parts], 0)
+    Y = joinBlocks([p[2] for p in parts], 0)
+    if len(nodeTags) != int(words[0]):
+        print("in m.readASCIIv2\n " + str(len(nodeTags)) + " nodes read out of " + \
+            str(int(words[0])) + "\n")
+
+    start = sectionStart(mapped, "$Elements", end)
+    words, start = readLine(mapped, start)
+    end = mapped.find(b"$EndElements", start)
+    parts = parseSection(pathToFile, mapped, start, end, parseElementChunk, workers)
+    triangles = joinBlocks([p for p in parts if len(p)], 3)
+    return nodeTags, X, Y, triangles
+
+###   Joins the arrays read from several blocks. A single block is
+###     returned as it is, so it stays a view on the mapped file
+def joinBlocks(blocks, width):
+    if len(blocks) == 1:
+        return blocks[0]
+    if len(blocks) == 0:
+        return np.zeros((0, width) if width else 0, dtype=np.int64)
+    return np.concatenate(blocks)
+
+###   Renumbers the nodes from 1 without gaps, in the order of their tags,
+###     as the T3S file needs. Nothing is copied if tags already are 1..N
+def renumberNodes(nodeTags, X, Y, triangles):
+    nodeTags = np.asarray(nodeTags)
+    n = len(nodeTags)
+    if n > 0 and nodeTags[0] == 1 and nodeTags[-1] == n and np.all(np.diff(nodeTags) == 1):
+        return X, Y, triangles
+    order = np.argsort(nodeTags, kind="stable")
+    sortedTags = nodeTags[order]
+    triangles = np.searchsorted(sortedTags, triangles).astype(np.int64) + 1
+    return np.asarray(X)[order], np.asarray(Y)[order], triangles
+
+###   Reads the nodes and triangles of an ASCII (v2 or v4.1) or a binary 
+###     (v2 or v4.1) MSH file. Returns X, Y (numpy arrays) and the triangles
+###     as a M x 3 array of node numbers starting at 1. ASCII v2 files are
+###     parsed on "workers" processes (all the CPU cores by default). With
+###     a scratch folder, ASCII v2 files are parsed in chunks of chunkBytes
+###     into arrays mapped from it (binary files are always mapped)
+@prof.timed
+def readMSH(pathToFile, workers = None, scratch = None, chunkBytes = 64 * 2**20):
+    version, fileType, dataSize = readMeshFormat(pathToFile)
+    mapped = mapFile(pathToFile)
+
+    if fileType == 0 and version < 3.0 and scratch is not None:
+        nodeTags, X, Y, triangles = readASCIIv2OnDisk(mapped, pathToFile, workers, scratch, chunkBytes)
+    elif fileType == 0 and version < 3.0:
+        nodeTags, X, Y, triangles = readASCIIv2(mapped, pathToFile, workers)
+    elif fileType == 1 and version < 3.0:
+        nodeTags, X, Y, triangles = readBinaryV2(mapped)
+    elif fileType == 1 and version >= 4.1:
+        nodeTags, X, Y, triangles = readBinaryV4(mapped, dataSize)
+    elif fileType == 0 and version >= 4.1:
+        nodeTags, X, Y, triangles = readASCIIv4(mapped)
+    else:
+        print("in m.readMSH\n MSH version " + str(version) + " is not supported\n")
+        sys.exit("Bye!")
+    return renumberNodes(nodeTags, X, Y, triangles)
+
+###   Reads a T3S file written by MSH2T3S.py (or BlueKenue). Returns X, Y,
+###     the triangles (numbered from 1), the attributes of the nodes as a
+###     N x k array and their names. The whole body is parsed as one
+###     array of numbers, the number of attributes is taken from its size
+@prof.timed
+def readT3S(pathToFile):
+    try:
+        mapped = mapFile(pathToFile)
+    except FileNotFoundError:
+        print("in m.readT3S\n " + str(pathToFile) + " could not be found\n")
+        sys.exit("Bye!")
+    end = mapped.find(b":EndHeader")
+    if end < 0:
+        print("in m.readT3S\n " + str(pathToFile) + " has no :EndHeader\n")
+        sys.exit("Bye!")
+
+    nNodes, nElements, names = 0, 0, []
+    for line in mapped[:end].decode("ascii", "replace").splitlines():
+        words = line.split()
+        if not words:
+            continue
+        if words[0] == ":NodeCount":
+            nNodes = int(words[1])
+        elif words[0] == ":ElementCount":
+            nElements = int(words[1])
+        elif words[0] == ":AttributeName":
+            names.append(" ".join(words[2:]))
+
+    numbers = np.fromstring(mapped[mapped.find(b"\n", end)+1:], dtype=np.float64, sep=" ")
+    nAttributes = (len(numbers) - 3*nElements) // max(nNodes, 1) - 2
+    nodes = numbers[:nNodes*(2+nAttributes)].reshape(nNodes, 2+nAttributes)
+    triangles = numbers[nNodes*(2+nAttributes):].reshape(nElements, 3).astype(np.int64)
+    if len(names) != nAttributes:
+        names = ["ATTRIBUTE " + str(i+1) for i in range(nAttributes)]
+    return nodes[:,0].copy(), nodes[:,1].copy(), triangles, nodes[:,2:].copy(), names
+
+###   Reads the nodes and triangles of a MSH or T3S file. Returns X, Y, the
+###     triangles, the attributes of the nodes (none for MSH files) and
+###     their names
+def readMesh(pathToFile, workers = None):
+    if fily.plainName(pathToFile).lower().endswith(".t3s"):
+        return readT3S(pathToFile)
+    X, Y, triangles = readMSH(pathToFile, workers)
+    return X, Y, triangles, np.zeros((len(X), 0)), []
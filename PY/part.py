@@ -0,0 +1,102 @@
+import sys, os
+import numpy as np
+import prof
+
+###   Bits per coordinate of the Hilbert curve used to order the elements
+hilbertOrder = 16
+
+###   Position along a Hilbert curve of points given as integer cells of a
+###     2^order x 2^order grid. Each step of the curve swaps and/or mirrors
+###     the quadrant below it, so the walk is a machine of 4 states. The
+###     states and digits are tabulated for 4 bits of each coordinate at a
+###     time, and all the points are walked at once through the tables
+def hilbertTables(bits = 4):
+    nStates = 4                       #bit 0: mirrored, bit 1: swapped
+    digits = np.zeros((nStates, 1 << (2*bits)), dtype=np.int64)
+    states = np.zeros((nStates, 1 << (2*bits)), dtype=np.int64)
+    for state in range(nStates):
+        for key in range(1 << (2*bits)):
+            x, y = key >> bits, key & ((1 << bits) - 1)
+            current, digit = state, 0
+            for b in range(bits-1, -1, -1):
+                rx, ry = (x >> b) & 1, (y >> b) & 1
+                if current & 2:
+                    rx, ry = ry, rx
+                if current & 1:
+                    rx, ry = 1 - rx, 1 - ry
+                digit = (digit << 2) | ((3 * rx) ^ ry)
+                if ry == 0:
+                    current ^= 2 | rx
+            digits[state, key] = digit
+            states[state, key] = current
+    return digits, states
+
+hilbertDigits, hilbertStates = hilbertTables()
+
+###   Hilbert index of each point, 8 bits of the index per step
+def hilbertIndex(ix, iy, order = hilbertOrder):
+    ix = np.asarray(ix, dtype=np.int64)
+    iy = np.asarray(iy, dtype=np.int64)
+    index = np.zeros(len(ix), dtype=np.int64)
+    state = np.zeros(len(ix), dtype=np.int64)
+    nibbles = -(-order // 4)
+    for step in range(nibbles-1, -1, -1):
+        key = (((ix >> (4*step)) & 15) << 4) | ((iy >> (4*step)) & 15)
+        index = (index << 8) | hilbertDigits[state, key]
+        state = hilbertStates[state, key]
+    return index
+
+###   Splits the triangles of a mesh into nParts subdomains of the same
+###     number of elements. Elements are ordered along a Hilbert curve
+###     through their centroids and the curve is cut in nParts pieces, so
+###     each subdomain is compact. Element indices start at 1. Returns the
+###     subdomain (from 0) of each element
+@prof.timed
+def partitionElements(X, Y, triangles, nParts):
+    t = np.asarray(triangles, dtype=np.int64) - 1
+    cx = (X[t[:,0]] + X[t[:,1]] + X[t[:,2]]) / 3.0
+    cy = (Y[t[:,0]] + Y[t[:,1]] + Y[t[:,2]]) / 3.0
+
+    #Centroids on a grid of 2^order cells, keeping the aspect of the mesh
+    cells = (1 << hilbertOrder) - 1
+    span = max(cx.max() - cx.min(), cy.max() - cy.min(), 1e-12)
+    ix = np.floor((cx - cx.min()) / span * cells).astype(np.int64)
+    iy = np.floor((cy - cy.min()) / span * cells).astype(np.int64)
+
+    order = np.argsort(hilbertIndex(ix, iy))
+    elementPart = np.empty(len(t), dtype=np.int64)
+    elementPart[order] = np.arange(len(t)) * int(nParts) // max(len(t), 1)
+    return elementPart
+
+###   Subdomain of each node: the smallest subdomain of the elements it
+###     belongs to. Nodes of elements of several subdomains are the
+###     interface nodes and are also returned as a mask
+def partitionNodes(triangles, elementPart, nNodes):
+    t = np.asarray(triangles, dtype=np.int64) - 1
+    parts = np.repeat(elementPart, 3)
+    lowest = np.full(nNodes, np.iinfo(np.int64).max)
+    highest = np.full(nNodes, -1)
+    np.minimum.at(lowest, t.ravel(), parts)
+    np.maximum.at(highest, t.ravel(), parts)
+    lowest[highest < 0] = 0               #nodes without elements
+    return lowest, (highest >= 0) & (highest != lowest)
+
+###   Writes the elements and nodes (numbered from 1, as in the T3S file)
+###     of each subdomain to <base>_part<p>.elems and <base>_part<p>.nodes.
+###     Interface nodes are listed by every subdomain they belong to
+@prof.timed
+def writePartitions(basePath, triangles, elementPart, nParts):
+    t = np.asarray(triangles, dtype=np.int64)
+    order = np.argsort(elementPart, kind="stable")
+    bounds = np.searchsorted(elementPart[order], np.arange(int(nParts)+1))
+    width = len(str(int(nParts)-1))
+    files = []
+    for p in range(int(nParts)):
+        elements = order[bounds[p]:bounds[p+1]]
+        nodes = np.unique(t[elements].ravel())
+        name = str(basePath) + "_part" + str(p).zfill(width)
+        for extension, ids in ((".elems", elements + 1), (".nodes", nodes)):
+            with open(name + extension, "w") as outFile:
+                outFile.write("\n".join(map(str, ids.tolist())) + "\n")
+        files.append(name)
+    return files
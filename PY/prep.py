@@ -0,0 +1,625 @@
+import sys, os
+import numpy as np
+import prof, fily, gets, build, geom
+
+###   Preprocess2D as functions that take and return arrays, so a long
+###     running process (daemon.py, a service...) runs the steps of
+###     SHP2GEO.py, buildGEO.py and MSH2T3S.py with no process or file in
+###     between. Those scripts only read their arguments and call these
+###     functions. QGIS (gis.py) is only imported, and started, by the
+###     steps that need it, and the modules of MSH2T3S.py (rast, msh...)
+###     by its steps, so buildGEO.py does not load scipy
+###
+###       table = prep.extractBoundary("Boundary.shp","heteropolygon","Sizes.shp")
+###       geo = prep.buildGEO(table,points=prep.extractBoundary("Points.shp","vertices"))
+###       mesh = prep.mshToT3S("mesh.msh",bottom="dem.tif",native=True)
+
+###   Temporal folder of the steps that go through files (QGIS)
+tempFolder = "../.Temp"
+
+###   Written at the end of each block appended to a GEO file
+endOfBlock = "//END OF BLOCK//\n\n\n"
+paragraphSeparator = ["\n","/**********************************/"]
+
+###   Bytes per node held at once by the out-of-core mode of mshToT3S,
+###     for the arrays and the T3S lines of a chunk
+bytesPerRow = 1024
+
+###   Modes of SHP2GEO.py and the vertices they take from the SHP file
+shpModes = {"-p": "polygon", "--polygon": "polygon", "-i": "heteropolygon", \
+    "--heteropolygon": "heteropolygon", "-l": "line", "--line": "line", \
+    "-v": "vertices", "--vertices": "vertices"}
+
+#////////////////////////////////////////////////////////////////////////
+#   SHP2GEO.py
+#////////////////////////////////////////////////////////////////////////
+
+###   Runs the QGIS steps of SHP2GEO.py from a SHP file (polygons, lines or
+###     points) to a layer of its vertices. The layers between the steps
+###     are kept in memory, or written to the temporal folder when
+###     inMemory is False. Returns the layer (or file) of the vertices
+def shpVertices(inputFile, mode = "polygon", sizeMap = None, inMemory = True):
+    import gis
+    mode = shpModes.get(str(mode).lower(), str(mode).lower())
+    if mode not in shpModes.values():
+        print("in p.shpVertices\n Unrecognized mode:  " + str(mode) + "\n")
+        sys.exit("Bye!")
+    if mode == "heteropolygon" and sizeMap is None:
+        print("in p.shpVertices\n the heteropolygon mode needs a map of element sizes\n")
+        sys.exit("Bye!")
+    if mode == "vertices":
+        return inputFile
+
+    path2Line = path2Vertex = path2UnionV = gis.memoryOutput
+    if not inMemory:
+        path2Line = tempFolder + "/1.OutlineLine.shp"           #Outline Line SHP path
+        path2Vertex = tempFolder + "/2.OutlineVertex.shp"       #Outline Vertices SHP path
+        path2UnionV = tempFolder + "/3.VertexMapped.shp"        #Mapped Vertices SHP path
+        fily.touchFile(path2Line)
+        fily.touchFile(path2Vertex)
+
+    lines = inputFile
+    if mode in ["polygon","heteropolygon"]:
+        lines = gis.polyToLine(inputFile,path2Line)             #SHP Polygon   >> SHP Lines
+    vertices = gis.lineToVertex(lines,path2Vertex)              #SHP Lines     >> SHP Vertices
+    if mode == "heteropolygon":
+        vertices = gis.mapElementSizes(vertices,sizeMap,path2UnionV)
+    return vertices
+
+###   Vertices of the boundary polygons (polygon, heteropolygon), the hard
+###     lines (line) or the hard points (vertices) of a SHP file, as a
+###     dictionary of columns (X_m, Y_m, R_m, vertex_ind...) with the
+###     coordinates at full precision. No file is written. See SHP2GEO.py
+###     for the modes and simplify
+@prof.timed
+def extractBoundary(inputFile, mode = "polygon", sizeMap = None, simplify = None):
+    import gis
+    mode = shpModes.get(str(mode).lower(), str(mode).lower())
+    table = gis.vertexToArrays(shpVertices(inputFile,mode,sizeMap))
+    if simplify is not None and mode != "vertices" and "vertex_ind" in table:
+        table = geom.simplifyColumns(table,float(simplify))
+    return table
+
+###   Same as extractBoundary, but written as a CSV (or NPZ) table by QGIS,
+###     the way SHP2GEO.py does. The .prj file (CRS) of the SHP file is
+###     copied next to it
+@prof.timed
+def shpToTable(inputFile, outputFile, mode = "polygon", sizeMap = None, simplify = None):
+    import gis
+    mode = shpModes.get(str(mode).lower(), str(mode).lower())
+    fily.touchFile(outputFile)
+    vertices = shpVertices(inputFile,mode,sizeMap,False)
+    gis.vertexToTable(vertices,outputFile)                      #SHP Vertices  >> CVS XY Vertices
+    if simplify is not None and mode != "vertices":
+        geom.simplifyTable(outputFile,float(simplify))
+    fily.copyCRS(inputFile,outputFile)
+    return outputFile
+
+#////////////////////////////////////////////////////////////////////////
+#   buildGEO.py
+#////////////////////////////////////////////////////////////////////////
+
+###   Text of a list of GEO lines, as fily.appendFile writes them
+def geoText(lines):
+    return "".join(str(line) + "\n" for line in lines)
+
+###   A column of a table (list or array) as a list of python values
+def columnList(column):
+    return column.tolist() if hasattr(column,"tolist") else list(column)
+
+###   GEO features of the boundary of the computational domain, from a
+###     table of SHP2GEO.py -p or -i (see buildGEO.py -b): the points and
+###     lines of each ring, its "Line Loop" and one "Plane Surface"
+def geoBoundary(table):
+    #Element sizes of SHP2GEO -i ("Rx_m") or -p ("R_m")
+    rColumnID = "Rx_m" if "Rx_m" in table else "R_m"
+    xCoord = columnList(table["X_m"])
+    yCoord = columnList(table["Y_m"])
+    zCoord = ["0.00"] * (len(xCoord))
+    iCoord = columnList(table["vertex_ind"])
+    rCoord = columnList(table[rColumnID])
+    holeCol = columnList(table["vertex_par"])
+
+    #Identify rings on the computational domain
+    holeListID = list(set(holeCol))
+    holeListID.sort()
+    holeIndex = []
+    for hole in holeListID :
+        holeIndex.append(holeCol.index(hole))
+    holeIndex.append(len(holeCol))
+
+    #Build an independent polygon for each ring found on the topology
+    text = ""
+    for hole in range(len(holeListID)) :
+        # Construction of "Point()" GEO-features
+        start = holeIndex[hole]
+        end   = holeIndex[hole+1]-1
+        text += geoText(build.buildGEOPoints(xCoord[start:end],yCoord[start:end],\
+            zCoord[start:end],iCoord[start:end],rCoord[start:end]))
+
+        # Construction of "Line()" GEO-features
+        LINES1 = list(iCoord[start:end])
+        LINES2 = list((iCoord[start+1:end]))+[iCoord[start]]
+        INDEXLINES = list(range(start,end))
+        text += geoText(build.buildGEOLines(INDEXLINES,LINES1,LINES2))
+
+        # Construction of "Line Loop()" GEO-features
+        text += geoText(["\nLine Loop (LL+" + str(hole) + ") = {L+" + \
+            str(min(INDEXLINES)) + " ... L+" + str(max(INDEXLINES)) + "};"])
+        text += geoText(paragraphSeparator)
+
+    # Construction of "Plane Surface()" GEO-feature. Only one is required to
+    #   define the whole computational domain
+    GEO_Surface = ["Plane Surface (PS+1) = {LL+" + str(int(float(min(iCoord)))) + \
+        " ... " + "LL+" + str(len(holeListID)-1) + "};\n"]
+    text += geoText(GEO_Surface)
+
+    # Update indeces starting point
+    text += geoText(paragraphSeparator)
+    text += build.addLastIndex("P",str(len(xCoord)),True)
+    text += build.addLastIndex("L",str(max(INDEXLINES)),True)
+    text += build.addLastIndex("L",str(1),True)
+    text += build.addLastIndex("LL",str(hole),True)
+    text += build.addLastIndex("PS",str(len(GEO_Surface)),True)
+    text += geoText(paragraphSeparator)
+    return text
+
+###   GEO features of the hard points of a table of SHP2GEO.py -v (see
+###     buildGEO.py -p). With snap, points closer than it to a point of
+###     geo (the features of the GEO file so far, see geom.parseGEO) or
+###     to a previous hard point are dropped (and no feature is written if
+###     none is left)
+def geoPoints(table, snap = None, geo = None):
+    xCoord = columnList(table["X_m"])
+    yCoord = columnList(table["Y_m"])
+    zCoord = ["0.00"] * (len(xCoord))
+    rCoord = columnList(table["R_m"])
+
+    #Drop hard points that fall on a point of the GEO file or on a
+    #   previous hard point
+    if snap is not None:
+        geo = geom.parseGEO([]) if geo is None else geo
+        oldIndex, first = geom.snapVertices(xCoord,yCoord,float(snap),geo["X"],geo["Y"])
+        keep = np.flatnonzero((oldIndex < 0) & (first == np.arange(len(first))))
+        print("Snapped hard points:  " + str(len(xCoord)-len(keep)) + " of " + str(len(xCoord)))
+        xCoord = [xCoord[i] for i in keep]
+        yCoord = [yCoord[i] for i in keep]
+        zCoord = [zCoord[i] for i in keep]
+        rCoord = [rCoord[i] for i in keep]
+
+    #Nothing to add if all the hard points were snapped
+    if not xCoord:
+        return geoText(paragraphSeparator)
+
+    #Overwrite point indices
+    iCoord = list(range(len(xCoord)))
+
+    # Construction of "Point()" and "Point in Surface" GEO-features
+    GEO_Points = build.buildGEOPoints(xCoord,yCoord,zCoord,iCoord,rCoord)
+    text = geoText(GEO_Points)
+    text += geoText(["Point {P+1 ... P+" + str(max(iCoord)) + "} In Surface { 1 } ;\n"])
+
+    # Update indeces starting point
+    text += geoText(paragraphSeparator)
+    text += build.addLastIndex("P",str(len(GEO_Points)),True)
+    text += geoText(paragraphSeparator)
+    return text
+
+###   GEO features of the hard lines of a table of SHP2GEO.py -l (see
+###     buildGEO.py -l), one line for each "DN". With snap, vertices closer
+###     than it to a point of geo (see geoPoints) or to each other are
+###     merged and segments that collapse are removed
+def geoLines(table, snap = None, geo = None):
+    lineColID = "DN"
+    xCoord = columnList(table["X_m"])
+    yCoord = columnList(table["Y_m"])
+    zCoord = ["0.00"] * (len(xCoord))
+    rCoord = columnList(table["R_m"])
+    iCoord = [int(float(i)) for i in columnList(table["vertex_ind"])]
+    lineCol = columnList(table[lineColID])
+    if snap is not None:
+        return geoSnappedLines(xCoord,yCoord,zCoord,rCoord,lineCol,float(snap),geo)
+
+    #Get a list of unique line identifiers and the lines in the table
+    #   where they start and end
+    lineListID = build.setColumn(lineCol)
+    lineIndex = []
+    for line in lineListID :
+        lineIndex.append(lineCol.index(line))
+    lineIndex.append(len(lineCol))
+
+    #Build an independent line for each line found on the table
+    text = ""
+    for line in range(len(lineListID)) :
+        # Construction of "Point()" GEO-features
+        start = lineIndex[line]
+        end   = lineIndex[line+1]
+        text += geoText(build.buildGEOPoints(xCoord[start:end],yCoord[start:end],\
+            zCoord[start:end],iCoord[start:end],rCoord[start:end]))
+
+        # Construction of "Line()" GEO-features
+        LINES1 = list(iCoord[start:end-1])
+        LINES2 = list(iCoord[start+1:end])
+        INDEXLINES = list(iCoord[start:end-1])
+        text += geoText(build.buildGEOLines(INDEXLINES,LINES1,LINES2))
+
+        # Construction of "Line in Surface" GEO-features
+        text += geoText(["Line {L+" + str(INDEXLINES[0]) + " ... L+" + \
+            str(INDEXLINES[-1]) + "} In Surface { 1 } ;\n"])
+
+        # Update indeces starting point
+        text += geoText(paragraphSeparator)
+        text += build.addLastIndex("P",str(INDEXLINES[-1]),True)
+        text += build.addLastIndex("P",str(2),True)
+        text += build.addLastIndex("L",str(INDEXLINES[-1]),True)
+        text += build.addLastIndex("L",str(1),True)
+        text += geoText(paragraphSeparator)
+    return text
+
+###   Hard lines with their vertices snapped (see geoLines). Vertices on a
+###     point of the GEO file keep its id, the other ones are merged and
+###     numbered from P+0 in order of appearance
+def geoSnappedLines(xCoord, yCoord, zCoord, rCoord, lineCol, snap, geo = None):
+    geo = geom.parseGEO([]) if geo is None else geo
+    oldIndex, first = geom.snapVertices(xCoord,yCoord,snap,geo["X"],geo["Y"])
+    keep = np.flatnonzero((oldIndex < 0) & (first == np.arange(len(first))))
+    number = np.zeros(len(first), dtype=np.int64)
+    number[keep] = np.arange(len(keep))
+    pointRefs = [str(geo["pointIDs"][oldIndex[i]]) if oldIndex[i] >= 0 else \
+        "P+" + str(number[first[i]]) for i in range(len(first))]
+    print("Snapped line vertices:  " + str(len(xCoord)-len(keep)) + " of " + str(len(xCoord)))
+
+    text = geoText(build.buildGEOPoints([xCoord[i] for i in keep],[yCoord[i] for i in keep],\
+        [zCoord[i] for i in keep],range(len(keep)),[rCoord[i] for i in keep]))
+
+    #Vertices grouped by line in one pass, lines in order of appearance
+    lineIDs, firstVertex, lineOf = np.unique(np.asarray(lineCol), return_index=True, \
+        return_inverse=True)
+    lineOf = lineOf.ravel()
+    byLine = np.argsort(lineOf, kind="stable")
+    lineStart = np.searchsorted(lineOf[byLine], np.arange(len(lineIDs)+1))
+
+    #Segments of each line, without the collapsed or repeated ones
+    nLines = 0
+    segments = set()
+    for line in np.argsort(firstVertex, kind="stable"):
+        vertices = byLine[lineStart[line]:lineStart[line+1]].tolist()
+        LINES1, LINES2 = [], []
+        for k in range(len(vertices)-1):
+            p1 = pointRefs[vertices[k]]
+            p2 = pointRefs[vertices[k+1]]
+            if p1 == p2 or (p1, p2) in segments or (p2, p1) in segments:
+                continue
+            segments.add((p1, p2))
+            LINES1.append(p1)
+            LINES2.append(p2)
+        if not LINES1:
+            continue
+        INDEXLINES = list(range(nLines, nLines+len(LINES1)))
+        nLines += len(LINES1)
+        text += geoText(build.buildGEOLines(INDEXLINES,LINES1,LINES2,True))
+
+        # Construction of "Line in Surface" GEO-features
+        text += geoText(["Line {L+" + str(INDEXLINES[0]) + " ... L+" + \
+            str(INDEXLINES[-1]) + "} In Surface { 1 } ;\n"])
+
+    # Update indeces starting point
+    text += geoText(paragraphSeparator)
+    text += build.addLastIndex("P",str(len(keep)),True)
+    text += build.addLastIndex("L",str(nLines),True)
+    text += geoText(paragraphSeparator)
+    return text
+
+###   Background mesh from the element size polygons of a table of
+###     SHP2GEO.py -p (see buildGEO.py -s). Returns the GEO text that
+###     merges the view from posName, the lines of the POS view and the
+###     number of polygons and cells
+def geoSizeMap(table, posName, cellSize = None):
+    #Split the vertices into polygons, each one with its own element size
+    rCoord = columnList(table["R_m"])
+    features, starts = geom.splitPolygons(np.array(table["X_m"],dtype=float),\
+        np.array(table["Y_m"],dtype=float),np.array(table["vertex_ind"],dtype=float),\
+        np.array(table["vertex_par"],dtype=float))
+    sizes = [float(rCoord[start]) for start in starts]
+
+    #Rasterize the polygons as a POS view
+    cell, origin, rows, cols, values = geom.rasterizeSizes(features,sizes,\
+        None if cellSize is None else float(cellSize))
+    posLines = build.buildPOSView(cell,origin,rows,cols,values)
+
+    # Background mesh from the last merged view
+    text = geoText(["Merge \"" + os.path.basename(str(posName)) + "\";",\
+        "Background Mesh View[PostProcessing.NbViews-1];"])
+    text += geoText(paragraphSeparator)
+    return text, posLines, len(features), len(rows)
+
+###   Builds a whole GEO file in memory from the tables of extractBoundary
+###     (or of SHP2GEO.py): the boundary, then the hard points, the hard
+###     lines and the background mesh of the element size polygons, the
+###     same as buildGEO.py -b, -p, -l and -s run one after the other.
+###     Returns a dictionary with the text of the GEO file ("geo"), the
+###     lines of the POS view ("pos", written by the caller to posName)
+###     and, with check, the topology problems found ("problems")
+@prof.timed
+def buildGEO(boundary, points = None, lines = None, sizeMap = None, posName = "sizes.pos", \
+    cellSize = None, snap = None, check = False):
+    text = fily.geoHeader + geoBoundary(boundary) + endOfBlock
+    if points is not None:
+        geo = geom.parseGEO(text.splitlines(True)) if snap is not None else None
+        text += geoPoints(points,snap,geo) + endOfBlock
+    if lines is not None:
+        geo = geom.parseGEO(text.splitlines(True)) if snap is not None else None
+        text += geoLines(lines,snap,geo) + endOfBlock
+    posLines = None
+    if sizeMap is not None:
+        sizeText, posLines, nPolygons, nCells = geoSizeMap(sizeMap,posName,cellSize)
+        text += sizeText + endOfBlock
+    result = {"geo": text, "pos": posLines}
+    if check:
+        result["problems"] = geom.checkFeatures(geom.parseGEO(text.splitlines(True)))
+    return result
+
+#////////////////////////////////////////////////////////////////////////
+#   MSH2T3S.py
+#////////////////////////////////////////////////////////////////////////
+
+###   Node coordinates in the CRS of a raster, transformed in one batch.
+###     Without native, a temporal CSV file with them is saved once per
+###     CRS for QGIS. The coordinates are kept with it, so their id is
+###     not taken by other ones
+def nodesInCRS(run, rasterFile):
+    import rast
+    X, Y = rast.toRasterCRS(run["X"],run["Y"],run["crs"],rasterFile,run["meshKey"])
+    if run["native"]:
+        return X, Y, None
+    if id(X) not in run["nodeFiles"]:
+        os.makedirs(tempFolder, exist_ok=True)
+        csvFilePath = tempFolder + "/CSV" + str(len(run["nodeFiles"])) + ".csv"
+        fily.resetFile(csvFilePath,"T3S")
+        fily.appendFile(build.buildCSV_2Col(X,Y),csvFilePath,False)
+        run["nodeFiles"][id(X)] = (X, csvFilePath)
+    return X, Y, run["nodeFiles"][id(X)][1]
+
+###   Samples a raster on the mesh nodes, with tiff.py (native) or QGIS.
+###     A comma separated list of rasters is sampled as one mosaic. Out of
+###     core, the nodes are sampled in chunks into a mapped column
+def sampleNodes(run, rasterFile, label):
+    import rast, msh
+    rasterFiles = str(rasterFile).split(",")
+    if run["chunkRows"] is not None:
+        column = msh.diskArray(run["scratch"],label,(len(run["X"]),),np.float64)
+        return rast.sampleChunked(run["X"],run["Y"],rasterFiles,column,run["chunkRows"],run["crs"])
+    if len(rasterFiles) > 1:
+        return rast.sampleMosaic(run["X"],run["Y"],rasterFiles,run["crs"],run["meshKey"])
+    xRaster, yRaster, csvFilePath = nodesInCRS(run,rasterFile)
+    if run["native"]:
+        return rast.samplePoints(xRaster,yRaster,rasterFile)
+    import gis
+    sampledFile = tempFolder + "/Sampled" + label + ".csv"
+    gis.sampleRaster(csvFilePath,rasterFile,sampledFile)
+    return rast.toFloats(gets.getCommaFile(sampledFile,col=2)[1:])
+
+###   File next to a T3S file with the nodes of each attribute that were
+###     filled from other nodes (see fillColumn), not sampled. It is only
+###     written when some node was filled or the mesh reused another one
+def filledFile(pathToT3SFile):
+    return os.path.splitext(fily.plainName(str(pathToT3SFile)))[0] + ".filled.npz"
+
+###   Matches the nodes of the mesh with the nodes of a reference mesh (a
+###     T3S file or a previous result of mshToT3S) through the hash of
+###     their coordinates quantized to quantum. Returns the reference node
+###     of each node (-1 if it is new or moved), the reference columns by
+###     name, the reference nodes filled in each column and the new nodes
+def matchReference(run, reference, quantum):
+    import msh, locate
+    if isinstance(reference, dict):
+        refX, refY = reference["X"], reference["Y"]
+        values = dict(zip(reference["names"], reference["columns"]))
+        filled = reference.get("filled", {})
+        source = "the reference mesh"
+    else:
+        refX, refY, triangles, attributes, names = msh.readT3S(str(reference))
+        values = {name: attributes[:,i] for i, name in enumerate(names)}
+        filled = {}
+        if os.path.isfile(filledFile(reference)):
+            with np.load(filledFile(reference)) as table:
+                filled = {name: table[name] for name in table.files}
+        else:
+            print("No " + filledFile(reference) + ", all the values of the reference " + \
+                "are taken as sampled")
+        source = str(reference)
+    index = locate.matchNodes(run["X"],run["Y"],refX,refY,float(quantum))
+    new = np.flatnonzero(index < 0)
+    nReused = len(index) - len(new)
+    print("Reused nodes:  " + str(nReused) + " of " + str(len(index)) + " (" + \
+        str(round(100.0*nReused/max(len(index),1),2)) + " %) from " + source + ", " + \
+        str(len(new)) + " new or moved nodes sampled")
+    return {"index": index, "new": new, "values": values, "filled": filled}
+
+###   Column of an attribute sampled from a raster. With a reference mesh,
+###     the nodes found in it take its values and only the other ones are
+###     sampled, along with the nodes whose reference value was filled
+###     (they are filled again once the column is whole, see fillColumn)
+def reusedColumn(run, name, rasterFile, label):
+    import msh
+    reference = run["reference"]
+    if reference is None or name not in reference["values"]:
+        return sampleNodes(run,rasterFile,label)
+    if run["chunkRows"] is not None:
+        column = msh.diskArray(run["scratch"],label,(len(run["X"]),),np.float64)
+    else:
+        column = np.empty(len(run["X"]))
+    index = reference["index"]
+    refFilled = np.zeros(len(reference["values"][name]), dtype=bool)
+    refFilled[np.asarray(reference["filled"].get(name, []), dtype=np.int64)] = True
+    reused = (index >= 0) & ~refFilled[index]
+    column[reused] = np.asarray(reference["values"][name],dtype=np.float64)[index[reused]]
+
+    sampled = np.flatnonzero(~reused)
+    if len(sampled) > len(reference["new"]):
+        print(str(len(sampled) - len(reference["new"])) + " nodes filled in the reference " + \
+            "were sampled again for " + str(name))
+    if len(sampled) > 0:
+        newRun = dict(run, X=np.asarray(run["X"])[sampled], Y=np.asarray(run["Y"])[sampled], \
+            meshKey=None)
+        column[sampled] = sampleNodes(newRun,rasterFile,"New" + label)
+    return column
+
+###   BOTTOM of the nodes: the DEM sampled under them or, with zonal, its
+###     average over their dual cells. Dual cells change when any node
+###     around moves, so zonal values are never taken from a reference
+def sampleBottom(run, rasterFile, zonal):
+    import rast
+    if not zonal:
+        return reusedColumn(run,"BOTTOM",rasterFile,"Bottom")
+    xRaster, yRaster, csvFilePath = nodesInCRS(run,rasterFile)
+    t = run["triangles"]
+    return rast.zonalMean(xRaster,yRaster,t[:,0],t[:,1],t[:,2],rasterFile)
+
+###   Raster of the friction. Polygon SHP files are rasterized to avoid
+###     repeated values, GeoTIFF files are used as they are
+def frictionRaster(run, pathToFRIFile):
+    if os.path.splitext(str(pathToFRIFile))[1].lower() in [".tif",".tiff"]:
+        return pathToFRIFile
+    if run["native"]:
+        print("in p.frictionRaster\n native sampling needs the friction as a GeoTIFF: " + \
+            str(pathToFRIFile) + "\n")
+        sys.exit("Bye!")
+    import gis
+    os.makedirs(tempFolder, exist_ok=True)
+    rasterizedFrictionFile = tempFolder + "/SampledFriction.tif"
+    gis.rasterPoly(pathToFRIFile,rasterizedFrictionFile,"FRICTION")
+    return rasterizedFrictionFile
+
+###   Fills the nodes of a sampled column that fell on nodata pixels or
+###     outside the raster. Out of core, the column is filled in place.
+###     The filled nodes are kept in run["filled"] by label
+def fillColumn(run, values, label):
+    import rast
+    values = np.asarray(values,dtype=np.float64)
+    run["filled"][label] = np.flatnonzero(np.isnan(values))
+    values, nFilled = rast.fillNodata(run["X"],run["Y"],values,run["idw"],chunkRows=run["chunkRows"])
+    if nFilled > 0:
+        print(str(nFilled) + " nodes without " + str(label) + \
+            " were filled from the nearest valid nodes")
+    return values
+
+###   Attributes of the nodes of a mesh for a T3S file (see MSH2T3S.py).
+###     The mesh is a MSH file or a tuple (X, Y, triangles numbered from
+###     1). BOTTOM is sampled from bottom (a DEM or a comma separated list
+###     of them) and BOTTOM FRICTION from friction (a GeoTIFF or a polygon
+###     SHP). Without both, a dummy NONE attribute is given. With parts, a
+###     PARTITION attribute is added. With memory (megabytes, needs
+###     native), the arrays are mapped from files of the temporal folder
+###     and processed in chunks. With a reference mesh (a T3S file or a
+###     previous result), nodes on the same coordinates (up to quantum)
+###     take its values and only the new or moved nodes are sampled.
+###     Returns a dictionary with X, Y, the triangles, the attribute
+###     columns and their names, the nodes filled in each column, the CRS
+###     of the mesh and, with parts, the subdomain of each element
+@prof.timed
+def mshToT3S(mesh, bottom = None, friction = None, zonal = False, idw = 1, parts = None, \
+    crs = None, native = False, memory = None, workers = None, meshKey = None, \
+    reference = None, quantum = 1e-6):
+    import rast
+    with rast.nativeRasters(native):
+        return meshAttributes(mesh,bottom=bottom,friction=friction,zonal=zonal,idw=idw,\
+            parts=parts,crs=crs,native=native,memory=memory,workers=workers,meshKey=meshKey,\
+            reference=reference,quantum=quantum)
+
+###   Body of mshToT3S, with the rasters already read by tiff.py if native
+def meshAttributes(mesh, bottom, friction, zonal, idw, parts, crs, native, memory, workers, \
+    meshKey, reference, quantum):
+    import rast, msh, part
+    if memory is not None and not native:
+        print("in p.mshToT3S\n the out-of-core mode (memory) needs native\n")
+        sys.exit("Bye!")
+    if zonal and bottom is not None and "," in str(bottom):
+        print("in p.mshToT3S\n zonal takes a single DEM, not a list: " + str(bottom) + "\n")
+        sys.exit("Bye!")
+
+    run = {"native": native, "idw": int(idw), "nodeFiles": {}, "chunkRows": None, \
+        "scratch": tempFolder + "/ooc", "filled": {}}
+    if memory is not None:
+        run["chunkRows"] = max(1000, int(float(memory) * 2**20) // bytesPerRow)
+
+    #Nodes and triangles of the MSH file. ASCII files are split in chunks
+    #   parsed in parallel (into mapped arrays out of core), binary files
+    #   are memory-mapped
+    if isinstance(mesh, (str, os.PathLike)):
+        if crs is None:
+            crs = os.path.splitext(fily.plainName(str(mesh)))[0] + ".prj"
+        run["meshKey"] = rast.fileKey(mesh) if meshKey is None else meshKey
+        if memory is not None:
+            chunkBytes = max(2**20, int(float(memory) * 2**20) // 4)
+            run["X"], run["Y"], run["triangles"] = msh.readMSH(str(mesh),workers,run["scratch"],chunkBytes)
+        else:
+            run["X"], run["Y"], run["triangles"] = msh.readMSH(str(mesh),workers)
+    else:
+        run["X"], run["Y"], run["triangles"] = mesh
+        run["meshKey"] = meshKey
+        run["X"] = np.asarray(run["X"], dtype=np.float64)
+        run["Y"] = np.asarray(run["Y"], dtype=np.float64)
+        run["triangles"] = np.asarray(run["triangles"], dtype=np.int64)
+
+    #CRS of the mesh: a .prj file or a definition such as EPSG:3116
+    run["crs"] = crs if crs is None or hasattr(crs,"ExportToWkt") else rast.readCRS(crs)
+
+    #Nodes of a previous mesh whose values are copied instead of sampled
+    run["reference"] = None
+    if reference is not None:
+        run["reference"] = matchReference(run,reference,quantum)
+
+    columns, names = [], []
+    if bottom is not None:
+        columns.append(fillColumn(run,sampleBottom(run,bottom,zonal),"BOTTOM"))
+        names.append("BOTTOM")
+    if friction is not None:
+        values = reusedColumn(run,"BOTTOM FRICTION",frictionRaster(run,friction),"Friction")
+        columns.append(fillColumn(run,values,"BOTTOM FRICTION"))
+        names.append("BOTTOM FRICTION")
+    if not columns:
+        columns.append(np.broadcast_to(np.int64(0),(len(run["X"]),)))
+        names.append("NONE")
+
+    result = {"X": run["X"], "Y": run["Y"], "triangles": run["triangles"], \
+        "columns": columns, "names": names, "crs": run["crs"], "chunkRows": run["chunkRows"], \
+        "filled": run["filled"], "reused": run["reference"] is not None}
+
+    #Split the mesh in subdomains and add PARTITION as the last attribute
+    if parts is not None:
+        result["elementPart"] = part.partitionElements(run["X"],run["Y"],run["triangles"],int(parts))
+        nodePart, result["interface"] = part.partitionNodes(run["triangles"],\
+            result["elementPart"],len(run["X"]))
+        columns.append(nodePart)
+        names.append("PARTITION")
+    return result
+
+###   Writes the result of mshToT3S as a T3S file, chunkRows lines at a
+###     time (those of the out-of-core mode, or all at once), its CRS as a
+###     .prj file next to it and, if any, the filled nodes (see filledFile).
+###     An older list of filled nodes of the same T3S file is removed
+@prof.timed
+def writeT3S(pathToT3SFile, result, chunkRows = None):
+    import rast
+    X, Y, triangles = result["X"], result["Y"], result["triangles"]
+    chunkRows = result.get("chunkRows") if chunkRows is None else chunkRows
+    chunkRows = max(len(X), len(triangles), 1) if chunkRows is None else int(chunkRows)
+    nAttribute = [str(i+1) for i in range(len(result["names"]))]
+
+    fily.resetFile(pathToT3SFile,"T3S")
+    fily.appendFile(build.buildT3S_Header(len(X),len(triangles),nAttribute,result["names"]),\
+        pathToT3SFile,True)
+    nodeColumns = [X,Y] + list(result["columns"])
+    for start in range(0,len(X),chunkRows):
+        fily.appendFile(build.buildT3S_Rows(nodeColumns,start,start+chunkRows),pathToT3SFile)
+    elementColumns = [triangles[:,0],triangles[:,1],triangles[:,2]]
+    for start in range(0,len(triangles),chunkRows):
+        fily.appendFile(build.buildT3S_Rows(elementColumns,start,start+chunkRows),pathToT3SFile)
+    rast.writeCRS(result["crs"],fily.plainName(pathToT3SFile))
+    filled = result.get("filled", {})
+    if result.get("reused") or any(len(nodes) > 0 for nodes in filled.values()):
+        np.savez(filledFile(pathToT3SFile), **filled)
+    elif os.path.isfile(filledFile(pathToT3SFile)):
+        os.remove(filledFile(pathToT3SFile))
+    return pathToT3SFile
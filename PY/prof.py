@@ -0,0 +1,158 @@
+import sys, os, time, json, atexit, functools, cProfile, resource, tracemalloc
+from contextlib import contextmanager
+
+###   Instrumentation of the preprocessing stages. It is switched off by
+###     default and costs a single test per stage when off. It is switched
+###     on with the --trace <trace.json> flag of the scripts or with the
+###     environment variables:
+###
+###     PREPROCESS2D_TRACE=<trace.json>   : JSON trace file. One JSON object
+###                                         per script run is appended to it
+###     PREPROCESS2D_PROFILE=<stage name> : cProfile of that stage is dumped
+###                                         to <trace.json>.<stage name>.prof
+###     PREPROCESS2D_TRACEMALLOC=0        : Only RSS is sampled (tracemalloc
+###                                         slows down pure python stages)
+
+traceFile = None
+profileStage = None
+useTracemalloc = True
+events = []
+stack = []
+profiler = None
+startTime = time.perf_counter()
+
+###   Current resident set size of the process in bytes (Linux only,
+###     otherwise the peak RSS is returned)
+def currentRSS():
+    try:
+        with open("/proc/self/statm","r") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return peakRSS()
+
+###   Peak resident set size of the process in bytes
+def peakRSS():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return int(peak)
+    return int(peak) * 1024
+
+###   Switches the instrumentation on. Without a path the environment
+###     variables are used
+def enable(pathToTrace = None, stageToProfile = None):
+    global traceFile, profileStage, useTracemalloc
+    if pathToTrace is None:
+        pathToTrace = os.environ.get("PREPROCESS2D_TRACE")
+    if stageToProfile is None:
+        stageToProfile = os.environ.get("PREPROCESS2D_PROFILE")
+    if not pathToTrace or traceFile is not None:
+        return
+    traceFile = str(pathToTrace)
+    profileStage = stageToProfile
+    useTracemalloc = os.environ.get("PREPROCESS2D_TRACEMALLOC","1") != "0"
+    if useTracemalloc and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    atexit.register(writeTrace)
+
+###   Tells if the instrumentation is on
+def isEnabled():
+    return traceFile is not None
+
+###   Times a stage of the preprocessing. Wall time, CPU time, python peak
+###     memory (tracemalloc) and RSS are recorded for the stage. Stages can
+###     be nested, the peak memory of a child counts for its parent
+@contextmanager
+def stage(name):
+    global profiler
+    if traceFile is None:
+        yield
+        return
+
+    if useTracemalloc:
+        if stack:
+            stack[-1]["peak"] = max(stack[-1]["peak"], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    entry = {"peak": 0, "rss": currentRSS()}
+    stack.append(entry)
+
+    profiling = (name == profileStage)
+    if profiling:
+        if profiler is None:
+            profiler = cProfile.Profile()
+        profiler.enable()
+
+    wall0 = time.perf_counter()
+    cpu0 = time.process_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - wall0
+        cpu = time.process_time() - cpu0
+        if profiling:
+            profiler.disable()
+        stack.pop()
+
+        record = {
+            "stage": str(name),
+            "depth": len(stack),
+            "start_s": round(wall0 - startTime, 6),
+            "wall_s": round(wall, 6),
+            "cpu_s": round(cpu, 6),
+            "rss_start_bytes": entry["rss"],
+            "rss_end_bytes": currentRSS(),
+            "max_rss_bytes": peakRSS()
+            }
+        if useTracemalloc:
+            peak = max(entry["peak"], tracemalloc.get_traced_memory()[1])
+            record["py_peak_bytes"] = peak
+            if stack:
+                stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+        events.append(record)
+
+###   Decorator version of stage(). The stage is named after the module
+###     and the function, e.g., "gets.getCommaFile"
+def timed(function):
+    name = function.__module__ + "." + function.__name__
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if traceFile is None:
+            return function(*args, **kwargs)
+        with stage(name):
+            return function(*args, **kwargs)
+    return wrapper
+
+###   Adds up the events of each stage (a stage may be called many times)
+def summarize():
+    summary = {}
+    for event in events:
+        item = summary.setdefault(event["stage"], \
+            {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "max_rss_bytes": 0})
+        item["calls"] += 1
+        item["wall_s"] = round(item["wall_s"] + event["wall_s"], 6)
+        item["cpu_s"] = round(item["cpu_s"] + event["cpu_s"], 6)
+        item["max_rss_bytes"] = max(item["max_rss_bytes"], event["max_rss_bytes"])
+        if "py_peak_bytes" in event:
+            item["py_peak_bytes"] = max(item.get("py_peak_bytes",0), event["py_peak_bytes"])
+    return summary
+
+###   Appends the trace of this run to the trace file as a line of JSON
+def writeTrace():
+    if traceFile is None:
+        return
+    trace = {
+        "script": os.path.basename(sys.argv[0]),
+        "argv": sys.argv[1:],
+        "pid": os.getpid(),
+        "total_s": round(time.perf_counter() - startTime, 6),
+        "max_rss_bytes": peakRSS(),
+        "summary": summarize(),
+        "events": events
+        }
+    with open(traceFile,"a") as outFile:
+        outFile.write(json.dumps(trace) + "\n")
+
+    if profiler is not None:
+        profiler.dump_stats(traceFile + "." + str(profileStage) + ".prof")
+
+#The environment variables switch the instrumentation on at import time
+enable()
@@ -0,0 +1,464 @@
+import sys, os
+from contextlib import contextmanager
+import numpy as np
+from scipy.spatial import cKDTree
+import prof, tiff
+
+###   GDAL is optional. Without it (or with useGDAL = False) GeoTIFF files
+###     are read with tiff.py
+try:
+    from osgeo import gdal, osr
+except ImportError:
+    gdal = osr = None
+useGDAL = gdal is not None
+
+###   Reads the rasters with tiff.py instead of GDAL (native) within a
+###     with block. The reader used before is set back after it, so one
+###     native call of a long running process does not change the others
+@contextmanager
+def nativeRasters(native = True):
+    global useGDAL
+    previous = useGDAL
+    if native:
+        useGDAL = False
+    try:
+        yield
+    finally:
+        useGDAL = previous
+
+###   Node coordinates already transformed, by (mesh, number of nodes,
+###     source CRS, target CRS). A long running process (daemon.py) keeps
+###     them between jobs. The mesh key of a file holds its modification
+###     time and size (see fileKey), so a mesh written again is not taken
+###     for the old one
+transformCache = {}
+
+###   Entries kept by each cache, the least recently used go first
+cacheEntries = 8
+
+###   Minimum number of raster pixels across the footprint of a node
+###     before a coarser overview of the raster is used instead
+minPixelsAcross = 4
+
+###   GeoTIFF files opened with tiff.py, kept open with the strips or
+###     tiles they already decoded. Keyed by fileKey, so a raster written
+###     again is opened again, and bounded as the other caches
+tiffDatasets = {}
+
+###   Key of a file for the caches: its path, modification time and size
+def fileKey(pathToFile):
+    try:
+        state = os.stat(str(pathToFile))
+    except OSError:
+        return (str(pathToFile),)
+    return (str(pathToFile), state.st_mtime_ns, state.st_size)
+
+###   Value of a cache (None if missing), taken as the most recently used
+def cacheGet(cache, key):
+    if key not in cache:
+        return None
+    cache[key] = cache.pop(key)
+    return cache[key]
+
+###   Adds a value to a cache, dropping the least recently used ones
+def cachePut(cache, key, value):
+    cache[key] = value
+    while len(cache) > cacheEntries:
+        cache.pop(next(iter(cache)))
+    return value
+
+###   Opens a raster file with GDAL (or tiff.py) and returns the dataset
+def openRaster(rasterFile):
+    if not useGDAL:
+        key = fileKey(rasterFile)
+        dataset = cacheGet(tiffDatasets, key)
+        if dataset is None:
+            dataset = cachePut(tiffDatasets, key, tiff.TIFFDataset(str(rasterFile)))
+        return dataset
+    dataset = gdal.Open(str(rasterFile))
+    if dataset is None:
+        print("in r.openRaster\n " + str(rasterFile) + " could not be opened\n")
+        sys.exit("Bye!")
+    return dataset
+
+###   Lists the pixel size of the full resolution raster and of each one
+###     of its overviews (level 0 is the full resolution band)
+def getLevelSizes(dataset):
+    band = dataset.GetRasterBand(1)
+    geoT = dataset.GetGeoTransform()
+    sizes = [abs(geoT[1])]
+    for level in range(band.GetOverviewCount()):
+        overview = band.GetOverview(level)
+        sizes.append(abs(geoT[1]) * dataset.RasterXSize / overview.XSize)
+    return sizes
+
+###   Reads a whole level of the raster as an array of floats. Nodata
+###     pixels are returned as NaN. The geotransform is scaled to the
+###     resolution of the level read
+def readLevel(dataset, level = 0):
+    band = dataset.GetRasterBand(1)
+    if level > 0:
+        band = band.GetOverview(level-1)
+    values = band.ReadAsArray().astype(np.float64)
+    noData = dataset.GetRasterBand(1).GetNoDataValue()
+    if noData is not None:
+        values[values == noData] = np.nan
+
+    geoT = list(dataset.GetGeoTransform())
+    geoT[1] *= dataset.RasterXSize / band.XSize
+    geoT[5] *= dataset.RasterYSize / band.YSize
+    return values, geoT
+
+###   Area of the dual (median) cell of each node: one third of the area
+###     of every triangle the node belongs to. Element indices start at 1
+###     as in the MSH and T3S files
+def dualCellArea(X,Y,P1,P2,P3):
+    p1 = np.asarray(P1, dtype=np.int64) - 1
+    p2 = np.asarray(P2, dtype=np.int64) - 1
+    p3 = np.asarray(P3, dtype=np.int64) - 1
+    area = 0.5 * np.abs( \
+        (X[p2]-X[p1])*(Y[p3]-Y[p1]) - (X[p3]-X[p1])*(Y[p2]-Y[p1]))
+    dualArea = np.zeros(len(X))
+    for p in (p1, p2, p3):
+        dualArea += np.bincount(p, weights=area/3.0, minlength=len(X))
+    return dualArea
+
+###   Builds a summed-area table with a leading row and column of zeros
+###     so the sum over any window is taken from four corners
+def summedArea(values):
+    table = np.zeros((values.shape[0]+1, values.shape[1]+1))
+    np.cumsum(values, axis=0, out=table[1:,1:])
+    np.cumsum(table[1:,1:], axis=1, out=table[1:,1:])
+    return table
+
+###   Averages the raster pixels inside a square window centred on each
+###     point. The window sides are given in map units
+def windowMean(X,Y,side,values,geoT):
+    nRows, nCols = values.shape
+    valid = ~np.isnan(values)
+    sumTable = summedArea(np.where(valid, values, 0.0))
+    cntTable = summedArea(valid.astype(np.float64))
+
+    #Window limits as pixel indices, at least one pixel wide
+    colA = (X - side/2.0 - geoT[0]) / geoT[1]
+    colB = (X + side/2.0 - geoT[0]) / geoT[1]
+    rowA = (Y - side/2.0 - geoT[3]) / geoT[5]
+    rowB = (Y + side/2.0 - geoT[3]) / geoT[5]
+    c0 = np.clip(np.floor(np.minimum(colA,colB)), 0, nCols).astype(np.int64)
+    c1 = np.clip(np.ceil(np.maximum(colA,colB)), 0, nCols).astype(np.int64)
+    r0 = np.clip(np.floor(np.minimum(rowA,rowB)), 0, nRows).astype(np.int64)
+    r1 = np.clip(np.ceil(np.maximum(rowA,rowB)), 0, nRows).astype(np.int64)
+    c1 = np.maximum(c1, np.minimum(c0+1, nCols))
+    r1 = np.maximum(r1, np.minimum(r0+1, nRows))
+
+    total = sumTable[r1,c1] - sumTable[r0,c1] - sumTable[r1,c0] + sumTable[r0,c0]
+    count = cntTable[r1,c1] - cntTable[r0,c1] - cntTable[r1,c0] + cntTable[r0,c0]
+    mean = np.full(len(X), np.nan)
+    hasData = count > 0.5
+    mean[hasData] = total[hasData] / count[hasData]
+    return mean
+
+###   Zonal average of a raster over the dual cell of each mesh node. The
+###     dual cell is approximated by a square of the same area. Nodes
+###     whose cell spans many pixels are averaged on the coarsest overview
+###     that still has minPixelsAcross pixels across the cell, so each
+###     level of the raster is read at most once.
+@prof.timed
+def zonalMean(X,Y,P1,P2,P3,rasterFile):
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64)
+    side = np.sqrt(dualCellArea(X,Y,P1,P2,P3))
+
+    dataset = openRaster(rasterFile)
+    levelSizes = getLevelSizes(dataset)
+
+    #Coarsest level that keeps enough pixels across the footprint
+    nodeLevel = np.zeros(len(X), dtype=np.int64)
+    for level in range(1,len(levelSizes)):
+        nodeLevel[side >= minPixelsAcross * levelSizes[level]] = level
+
+    zonal = np.full(len(X), np.nan)
+    for level in np.unique(nodeLevel):
+        which = nodeLevel == level
+        values, geoT = readLevel(dataset, int(level))
+        zonal[which] = windowMean(X[which],Y[which],side[which],values,geoT)
+    return zonal
+
+###   Converts a list of sampled values to floats. Empty fields (what
+###     qgis:rastersampling writes for nodata or outside the raster) and
+###     non numeric values are returned as NaN
+def toFloats(values):
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        pass
+    floats = np.full(len(values), np.nan)
+    for i in range(len(values)):
+        try:
+            floats[i] = float(values[i])
+        except (TypeError, ValueError):
+            pass
+    return floats
+
+###   Fills the NaN values of the nodes from the valid nodes around them.
+###     With k = 1 the value of the nearest valid node is copied, with 
+###     k > 1 the k nearest valid nodes are weighted by inverse distance.
+###     All the missing nodes are queried on the KD-tree at once. With
+###     chunkRows, the values (e.g. a memory-mapped array) are filled in
+###     place and the missing nodes are queried chunkRows at a time. If
+###     no node has a valid value, there is nothing to fill from
+def fillNodata(X,Y,values,k = 1,power = 2.0,chunkRows = None):
+    if chunkRows is None:
+        values = np.array(values, dtype=np.float64)
+    missing = np.isnan(values)
+    if not missing.any():
+        return values, 0
+    if missing.all():
+        print("in r.fillNodata\n no node has a valid value to fill from, check the CRS " + \
+            "and the extent of the raster\n")
+        sys.exit("Bye!")
+
+    validXY = np.column_stack((X[~missing],Y[~missing]))
+    validZ  = values[~missing]
+    k = min(int(k), len(validZ))
+    tree = cKDTree(validXY)
+    missingAt = np.flatnonzero(missing)
+    step = len(missingAt) if chunkRows is None else max(int(chunkRows), 1)
+    for start in range(0, len(missingAt), step):
+        which = missingAt[start:start+step]
+        dist, near = tree.query(np.column_stack((X[which],Y[which])), k=k)
+        if k == 1:
+            values[which] = validZ[near]
+        else:
+            weights = 1.0 / np.maximum(dist, 1e-12)**power
+            values[which] = (weights * validZ[near]).sum(axis=1) / weights.sum(axis=1)
+    return values, len(missingAt)
+
+###   Takes the sampled column of the mesh nodes, fills the nodata nodes
+###     and returns it back as a list of strings for the T3S
+@prof.timed
+def fillSampled(X,Y,sampled,k = 1,label = "values"):
+    filled, nFilled = fillNodata(X,Y,toFloats(sampled),k)
+    if nFilled > 0:
+        print(str(nFilled) + " nodes without " + str(label) + \
+            " were filled from the nearest valid nodes")
+    return [str(z) for z in filled]
+
+###   Element sizes of the pixels of a DEM tile. With dz, the linear
+###     interpolation error of a triangle (h^2/8 times the largest
+###     curvature) is kept under dz. With drop, the elevation change
+###     across an element (h times the slope) is kept under drop. Sizes
+###     are clamped to [rMin, rMax] and nodata pixels take rMax
+def pixelSizes(z, dx, dy, rMin, rMax, dz = None, drop = None):
+    sizes = np.full(z.shape, float(rMax))
+    if min(z.shape) < 2:
+        return sizes
+    zy, zx = np.gradient(z, dy, dx)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if drop is not None:
+            sizes = np.fmin(sizes, float(drop) / np.hypot(zx, zy))
+        if dz is not None:
+            zyy, zyx = np.gradient(zy, dy, dx)
+            zxx = np.gradient(zx, dx, axis=1)
+            #Largest principal curvature (absolute eigenvalue of the Hessian)
+            curvature = np.abs(zxx + zyy)/2.0 + np.hypot((zxx - zyy)/2.0, zyx)
+            sizes = np.fmin(sizes, np.sqrt(8.0 * float(dz) / curvature))
+    return np.clip(sizes, float(rMin), float(rMax))
+
+###   Element sizes from the slope and curvature of a DEM. The raster is
+###     read in strips of rows (with two rows of overlap for the
+###     first and second derivatives) and the sizes are reduced by their minimum over
+###     blocks of pixels so at most maxCells are returned. Returns the
+###     grid of sizes and its geotransform
+@prof.timed
+def demSizes(rasterFile, rMin, rMax, dz = None, drop = None, maxCells = 1000000, tileRows = 512):
+    dataset = openRaster(rasterFile)
+    band = dataset.GetRasterBand(1)
+    noData = band.GetNoDataValue()
+    nCols, nRows = dataset.RasterXSize, dataset.RasterYSize
+    geoT = dataset.GetGeoTransform()
+    dx, dy = abs(geoT[1]), abs(geoT[5])
+
+    #Pixels are grouped in blocks of k x k, strips hold whole blocks
+    k = max(1, int(np.ceil(np.sqrt(nCols*nRows/float(maxCells)))))
+    tileRows = max(k, (tileRows//k)*k)
+    outCols = -(-nCols//k)
+    sizes = np.full((-(-nRows//k), outCols), float(rMax))
+
+    for top in range(0, nRows, tileRows):
+        bottom = min(top + tileRows, nRows)
+        first = max(top - 2, 0)
+        last = min(bottom + 2, nRows)
+        z = band.ReadAsArray(0, first, nCols, last - first).astype(np.float64)
+        if noData is not None:
+            z[z == noData] = np.nan
+        tile = pixelSizes(z, dx, dy, rMin, rMax, dz, drop)[top-first:bottom-first]
+
+        #Minimum over each block, padding the last blocks with rMax
+        padded = np.full((-(-len(tile)//k)*k, outCols*k), float(rMax))
+        padded[:tile.shape[0], :tile.shape[1]] = tile
+        blocks = padded.reshape(padded.shape[0]//k, k, outCols, k).min(axis=(1,3))
+        sizes[top//k : top//k + len(blocks)] = blocks
+
+    outGeoT = (geoT[0], geoT[1]*k, 0.0, geoT[3], 0.0, geoT[5]*k)
+    return sizes, outGeoT
+
+###   Looks up the value of a grid at each point. Points out of the grid
+###     get NaN
+def gridValues(X, Y, grid, geoT):
+    col = np.floor((np.asarray(X, dtype=np.float64) - geoT[0]) / geoT[1]).astype(np.int64)
+    row = np.floor((np.asarray(Y, dtype=np.float64) - geoT[3]) / geoT[5]).astype(np.int64)
+    inside = (col >= 0) & (col < grid.shape[1]) & (row >= 0) & (row < grid.shape[0])
+    values = np.full(len(col), np.nan)
+    values[inside] = grid[row[inside], col[inside]]
+    return values
+
+###   Reads a coordinate reference system from a raster (GeoTIFF), from
+###     a .prj file, from the .prj file next to any other file (SHP, CSV,
+###     GEO, MSH...) or from a definition such as "EPSG:3116". Returns an
+###     osr.SpatialReference or None if no CRS is found
+def readCRS(source):
+    if source is None:
+        return None
+    source = str(source)
+    if source.lower().endswith(".prj") and not os.path.isfile(source):
+        return None
+    if osr is None:
+        print("in r.readCRS\n osgeo.osr is not installed, the CRS of " + source + " is not used\n")
+        return None
+    prjFile = source if source.lower().endswith(".prj") else os.path.splitext(source)[0] + ".prj"
+    if os.path.isfile(prjFile):
+        with open(prjFile) as inFile:
+            definition = inFile.read()
+    elif os.path.isfile(source):
+        dataset = gdal.Open(source) if useGDAL else tiff.TIFFDataset(source)
+        definition = None if dataset is None else dataset.GetProjection()
+    else:
+        definition = source
+    if not definition:
+        return None
+
+    spatialRef = osr.SpatialReference()
+    if spatialRef.SetFromUserInput(definition) != 0:
+        print("in r.readCRS\n the CRS of " + str(source) + " could not be read\n")
+        return None
+    #Keep x (easting, longitude) before y whatever the CRS says
+    spatialRef.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    return spatialRef
+
+###   Writes a CRS as a .prj file next to a file
+def writeCRS(spatialRef, pathToFile):
+    if spatialRef is not None:
+        with open(os.path.splitext(str(pathToFile))[0] + ".prj","w") as outFile:
+            outFile.write(spatialRef.ExportToWkt())
+
+###   Transforms node coordinates to the CRS of a raster in one batch. If
+###     either CRS is unknown or both are the same, the nodes are returned
+###     as they are. Results are cached by (meshKey, nodes, CRS pair)
+@prof.timed
+def toRasterCRS(X, Y, meshCRS, rasterFile, meshKey = None):
+    if meshCRS is None:
+        return X, Y
+    rasterCRS = readCRS(rasterFile)
+    if rasterCRS is None or meshCRS.IsSame(rasterCRS):
+        return X, Y
+
+    key = (meshKey, len(X), meshCRS.ExportToWkt(), rasterCRS.ExportToWkt())
+    if meshKey is not None and key in transformCache:
+        return cacheGet(transformCache, key)
+    transform = osr.CoordinateTransformation(meshCRS, rasterCRS)
+    points = np.column_stack((np.asarray(X, dtype=np.float64), np.asarray(Y, dtype=np.float64)))
+    moved = np.array(transform.TransformPoints(points), dtype=np.float64)
+    print("Nodes transformed to the CRS of " + str(rasterFile))
+    X, Y = moved[:,0].copy(), moved[:,1].copy()
+    if meshKey is not None:
+        cachePut(transformCache, key, (X, Y))
+    return X, Y
+
+###   Value of the raster pixel under each point, NaN for nodata or points
+###     out of the raster. GeoTIFF files read with tiff.py only decode the
+###     strips or tiles holding points. With GDAL, the raster is read in
+###     strips of rows, each one as wide as the points in it
+@prof.timed
+def samplePoints(X, Y, rasterFile, stripRows = 512):
+    dataset = openRaster(rasterFile)
+    if isinstance(dataset, tiff.TIFFDataset):
+        return tiff.samplePoints(dataset.images[0], X, Y)
+
+    band = dataset.GetRasterBand(1)
+    noData = band.GetNoDataValue()
+    geoT = dataset.GetGeoTransform()
+    col = np.floor((np.asarray(X, dtype=np.float64) - geoT[0]) / geoT[1]).astype(np.int64)
+    row = np.floor((np.asarray(Y, dtype=np.float64) - geoT[3]) / geoT[5]).astype(np.int64)
+    values = np.full(len(col), np.nan)
+    inside = (col >= 0) & (col < dataset.RasterXSize) & (row >= 0) & (row < dataset.RasterYSize)
+    which = np.flatnonzero(inside)
+
+    strip = row[which] // stripRows
+    order = np.argsort(strip, kind="stable")
+    which, strip = which[order], strip[order]
+    strips, starts = np.unique(strip, return_index=True)
+    ends = np.append(starts[1:], len(strip))
+    for s, start, end in zip(strips, starts, ends):
+        points = which[start:end]
+        r0 = int(s) * stripRows
+        c0, c1 = int(col[points].min()), int(col[points].max())
+        r1 = min(r0 + stripRows, dataset.RasterYSize)
+        window = band.ReadAsArray(c0, r0, c1 - c0 + 1, r1 - r0).astype(np.float64)
+        values[points] = window[row[points] - r0, col[points] - c0]
+    if noData is not None:
+        values[values == noData] = np.nan
+    return values
+
+###   Extent of a raster (xMin, xMax, yMin, yMax) in its own CRS
+def rasterExtent(dataset):
+    geoT = dataset.GetGeoTransform()
+    xs = (geoT[0], geoT[0] + dataset.RasterXSize*geoT[1])
+    ys = (geoT[3], geoT[3] + dataset.RasterYSize*geoT[5])
+    return min(xs), max(xs), min(ys), max(ys)
+
+###   Samples a list of rasters as one mosaic, the first one having the
+###     highest priority. The nodes are sorted by X once per CRS, so the
+###     nodes inside the extent of a raster are found by binary search.
+###     Each raster is sampled in one pass, only on the nodes still
+###     without a value, so nodes on nodata pixels fall back to the next
+###     raster of the list. Returns NaN where no raster has data
+@prof.timed
+def sampleMosaic(X, Y, rasterFiles, meshCRS = None, meshKey = None, report = True):
+    values = np.full(len(X), np.nan)
+    sortedNodes = {}
+    for rasterFile in rasterFiles:
+        missing = np.isnan(values)
+        if not missing.any():
+            break
+        xRaster, yRaster = toRasterCRS(X, Y, meshCRS, rasterFile, meshKey)
+        if id(xRaster) not in sortedNodes:
+            order = np.argsort(xRaster, kind="stable")
+            sortedNodes[id(xRaster)] = (xRaster, order, xRaster[order])
+        xRaster, order, xSorted = sortedNodes[id(xRaster)]
+
+        xMin, xMax, yMin, yMax = rasterExtent(openRaster(rasterFile))
+        nodes = order[np.searchsorted(xSorted, xMin):np.searchsorted(xSorted, xMax, side="right")]
+        nodes = nodes[missing[nodes] & (yRaster[nodes] >= yMin) & (yRaster[nodes] <= yMax)]
+        if len(nodes) > 0:
+            values[nodes] = samplePoints(xRaster[nodes], yRaster[nodes], rasterFile)
+        if report:
+            print(str(rasterFile) + ": " + str(int(np.count_nonzero(~np.isnan(values[nodes])))) + \
+                " nodes sampled")
+    return values
+
+###   Samples a raster (or a mosaic of rasters) on the nodes chunkRows at a
+###     time, into an array given by the caller (memory-mapped in the
+###     out-of-core mode of MSH2T3S.py). Nodes are transformed to the CRS
+###     of the rasters chunk by chunk
+@prof.timed
+def sampleChunked(X, Y, rasterFiles, out, chunkRows, meshCRS = None):
+    for start in range(0, len(X), int(chunkRows)):
+        end = min(start + int(chunkRows), len(X))
+        x, y = np.asarray(X[start:end]), np.asarray(Y[start:end])
+        if len(rasterFiles) > 1:
+            out[start:end] = sampleMosaic(x, y, rasterFiles, meshCRS, None, False)
+        else:
+            x, y = toRasterCRS(x, y, meshCRS, rasterFiles[0])
+            out[start:end] = samplePoints(x, y, rasterFiles[0])
+    return out
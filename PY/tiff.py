@@ -0,0 +1,354 @@
+import sys, os, mmap, struct, zlib, threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import prof
+
+###   Largest number of decoded strips or tiles kept in memory per image
+maxCachedChunks = 256
+
+###   Threads used to decode DEFLATE strips or tiles (zlib releases the
+###     GIL, so they decode in parallel). LZW is decoded in python, which
+###     holds the GIL, so its chunks are decoded one after the other
+decodeWorkers = min(8, os.cpu_count() or 1)
+
+###   Size in bytes and numpy type of the TIFF field types
+fieldTypes = {1: "u1", 2: "S1", 3: "u2", 4: "u4", 5: "u4", 6: "i1", 7: "u1", \
+    8: "i2", 9: "i4", 10: "i4", 11: "f4", 12: "f8", 16: "u8", 17: "i8", 18: "u8"}
+fieldCounts = {5: 2, 10: 2}             #rationals are pairs of integers
+
+###   Numpy type of the pixels from SampleFormat (1 uint, 2 int, 3 float)
+###     and BitsPerSample
+sampleTypes = {(1, 8): "u1", (1, 16): "u2", (1, 32): "u4", (1, 64): "u8", \
+    (2, 8): "i1", (2, 16): "i2", (2, 32): "i4", (2, 64): "i8", \
+    (3, 32): "f4", (3, 64): "f8"}
+
+###   Reads the value of an IFD entry as a numpy array (or bytes for ASCII)
+def readEntry(mapped, order, kind, count, valueAt, inlineSize):
+    dtype = np.dtype(fieldTypes.get(kind, "u1")).newbyteorder(order)
+    n = count * fieldCounts.get(kind, 1)
+    offset = valueAt
+    if n * dtype.itemsize > inlineSize:
+        offset = struct.unpack(order + ("Q" if inlineSize == 8 else "I"), \
+            mapped[valueAt:valueAt+inlineSize])[0]
+    if kind == 2:
+        return bytes(mapped[offset:offset+count]).rstrip(b"\0")
+    values = np.frombuffer(mapped, dtype=dtype, count=n, offset=offset)
+    if kind in fieldCounts:
+        values = values[0::2] / values[1::2].astype(np.float64)
+    return values
+
+###   Reads every IFD (image) of a TIFF or BigTIFF file as a dictionary of
+###     tags. The first one is the full resolution image, the reduced
+###     resolution ones are its overviews
+def readIFDs(mapped):
+    order = {b"II": "<", b"MM": ">"}.get(bytes(mapped[:2]))
+    if order is None:
+        return None, []
+    version = struct.unpack(order + "H", mapped[2:4])[0]
+    if version == 42:
+        offset = struct.unpack(order + "I", mapped[4:8])[0]
+        countFormat, entryFormat, entrySize, inlineSize = "H", "HHI", 12, 4
+    elif version == 43:
+        offset = struct.unpack(order + "Q", mapped[8:16])[0]
+        countFormat, entryFormat, entrySize, inlineSize = "Q", "HHQ", 20, 8
+    else:
+        return None, []
+
+    ifds = []
+    while offset and offset < len(mapped) and len(ifds) < 64:
+        countSize = struct.calcsize(countFormat)
+        nEntries = struct.unpack(order + countFormat, mapped[offset:offset+countSize])[0]
+        tags = {}
+        for e in range(nEntries):
+            at = offset + countSize + e*entrySize
+            tag, kind, count = struct.unpack(order + entryFormat, mapped[at:at+entrySize-inlineSize])
+            tags[tag] = readEntry(mapped, order, kind, count, at + entrySize - inlineSize, inlineSize)
+        ifds.append(tags)
+        at = offset + countSize + nEntries*entrySize
+        offset = struct.unpack(order + ("Q" if version == 43 else "I"), mapped[at:at+inlineSize])[0]
+    return order, ifds
+
+###   Decodes TIFF LZW (MSB first bit order, code width growing one code
+###     early, as libtiff writes it)
+def lzwDecode(data):
+    out = bytearray()
+    table = [bytes((i,)) for i in range(256)] + [b"", b""]
+    bits, buffer, bufferBits, previous = 9, 0, 0, None
+    for byte in data:
+        buffer = (buffer << 8) | byte
+        bufferBits += 8
+        while bufferBits >= bits:
+            bufferBits -= bits
+            code = buffer >> bufferBits
+            buffer &= (1 << bufferBits) - 1
+            if code == 256:
+                del table[258:]
+                bits, previous = 9, None
+                continue
+            if code == 257:
+                return bytes(out)
+            if previous is None:
+                entry = table[code]
+            elif code < len(table):
+                entry = table[code]
+                table.append(previous + entry[:1])
+            else:
+                entry = previous + previous[:1]
+                table.append(entry)
+            out += entry
+            previous = entry
+            if len(table) + 1 >= (1 << bits) and bits < 12:
+                bits += 1
+    return bytes(out)
+
+###   Opens a GeoTIFF: maps the file in memory and reads the layout of the
+###     full resolution image and its overviews, the georeferencing and
+###     the nodata value. Returns a dictionary per image, the first one
+###     being the full resolution one
+def openTIFF(pathToFile):
+    try:
+        with open(pathToFile,"rb") as tifFile:
+            mapped = mmap.mmap(tifFile.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        print("in t.openTIFF\n " + str(pathToFile) + " could not be opened\n")
+        sys.exit("Bye!")
+    order, ifds = readIFDs(mapped)
+    if not ifds:
+        print("in t.openTIFF\n " + str(pathToFile) + " is not a TIFF file\n")
+        sys.exit("Bye!")
+
+    first = ifds[0]
+    geoT, crs, noData = geoReference(first)
+    images = []
+    for tags in ifds:
+        #Only the overviews of the first image (NewSubfileType bit 0), not
+        #   its transparency masks (bit 2)
+        subfile = int(tags.get(254, [0])[0])
+        if tags is not first and not ((subfile & 1) and not (subfile & 4)):
+            continue
+        image = imageLayout(mapped, order, tags, pathToFile)
+        image["noData"] = noData
+        image["crs"] = crs
+        image["geoT"] = list(geoT)
+        image["geoT"][1] *= float(images[0]["width"]) / image["width"] if images else 1.0
+        image["geoT"][5] *= float(images[0]["height"]) / image["height"] if images else 1.0
+        images.append(image)
+    return images
+
+###   Strip or tile layout of an image and how to decode its chunks
+def imageLayout(mapped, order, tags, pathToFile):
+    image = {"mapped": mapped, "path": str(pathToFile), "order": order, \
+        "cache": {}, "lock": threading.Lock()}
+    image["width"] = int(tags[256][0])
+    image["height"] = int(tags[257][0])
+    image["samples"] = int(tags.get(277, [1])[0])
+    image["planar"] = int(tags.get(284, [1])[0])
+    bits = int(tags.get(258, [1])[0])
+    kind = int(tags.get(339, [1])[0])
+    image["compression"] = int(tags.get(259, [1])[0])
+    image["predictor"] = int(tags.get(317, [1])[0])
+    if (kind, bits) not in sampleTypes or image["compression"] not in (1, 5, 8, 32946):
+        print("in t.openTIFF\n " + str(pathToFile) + " uses a sample type or a compression" + \
+            " that is not supported (SampleFormat " + str(kind) + ", BitsPerSample " + \
+            str(bits) + ", Compression " + str(image["compression"]) + ")\n")
+        sys.exit("Bye!")
+    image["dtype"] = np.dtype(sampleTypes[(kind, bits)]).newbyteorder(order)
+
+    if 322 in tags:
+        image["chunkWidth"] = int(tags[322][0])
+        image["chunkHeight"] = int(tags[323][0])
+        image["offsets"] = np.asarray(tags[324], dtype=np.int64)
+        image["counts"] = np.asarray(tags[325], dtype=np.int64)
+        image["tiled"] = True
+    else:
+        image["chunkWidth"] = image["width"]
+        image["chunkHeight"] = min(int(tags.get(278, [image["height"]])[0]), image["height"])
+        image["offsets"] = np.asarray(tags[273], dtype=np.int64)
+        image["counts"] = np.asarray(tags[279], dtype=np.int64)
+        image["tiled"] = False
+    image["chunksAcross"] = -(-image["width"] // image["chunkWidth"])
+    image["chunksDown"] = -(-image["height"] // image["chunkHeight"])
+    return image
+
+###   Geotransform (as GDAL gives it), CRS ("EPSG:<code>" or None) and
+###     nodata value of an image from its GeoTIFF tags
+def geoReference(tags):
+    keys = {}
+    if 34735 in tags:
+        directory = np.asarray(tags[34735], dtype=np.int64)
+        for k in range(int(directory[3])):
+            keyID, location, count, value = directory[4+4*k:8+4*k]
+            if location == 0:
+                keys[int(keyID)] = int(value)
+
+    if 34264 in tags:
+        m = np.asarray(tags[34264], dtype=np.float64)
+        geoT = [m[3], m[0], m[1], m[7], m[4], m[5]]
+    elif 33550 in tags and 33922 in tags:
+        scale = np.asarray(tags[33550], dtype=np.float64)
+        tie = np.asarray(tags[33922], dtype=np.float64)
+        geoT = [tie[3] - tie[0]*scale[0], scale[0], 0.0, tie[4] + tie[1]*scale[1], 0.0, -scale[1]]
+    else:
+        geoT = [0.0, 1.0, 0.0, 0.0, 0.0, 1.0]
+
+    #Pixel as point: the tie point is the centre of the first pixel
+    if keys.get(1025) == 2:
+        geoT[0] -= geoT[1] / 2.0
+        geoT[3] -= geoT[5] / 2.0
+
+    crs = None
+    for key in (3072, 2048):
+        if 0 < keys.get(key, 0) < 32767:
+            crs = "EPSG:" + str(keys[key])
+            break
+
+    noData = None
+    if 42113 in tags:
+        try:
+            noData = float(tags[42113].decode("ascii").strip())
+        except ValueError:
+            pass
+    return geoT, crs, noData
+
+###   Decodes one strip or tile as a 2D array of the first sample. Raw
+###     chunks are views on the mapped file, compressed ones are kept in a
+###     small cache
+def readChunk(image, index):
+    with image["lock"]:
+        if index in image["cache"]:
+            return image["cache"][index]
+
+    down = index // image["chunksAcross"]
+    rows = image["chunkHeight"]
+    if not image["tiled"]:
+        rows = min(rows, image["height"] - down*rows)
+    cols = image["chunkWidth"]
+    samples = image["samples"] if image["planar"] == 1 else 1
+    nValues = rows * cols * samples
+    offset, count = int(image["offsets"][index]), int(image["counts"][index])
+
+    if count == 0:
+        chunk = np.full((rows, cols), np.nan if image["noData"] is None else image["noData"])
+        return chunk
+    if image["compression"] == 1 and image["predictor"] == 1:
+        values = np.frombuffer(image["mapped"], dtype=image["dtype"], count=nValues, offset=offset)
+        return values.reshape(rows, cols, samples)[:,:,0]
+
+    raw = image["mapped"][offset:offset+count]
+    if image["compression"] in (8, 32946):
+        raw = zlib.decompress(raw)
+    elif image["compression"] == 5:
+        raw = lzwDecode(raw)
+    chunk = undoPredictor(image, raw, rows, cols, samples)[:,:,0]
+
+    with image["lock"]:
+        if len(image["cache"]) >= maxCachedChunks:
+            image["cache"].pop(next(iter(image["cache"])))
+        image["cache"][index] = chunk
+    return chunk
+
+###   Undoes the horizontal (2) or floating point (3) predictors
+def undoPredictor(image, raw, rows, cols, samples):
+    dtype = image["dtype"]
+    if image["predictor"] == 3:
+        size = dtype.itemsize
+        data = np.frombuffer(raw, dtype=np.uint8, count=rows*cols*samples*size)
+        data = np.cumsum(data.reshape(rows, cols*samples*size), axis=1, dtype=np.uint8)
+        data = data.reshape(rows, size, cols*samples).transpose(0, 2, 1)
+        return np.ascontiguousarray(data).view(dtype.newbyteorder(">")).reshape(rows, cols, samples)
+    values = np.frombuffer(raw, dtype=dtype, count=rows*cols*samples).reshape(rows, cols, samples)
+    if image["predictor"] == 2:
+        values = np.cumsum(values, axis=1, dtype=dtype)
+    return values
+
+###   Decodes a list of chunks, the DEFLATE ones on the thread pool
+def readChunks(image, indices):
+    indices = [int(i) for i in indices]
+    if image["compression"] not in (8, 32946) or len(indices) < 2:
+        return [readChunk(image, i) for i in indices]
+    with ThreadPoolExecutor(max_workers=decodeWorkers) as pool:
+        return list(pool.map(lambda i: readChunk(image, i), indices))
+
+###   Reads a window of pixels of an image as floats, nodata as NaN. Only
+###     the strips or tiles that cross the window are decoded
+def readWindow(image, col0, row0, nCols, nRows):
+    window = np.empty((nRows, nCols), dtype=np.float64)
+    cw, ch = image["chunkWidth"], image["chunkHeight"]
+    across = range(col0 // cw, (col0 + nCols - 1) // cw + 1)
+    down = range(row0 // ch, (row0 + nRows - 1) // ch + 1)
+    indices = [d*image["chunksAcross"] + a for d in down for a in across]
+    for index, chunk in zip(indices, readChunks(image, indices)):
+        d, a = divmod(index, image["chunksAcross"])
+        r0, c0 = max(row0, d*ch), max(col0, a*cw)
+        r1 = min(row0 + nRows, d*ch + chunk.shape[0])
+        c1 = min(col0 + nCols, a*cw + chunk.shape[1])
+        window[r0-row0:r1-row0, c0-col0:c1-col0] = chunk[r0-d*ch:r1-d*ch, c0-a*cw:c1-a*cw]
+    if image["noData"] is not None:
+        window[window == image["noData"]] = np.nan
+    return window
+
+###   Value of the pixel under each point (as qgis:rastersampling gives it),
+###     NaN for nodata or points out of the raster. Points are grouped by
+###     strip or tile and only the chunks that hold points are decoded
+@prof.timed
+def samplePoints(image, X, Y):
+    geoT = image["geoT"]
+    col = np.floor((np.asarray(X, dtype=np.float64) - geoT[0]) / geoT[1]).astype(np.int64)
+    row = np.floor((np.asarray(Y, dtype=np.float64) - geoT[3]) / geoT[5]).astype(np.int64)
+    values = np.full(len(col), np.nan)
+    which = np.flatnonzero((col >= 0) & (col < image["width"]) & (row >= 0) & (row < image["height"]))
+
+    chunk = (row[which] // image["chunkHeight"]) * image["chunksAcross"] + col[which] // image["chunkWidth"]
+    order = np.argsort(chunk, kind="stable")
+    which, chunk = which[order], chunk[order]
+    indices, starts = np.unique(chunk, return_index=True)
+    ends = np.append(starts[1:], len(chunk))
+    for index, start, end, data in zip(indices, starts, ends, readChunks(image, indices)):
+        d, a = divmod(int(index), image["chunksAcross"])
+        points = which[start:end]
+        values[points] = data[row[points] - d*image["chunkHeight"], col[points] - a*image["chunkWidth"]]
+    if image["noData"] is not None:
+        values[values == image["noData"]] = np.nan
+    return values
+
+###   A GeoTIFF seen through the part of the gdal.Dataset interface used by
+###     rast.py (geotransform, projection, band, overviews and windowed
+###     reads), so rast.py works when GDAL is not installed
+class TIFFDataset:
+    def __init__(self, pathToFile):
+        self.images = openTIFF(pathToFile)
+        self.RasterXSize = self.images[0]["width"]
+        self.RasterYSize = self.images[0]["height"]
+
+    def GetGeoTransform(self):
+        return tuple(self.images[0]["geoT"])
+
+    def GetProjection(self):
+        return self.images[0]["crs"] or ""
+
+    def GetRasterBand(self, band = 1):
+        return TIFFBand(self.images, 0)
+
+class TIFFBand:
+    def __init__(self, images, level):
+        self.images = images
+        self.level = level
+        self.XSize = images[level]["width"]
+        self.YSize = images[level]["height"]
+
+    def GetNoDataValue(self):
+        return self.images[0]["noData"]
+
+    def GetOverviewCount(self):
+        return len(self.images) - 1 if self.level == 0 else 0
+
+    def GetOverview(self, level):
+        return TIFFBand(self.images, level + 1)
+
+    def ReadAsArray(self, xoff = 0, yoff = 0, win_xsize = None, win_ysize = None):
+        image = self.images[self.level]
+        window = readWindow(image, int(xoff), int(yoff), \
+            int(win_xsize or image["width"] - xoff), int(win_ysize or image["height"] - yoff))
+        if image["noData"] is not None:
+            window[np.isnan(window)] = image["noData"]     #as GDAL returns it
+        return window